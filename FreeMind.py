@@ -4,61 +4,1383 @@ import argparse
 import logging.config
 import sys
 import os
+import glob
+import time
+import traceback
+import multiprocessing
+import Queue
+import threading
+import socket
+import httplib
+import xmlrpclib
+import sqlite3
+from multiprocessing.pool import ThreadPool
+import json
+import hashlib
+import zipfile
+import mmap
+from array import array
+from collections import OrderedDict
 from copy import deepcopy
+from xml.sax.saxutils import quoteattr
+from xml.parsers import expat
 from xml.etree import ElementTree as ET
-import xml.dom.minidom as minidom
 import xml.etree.cElementTree as xmlcET
 from lxml import etree as lxmlET
 
-import testlink
 from xlrd import open_workbook
-from xlwt import Formula, easyxf
+from xlwt import Formula, easyxf, Workbook as XlsWriteWorkbook
 from xlutils.copy import copy
+try:
+    # Only needed for the xlsx files
+    from openpyxl import Workbook as XlsxWriteWorkbook, load_workbook
+    from openpyxl.utils import range_boundaries
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import PatternFill
+except ImportError:
+    load_workbook = None
 
-from docx import Document
 import pprint
 
 PKG_PATH = './'
 
-TC_ID = 0
-TC_TITLE = 1
-TC_REQ_LINKS = 2
-REQ_LINK_SPEC = 0
-REQ_LINK_ID = 1
-REQ_LINK_TITLE = 2
+PREFIX_TITLE_SEP = '::'
 
-REQ_ID = 0
-REQ_TITLE = 1
-REQ_DESC = 2
-REQ_VER_TEAM = 3
-REQ_COMMENT = 4
-REQ_PHASE = 5
+# Test case spreadsheet schema. The column names are in the second row of each sheet.
+TC_SHEET_COLUMNS = ['TS_Name', 'TS_Details', 'Name', 'Summary', 'Preconditions', 'Test Execution Type', 'Importance',
+                    'HGI Regression Level', 'HGI Test Team', 'Steps', 'Expected Results', 'Step Execution Type']
+TC_SHEET_TEXT_COLUMNS = ['TS_Name', 'TS_Details', 'Name', 'Summary', 'Preconditions', 'HGI Test Team', 'Steps',
+                         'Expected Results']
+TC_EXECUTION_TYPES = {'Manual': '1', 'Automated': '2'}
+TC_IMPORTANCE = {'H': '3', 'M': '2', 'L': '1'}
+TC_REGRESSION_LEVELS = '5 - First Time Run|4 - Full Regression|3 - Regular Regression|2 - Basic Regression|1 - Basic Sanity'.split('|')
 
-PREFIX_TITLE_SEP = '::'
 
-''' The following functions (CDATA and _serialize_xml) is a workaround for using CDATA section with ElementTree
-'''
+class Requirement(object):
+    ''' A PMR/PFS requirement or a TDS item. comment and phase are None if they're not given by the template.
+        ver_teams is the verification teams (separated by new line, space, comma, | or ;) normalized to be
+        separated by |, it's computed once when the requirement is created.
+    '''
+    __slots__ = ('req_id', 'title', 'desc', 'ver_team', 'comment', 'phase', 'ver_teams')
+
+    def __init__(self, req_id, title, desc, ver_team, comment=None, phase=None):
+        self.req_id = req_id
+        self.title = title
+        self.desc = desc
+        self.ver_team = ver_team
+        self.comment = comment
+        self.phase = phase
+        self.ver_teams = self._normalize_ver_team(ver_team)
+
+    def _normalize_ver_team(self, ver_team_text):
+        for sep in ['\n', ' ', ',', '|', ';']:
+            ver_team = ver_team_text.split(sep)
+            if len(ver_team) > 1:
+                break
+        return '|'.join(ver_team)
+
+
+class TdsItem(Requirement):
+    ''' A TDS item, the title is prefixed with the number of the item (PREFIX::TITLE) '''
+    __slots__ = ('prefix',)
+
+    def __init__(self, req_id, title, desc, ver_team='SIT'):
+        Requirement.__init__(self, req_id, title, desc, ver_team)
+        self.prefix = title.split(PREFIX_TITLE_SEP)[0]
+
+
+class RequirementGroup(object):
+    ''' A requirement category with its requirements '''
+    __slots__ = ('name', 'items')
+
+    def __init__(self, name, items=None):
+        self.name = name
+        self.items = items if items is not None else []
+
+
+class TestStep(object):
+    __slots__ = ('step_number', 'actions', 'expectedresults')
+
+    def __init__(self, step_number, actions, expectedresults):
+        self.step_number = step_number
+        self.actions = actions
+        self.expectedresults = expectedresults
+
+
+class TestCase(object):
+    ''' A test case read from the test case xml file exported from TestLink.
+        suite_path is the names of the test suites of this test case (the root element is not included) and
+        suite_ids is the unique number of these test suites, thus suites with the same name can be distinguished.
+        steps is None if the test case has no <steps> element.
+    '''
+    __slots__ = ('name', 'suite_path', 'suite_ids', 'externalid', 'summary', 'preconditions', 'steps', 'custom_fields',
+                 'requirements')
+
+    def __init__(self, name, suite_path, suite_ids):
+        self.name = name
+        self.suite_path = suite_path
+        self.suite_ids = suite_ids
+        self.externalid = None
+        self.summary = None
+        self.preconditions = None
+        self.steps = None
+        self.custom_fields = OrderedDict()
+        self.requirements = []
+
+
+class TcLink(object):
+    ''' A test case node (TC_ID:TITLE) linked under a TDS node in FreeMind.
+        tc_number and tds_number are the test case ID without project prefix and the TDS ID without document prefix.
+    '''
+    __slots__ = ('tc_id', 'tc_title', 'tds_id', 'tc_number', 'tds_number')
+
+    def __init__(self, tc_id, tc_title, tds_id):
+        self.tc_id = tc_id
+        self.tc_title = tc_title
+        self.tds_id = tds_id
+        self.tc_number = tc_id.split('-')[-1]
+        self.tds_number = tds_id.split('_')[-1]
+
+
+class Execution(object):
+    ''' The execution status of a test case in a test plan. It's used as a traceability link, thus it's hashable. '''
+    __slots__ = ('tp_name', 'status')
+
+    def __init__(self, tp_name, status):
+        self.tp_name = tp_name
+        self.status = status
+
+    def __eq__(self, other):
+        return isinstance(other, Execution) and (self.tp_name, self.status) == (other.tp_name, other.status)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.tp_name, self.status))
+
+    def __repr__(self):
+        return 'Execution(%r, %r)' % (self.tp_name, self.status)
+
+
+class DocumentCache(object):
+    ''' Parsed xml documents (FreeMind maps, TestLink xml files) shared by the actions of one configuration run which
+        are performed in the same process, the actions performed in pool workers have their own caches.
+        Documents are keyed by absolute path and parser flavour, and an entry is only valid while the file still has
+        the same mtime and size. The cached documents are copied on write: a read-only parse shares the cached tree,
+        and only a parse for updating a cached document makes a copy of it. Writes go through the cache, the written
+        tree is kept as it is (it must not be updated afterwards), so a file written by one action is not parsed
+        again by the next one.
+    '''
+    PARSERS = {'et': (ET.parse, ET.ElementTree),
+               'cet': (xmlcET.parse, xmlcET.ElementTree),
+               'lxml': (lxmlET.parse, lxmlET.ElementTree)}
+
+    def __init__(self):
+        self.documents = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get_stamp(self, path):
+        stat = os.stat(path)
+        return (stat.st_mtime, stat.st_size)
+
+    def parse(self, path, flavour='et', readonly=False):
+        ''' The tree must not be updated if readonly is True. Otherwise it's a copy of the cached document, or it's
+            parsed and not cached if the document is not cached yet.
+        '''
+        parse, element_tree = self.PARSERS[flavour]
+        key = (os.path.abspath(path), flavour)
+        stamp = self._get_stamp(path)
+        if self.documents.has_key(key) and self.documents[key][0] == stamp:
+            self.hits += 1
+            root = self.documents[key][1]
+            return element_tree(root if readonly else deepcopy(root))
+        self.misses += 1
+        tree = parse(path)
+        if readonly:
+            self.documents[key] = (stamp, tree.getroot())
+        return tree
+
+    def write(self, tree, path, flavour='et'):
+        tree.write(path)
+        self.invalidate(path)
+        self.documents[(os.path.abspath(path), flavour)] = (self._get_stamp(path), tree.getroot())
+
+    def invalidate(self, path):
+        ''' Drop all cached documents of path, e.g. after the file is written without the cache '''
+        path = os.path.abspath(path)
+        for key in self.documents.keys():
+            if key[0] == path:
+                del self.documents[key]
+
+
+class ReqSpecWriter(object):
+    ''' Write a requirement specification xml file for importing to TestLink.
+        Each requirement/relation is written into the file (with CDATA sections) as soon as it's produced, thus the
+        whole document is never kept in memory. It's used as a context manager:
+            with ReqSpecWriter(filename, doc_title) as writer:
+                writer.write_requirement(...)
+    '''
+
+    def __init__(self, filename, doc_title):
+        self.filename = filename
+        self.doc_title = doc_title
+        self.contexts = []
+        self.xf = None
+
+    def _cdata(self, text):
+        if not isinstance(text, basestring):
+            text = unicode(text)
+        return lxmlET.CDATA(text)
+
+    def _enter(self, context):
+        self.contexts.append(context)
+        return context.__enter__()
+
+    def __enter__(self):
+        self.xf = self._enter(lxmlET.xmlfile(self.filename, encoding='utf-8'))
+        self.xf.write_declaration()
+        self._enter(self.xf.element('requirement-specification'))
+        self._enter(self.xf.element('req_spec', {'title': self.doc_title, 'doc_id': self.doc_title}))
+        for tag, text in [('type', 2), ('node_order', 1), ('total_req', 0), ('scope', '')]:
+            elem = lxmlET.Element(tag)
+            elem.text = self._cdata(text)
+            self.xf.write(elem)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        while self.contexts:
+            self.contexts.pop().__exit__(exc_type, exc_value, exc_traceback)
+        return False
+
+    def write_requirement(self, doc_id, title, node_order, description, status, custom_fields):
+        ''' custom_fields is a list of (name, value) pairs '''
+        requirement = lxmlET.Element('requirement')
+        for tag, text in [('docid', doc_id), ('title', title), ('node_order', node_order),
+                          ('description', description), ('status', status), ('type', 2), ('expected_coverage', 1)]:
+            lxmlET.SubElement(requirement, tag).text = self._cdata(text)
+        custom_fields_node = lxmlET.SubElement(requirement, 'custom_fields')
+        for name, value in custom_fields:
+            custom_field = lxmlET.SubElement(custom_fields_node, 'custom_field')
+            lxmlET.SubElement(custom_field, 'name').text = self._cdata(name)
+            lxmlET.SubElement(custom_field, 'value').text = self._cdata(value)
+        self.xf.write(requirement)
+
+    def write_relation(self, source, destination, relation_type='1'):
+        relation = lxmlET.Element('relation')
+        lxmlET.SubElement(relation, 'source').text = source
+        lxmlET.SubElement(relation, 'destination').text = destination
+        lxmlET.SubElement(relation, 'type').text = relation_type
+        self.xf.write(relation)
+
+
+class TestCaseRepository(object):
+    ''' A test case xml file (exported from TestLink) which is parsed only once.
+        Test cases are indexed by externalid and by name, and a deep copy is returned on each lookup
+        so that callers can update and re-parent the test case node freely.
+    '''
+
+    def __init__(self, xml_file):
+        self.xml_file = xml_file
+        self.id_index = {}
+        self.name_index = {}
+        parser = lxmlET.XMLParser(strip_cdata=False)
+        tc_root = lxmlET.parse(xml_file, parser).getroot()
+        for tc_node in tc_root.iter('testcase'):
+            externalid = tc_node.find('externalid')
+            if externalid is not None and externalid.text is not None:
+                # Keep the first test case if there are duplicated ones, same as a sequential search
+                self.id_index.setdefault(externalid.text.strip(), tc_node)
+            self.name_index.setdefault(self._normalize_name(tc_node.get('name', '')), tc_node)
+
+    def _normalize_name(self, tc_name):
+        return tc_name.strip()
+
+    def get_by_id(self, tc_id):
+        ''' tc_id could be either with the project prefix (PREFIX-123) or without it (123).
+        '''
+        tc_node = self.id_index.get(tc_id.split('-')[-1].strip())
+        if tc_node is None:
+            return None
+        return deepcopy(tc_node)
+
+    def get_by_name(self, tc_name):
+        tc_node = self.name_index.get(self._normalize_name(tc_name))
+        if tc_node is None:
+            return None
+        return deepcopy(tc_node)
+
+
+class TestCaseReader(object):
+    ''' Stream a (huge) test case xml file exported from TestLink with iterparse.
+        Only the element being processed is kept in memory since all processed elements are cleared and removed.
+        Iterating the reader gives one test case record (TestCase) at a time.
+    '''
+
+    def __init__(self, xml_file):
+        self.xml_file = xml_file
+
+    def iter_elements(self):
+        ''' Yield ('start', element) and ('end', element) for the root element and the test suites, and
+            ('element', element) for all other complete child elements of them (testcase, node_order, details...).
+            The element is cleared once the caller goes back to the loop.
+        '''
+        # Whether each of the opened elements is a container (the root element or a test suite)
+        containers = []
+        for event, elem in lxmlET.iterparse(self.xml_file, events=('start', 'end'), strip_cdata=False,
+                                            huge_tree=True):
+            if event == 'start':
+                is_container = (not containers) or (containers[-1] and elem.tag == 'testsuite')
+                containers.append(is_container)
+                if is_container:
+                    yield 'start', elem
+                continue
+            is_container = containers.pop()
+            if is_container:
+                yield 'end', elem
+            elif containers and containers[-1]:
+                yield 'element', elem
+            else:
+                # This is a part of a test case, it will be handled together with the test case.
+                continue
+            elem.clear()
+            parent = elem.getparent()
+            if parent is not None:
+                parent.remove(elem)
+
+    def iter_items(self):
+        ''' Yield ('testsuite', suite_path, suite_ids) when a test suite is started and ('testcase', record, None)
+            for every test case, so the caller can also rebuild the (empty) test suites.
+        '''
+        suite_path = []
+        suite_ids = []
+        suite_count = 0
+        for event, elem in self.iter_elements():
+            if event == 'start' and elem.getparent() is not None:
+                suite_count += 1
+                suite_path.append(elem.get('name', ''))
+                suite_ids.append(suite_count)
+                yield 'testsuite', tuple(suite_path), tuple(suite_ids)
+            elif event == 'end' and elem.getparent() is not None:
+                suite_path.pop()
+                suite_ids.pop()
+            elif event == 'element' and elem.tag == 'testcase':
+                yield 'testcase', self._get_record(elem, tuple(suite_path), tuple(suite_ids)), None
+
+    def __iter__(self):
+        for item_type, record, _ in self.iter_items():
+            if item_type == 'testcase':
+                yield record
+
+    def _get_text(self, elem, tag):
+        child = elem.find(tag)
+        if child is None:
+            return None
+        return child.text
+
+    def _get_record(self, tc, suite_path, suite_ids):
+        record = TestCase(tc.get('name', ''), suite_path, suite_ids)
+        for item in tc:
+            if item.tag in ['externalid', 'summary', 'preconditions']:
+                setattr(record, item.tag, item.text or '')
+            if item.tag == 'steps':
+                record.steps = []
+                for step in item.iter('step'):
+                    record.steps.append(TestStep(self._get_text(step, 'step_number'),
+                                                 self._get_text(step, 'actions'),
+                                                 self._get_text(step, 'expectedresults')))
+            if item.tag == 'custom_fields':
+                for custom_field in item.iter('custom_field'):
+                    record.custom_fields[self._get_text(custom_field, 'name')] = \
+                        self._get_text(custom_field, 'value')
+            if item.tag == 'requirements':
+                for req in item.iter('requirement'):
+                    record.requirements.append(self._get_text(req, 'doc_id'))
+        return record
+
+
+class RequirementCatalog(object):
+    ''' PMR and PFS items and their categories found while extracting requirements.
+        The given pmr_list/pfs_list are filled in place with RequirementGroup (with the Requirement items),
+        and the categories and requirement IDs are indexed with ordered dictionaries, thus all lookups and duplicate
+        checks are O(1).
+    '''
+    PMR = 'PMR'
+    PFS = 'PFS'
+
+    def __init__(self, pmr_list, pfs_list):
+        self.req_lists = {self.PMR: pmr_list, self.PFS: pfs_list}
+        # Category name -> index of the (first) group with this name
+        self.groups = {self.PMR: OrderedDict(), self.PFS: OrderedDict()}
+        # Requirement ID -> the requirement item
+        self.items = {self.PMR: OrderedDict(), self.PFS: OrderedDict()}
+        for kind, req_list in self.req_lists.items():
+            for group_id, group in enumerate(req_list):
+                self.groups[kind].setdefault(group.name, group_id)
+                for item in group.items:
+                    self.items[kind].setdefault(item.req_id, item)
+
+    def add_group(self, kind, name):
+        ''' Add a new category even if there is one with the same name, and return its group id '''
+        self.req_lists[kind].append(RequirementGroup(name))
+        group_id = len(self.req_lists[kind]) - 1
+        self.groups[kind].setdefault(name, group_id)
+        return group_id
+
+    def get_group(self, kind, name):
+        ''' Return the group id of the category, it's added if it's a new category '''
+        if self.groups[kind].has_key(name):
+            return self.groups[kind][name]
+        return self.add_group(kind, name)
+
+    def group_count(self, kind):
+        return len(self.req_lists[kind])
+
+    def has_item(self, kind, req_id):
+        return self.items[kind].has_key(req_id)
+
+    def add_item(self, kind, group_id, item):
+        ''' Add the requirement item into the group. Return False (and the item is not added) if it's duplicated. '''
+        if self.items[kind].has_key(item.req_id):
+            return False
+        self.req_lists[kind][group_id].items.append(item)
+        self.items[kind][item.req_id] = item
+        return True
+
+    def item_count(self, kind):
+        return len(self.items[kind])
+
+
+class XlsxSheet(object):
+    ''' A worksheet of a read-only xlsx workbook with the subset of the xlrd Sheet API used by this tool.
+        iter_rows() streams the cell values row by row. The random access methods (cell_value, col_values, nrows...)
+        load the cell values (and only the values) of the sheet on the first call.
+        Values are converted like xlrd does: empty cells are u'' and numbers are float.
+    '''
+
+    def __init__(self, worksheet, merged_cells):
+        self.name = worksheet.title
+        self.merged_cells = merged_cells
+        self._worksheet = worksheet
+        self._rows = None
+        self._ncols = 0
+
+    def _convert(self, value):
+        if value is None:
+            return u''
+        if isinstance(value, (int, long)) and not isinstance(value, bool):
+            return float(value)
+        return value
+
+    def iter_rows(self):
+        if self._rows is not None:
+            for row in self._rows:
+                yield row
+            return
+        for row in self._worksheet.iter_rows(values_only=True):
+            yield [self._convert(value) for value in row]
+
+    def _load(self):
+        if self._rows is None:
+            rows = list(self.iter_rows())
+            self._ncols = max([len(row) for row in rows] + [0])
+            for row in rows:
+                row.extend([u''] * (self._ncols - len(row)))
+            self._rows = rows
+        return self._rows
+
+    @property
+    def nrows(self):
+        return len(self._load())
+
+    @property
+    def ncols(self):
+        self._load()
+        return self._ncols
+
+    def cell_value(self, row, col):
+        return self._load()[row][col]
+
+    def row_values(self, row):
+        return self._load()[row]
+
+    def col_values(self, col):
+        return [row[col] for row in self._load()]
+
+
+class XlsxWorkbook(object):
+    ''' A read-only xlsx workbook (openpyxl read-only mode) with the subset of the xlrd Book API used by this tool.
+        The merged cells are not available in the read-only mode of openpyxl, so they're read from the <mergeCells>
+        of the worksheet XML and given in the xlrd format (rlo, rhi, clo, chi).
+    '''
+    NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+    NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+    NS_PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._workbook = load_workbook(file_name, read_only=True, data_only=True)
+        merged_cells = self._read_merged_cells()
+        self._sheets = OrderedDict((worksheet.title, XlsxSheet(worksheet, merged_cells.get(worksheet.title, [])))
+                                   for worksheet in self._workbook.worksheets)
+
+    def _read_merged_cells(self):
+        ''' Return {sheet name: [(rlo, rhi, clo, chi), ...]} '''
+        merged_cells = {}
+        xlsx = zipfile.ZipFile(self.file_name)
+        try:
+            targets = {}
+            rels = xmlcET.fromstring(xlsx.read('xl/_rels/workbook.xml.rels'))
+            for rel in rels.iter(self.NS_PKG_REL + 'Relationship'):
+                target = rel.get('Target')
+                if target.startswith('/'):
+                    target = target[1:]
+                elif not target.startswith('xl/'):
+                    target = 'xl/' + target
+                targets[rel.get('Id')] = target
+            workbook = xmlcET.fromstring(xlsx.read('xl/workbook.xml'))
+            for sheet in workbook.iter(self.NS_MAIN + 'sheet'):
+                target = targets.get(sheet.get(self.NS_REL + 'id'))
+                if target is None or target not in xlsx.namelist():
+                    continue
+                merged_cells[sheet.get('name')] = sheet_merged_cells = []
+                # The sheet data is skipped (and cleared) while streaming, only the <mergeCell> elements are kept
+                for event, elem in xmlcET.iterparse(xlsx.open(target)):
+                    if elem.tag == self.NS_MAIN + 'mergeCell':
+                        min_col, min_row, max_col, max_row = range_boundaries(elem.get('ref'))
+                        sheet_merged_cells.append((min_row - 1, max_row, min_col - 1, max_col))
+                    elif elem.tag == self.NS_MAIN + 'row':
+                        elem.clear()
+        finally:
+            xlsx.close()
+        return merged_cells
+
+    def sheets(self):
+        return self._sheets.values()
+
+    def sheet_by_name(self, name):
+        return self._sheets[name]
+
+    def sheet_names(self):
+        return self._sheets.keys()
+
+
+def _open_xls_workbook(file_name, formatting_info=False):
+    return open_workbook(file_name, on_demand=True, formatting_info=formatting_info)
+
+
+def _open_xlsx_workbook(file_name, formatting_info=False):
+    ''' The formatting is never read from the xlsx files '''
+    return XlsxWorkbook(file_name)
+
+
+# File extension -> function to open the workbook with an xlrd compatible API
+SPREADSHEET_BACKENDS = {'.xls': _open_xls_workbook,
+                        '.xlsx': _open_xlsx_workbook,
+                        '.xlsm': _open_xlsx_workbook}
+
+
+def iter_sheet_rows(sheet, ncols=0):
+    ''' Iterate the row values of a sheet, the xlsx sheets are streamed. The rows shorter than ncols are padded with
+        empty values, as the trailing empty cells are not given for the xlsx files.
+    '''
+    if hasattr(sheet, 'iter_rows'):
+        rows = sheet.iter_rows()
+    else:
+        rows = (sheet.row_values(i) for i in xrange(sheet.nrows))
+    for row in rows:
+        if len(row) < ncols:
+            row = row + [u''] * (ncols - len(row))
+        yield row
+
+
+class DocxTable(object):
+    ''' A table of a docx document read from the w:tbl/w:tr/w:tc elements in one pass.
+        A cell is the list of its paragraph texts. The grid is resolved like python-docx does: a cell merged
+        horizontally (gridSpan) or vertically (vMerge) is given for all its grid positions. The cells are placed by
+        (row, grid column), the grid columns skipped by a row (gridBefore, gridAfter or a short row) are empty cells.
+        The number of columns is given by the tblGrid, or by the widest row if there is no tblGrid.
+    '''
+    W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+    def __init__(self, tbl):
+        W = self.W
+        self.rows = []
+        for tr in tbl.iterchildren(W + 'tr'):
+            row = [[u''] for j in range(self._get_grid_value(tr, 'gridBefore'))]
+            prev_row = self.rows[-1] if self.rows else []
+            for tc in tr.iterchildren(W + 'tc'):
+                grid_span = tc.find(W + 'tcPr/' + W + 'gridSpan')
+                grid_span = int(grid_span.get(W + 'val')) if grid_span is not None else 1
+                v_merge = tc.find(W + 'tcPr/' + W + 'vMerge')
+                v_merge = v_merge.get(W + 'val', 'continue') if v_merge is not None else None
+                if v_merge == 'continue' and len(row) < len(prev_row):
+                    cell = prev_row[len(row)]
+                else:
+                    cell = [self._paragraph_text(p) for p in tc.iterchildren(W + 'p')]
+                row.extend([cell] * grid_span)
+            row.extend([[u''] for j in range(self._get_grid_value(tr, 'gridAfter'))])
+            self.rows.append(row)
+        self.nrows = len(self.rows)
+        self.ncols = len(tbl.findall(W + 'tblGrid/' + W + 'gridCol')) or max([len(row) for row in self.rows] + [0])
+        for row in self.rows:
+            row.extend([[u''] for j in range(self.ncols - len(row))])
+
+    def _get_grid_value(self, tr, name):
+        W = self.W
+        value = tr.find(W + 'trPr/' + W + name)
+        return int(value.get(W + 'val')) if value is not None else 0
+
+    def _paragraph_text(self, p):
+        W = self.W
+        text = []
+        for r in p.iterchildren(W + 'r'):
+            for child in r:
+                if child.tag == W + 't':
+                    text.append(child.text or '')
+                elif child.tag == W + 'tab':
+                    text.append('\t')
+                elif child.tag in (W + 'br', W + 'cr'):
+                    text.append('\n')
+        return u''.join(text)
+
+    def cell(self, row, col):
+        ''' Return the paragraph texts of the cell '''
+        return self.rows[row][col]
+
+
+def _parse_docx_table(tbl_xml):
+    return DocxTable(lxmlET.fromstring(tbl_xml))
+
+
+def read_docx_tables(file_name, workers=1):
+    ''' Return the (top level) tables of a docx document as DocxTable, in document order.
+        document.xml is streamed once, and the tables are resolved in a pool of worker processes if workers > 1.
+    '''
+    W = DocxTable.W
+    tables = []
+    docx = zipfile.ZipFile(file_name)
+    try:
+        for event, tbl in lxmlET.iterparse(docx.open('word/document.xml'), events=('end',), tag=W + 'tbl'):
+            body = tbl.getparent()
+            if body.tag != W + 'body':
+                # Nested table, it's a part of the top level table
+                continue
+            if workers > 1:
+                tables.append(lxmlET.tostring(tbl))
+            else:
+                tables.append(DocxTable(tbl))
+            # The paragraphs and tables already read are not needed anymore
+            while tbl.getprevious() is not None:
+                del body[0]
+            tbl.clear()
+    finally:
+        docx.close()
+    if workers > 1 and len(tables) > 1 and not multiprocessing.current_process().daemon:
+        with PoolLogListener() as log_queue:
+            pool = multiprocessing.Pool(min(workers, len(tables)), _init_pool_worker, (log_queue,))
+            tables = pool.map(_parse_docx_table, tables, max(1, len(tables) / (workers * 4)))
+            pool.close()
+            pool.join()
+    elif workers > 1:
+        tables = [_parse_docx_table(tbl_xml) for tbl_xml in tables]
+    return tables
+
+
+class SheetColumns(object):
+    ''' The needed columns of a spreadsheet given row by row (add_row) while the sheet is streamed, the values are
+        only available for the last added row. The merged cells are resolved once per sheet into a fill map
+        (column -> {row: top row of the merged cells}) and the values of the top cells are kept, thus value() gives
+        the value of the top cell for all cells of a merged region.
+    '''
+
+    def __init__(self, sheet, cols):
+        self.cols = [col for col in cols if col >= 0]
+        self.ncols = max(self.cols + [-1]) + 1
+        self.fill_map = dict((col, {}) for col in self.cols)
+        for rlo, rhi, clo, chi in sheet.merged_cells:
+            for col in self.cols:
+                if clo <= col < chi:
+                    for row in range(rlo + 1, rhi):
+                        self.fill_map[col][row] = rlo
+        self.top_values = dict((col, dict((row, None) for row in set(self.fill_map[col].values())))
+                               for col in self.cols)
+        self.row = []
+
+    def add_row(self, row, values):
+        if len(values) < self.ncols:
+            values = values + [u''] * (self.ncols - len(values))
+        self.row = values
+        for col in self.cols:
+            if row in self.top_values[col]:
+                self.top_values[col][row] = values[col]
+
+    def raw_value(self, row, col):
+        ''' The value of the cell itself (empty for the merged cells other than the top one) '''
+        return self.row[col]
+
+    def value(self, row, col):
+        top_row = self.fill_map[col].get(row, row)
+        if top_row == row:
+            return self.row[col]
+        return self.top_values[col][top_row]
+
+
+class TraceabilityGraph(object):
+    ''' Bidirectional traceability between two kinds of items, for instance PFS->PMR or TC->REQ.
+        Links are kept in insertion order in both directions, so adding, de-duplicating and looking up
+        links are O(1) and the reversed graph (PMR->PFS) is available without another pass.
+    '''
+
+    def __init__(self, links=None):
+        self._forward = OrderedDict()
+        self._backward = OrderedDict()
+        if links is not None:
+            for src_id, dst_ids in links:
+                self.add_links(src_id, dst_ids)
+
+    def add_source(self, src_id):
+        ''' Register a source item even if it has no link, thus it can be reported as missing traceability.
+        '''
+        if src_id not in self._forward:
+            self._forward[src_id] = OrderedDict()
+
+    def add_link(self, src_id, dst_id):
+        ''' Return False if this link already exists.
+        '''
+        self.add_source(src_id)
+        if dst_id == '':
+            return True
+        if dst_id in self._forward[src_id]:
+            return False
+        self._forward[src_id][dst_id] = None
+        if dst_id not in self._backward:
+            self._backward[dst_id] = OrderedDict()
+        self._backward[dst_id][src_id] = None
+        return True
+
+    def add_links(self, src_id, dst_ids):
+        self.add_source(src_id)
+        for dst_id in dst_ids:
+            self.add_link(src_id, dst_id)
+
+    def has_link(self, src_id, dst_id):
+        return src_id in self._forward and dst_id in self._forward[src_id]
+
+    def links(self, src_id):
+        if src_id not in self._forward:
+            return []
+        return self._forward[src_id].keys()
+
+    def reverse(self):
+        ''' Return the reversed view of this graph. Both views share the same links.
+        '''
+        reversed_graph = TraceabilityGraph()
+        reversed_graph._forward = self._backward
+        reversed_graph._backward = self._forward
+        return reversed_graph
+
+    def items(self):
+        ''' Return the links in the format of [[SRC_ID, [DST_ID1, DST_ID2, ...]], ...]
+        '''
+        return [[src_id, dst_ids.keys()] for src_id, dst_ids in self._forward.iteritems()]
+
+    def __contains__(self, src_id):
+        return src_id in self._forward
+
+    def __len__(self):
+        return len(self._forward)
+
+    def __iter__(self):
+        return iter(self._forward)
+
+
+class FreeMindMap(object):
+    ''' A read-only handle of a FreeMind map file. The file is memory mapped and parsed once (expat) into a compact
+        skeleton of the nodes in document order: ID, TEXT, LINK, icons, parent and the byte range of the node.
+        Nothing is kept for the note bodies (richcontent). A node (with its whole subtree) is only materialized as an
+        element from its byte range when element() is called.
+        Use it as a context manager or call close(), thus the file is not kept open (and locked on Windows).
+    '''
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.encoding = 'UTF-8'
+        self.ids = []
+        self.texts = []
+        self.links = []
+        # Node index -> [icon, ...], only for the nodes with icons
+        self.icons = {}
+        self.parents = array('i')
+        # The index after the last descendant of a node, so the descendants of node i are i+1 ... next[i]-1
+        self.next = array('i')
+        self.starts = array('l')
+        self.ends = array('l')
+        self._file = open(file_name, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._parse()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _parse(self):
+        parser = expat.ParserCreate()
+        mm = self._mm
+        node_stack = []
+        # [tag, has child element] for each open element
+        element_stack = []
+        # Depth inside the current note (richcontent), its elements are skipped
+        note_depth = [0]
+
+        def xml_decl(version, encoding, standalone):
+            if encoding:
+                self.encoding = encoding
+
+        def start_element(name, attrs):
+            if note_depth[0]:
+                note_depth[0] += 1
+                return
+            if element_stack:
+                element_stack[-1][1] = True
+            element_stack.append([name, False])
+            if name == 'node':
+                self.parents.append(node_stack[-1] if node_stack else -1)
+                self.ids.append(attrs.get('ID'))
+                self.texts.append(attrs.get('TEXT'))
+                self.links.append(attrs.get('LINK'))
+                self.starts.append(parser.CurrentByteIndex)
+                self.ends.append(0)
+                self.next.append(0)
+                node_stack.append(len(self.ids) - 1)
+            elif name == 'icon' and len(element_stack) > 1 and element_stack[-2][0] == 'node':
+                self.icons.setdefault(node_stack[-1], []).append(attrs.get('BUILTIN'))
+            elif name == 'richcontent':
+                note_depth[0] = 1
+
+        def end_element(name):
+            if note_depth[0] > 1:
+                note_depth[0] -= 1
+                return
+            note_depth[0] = 0
+            tag, has_child = element_stack.pop()
+            if name == 'node':
+                index = node_stack.pop()
+                position = parser.CurrentByteIndex
+                if not has_child and mm[position - 2:position] == '/>':
+                    # An empty element (<node .../>), the position is already after it
+                    self.ends[index] = position
+                else:
+                    # The position is at the end tag (</node>)
+                    self.ends[index] = mm.find('>', position) + 1
+                self.next[index] = len(self.ids)
+
+        parser.XmlDeclHandler = xml_decl
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        for position in xrange(0, len(mm), self.CHUNK_SIZE):
+            parser.Parse(mm[position:position + self.CHUNK_SIZE], False)
+        parser.Parse('', True)
+
+    def children(self, index):
+        ''' Iterate the indexes of the child nodes, -1 is the map itself '''
+        if index < 0:
+            child, last = 0, len(self.ids)
+        else:
+            child, last = index + 1, self.next[index]
+        while child < last:
+            yield child
+            child = self.next[child]
+
+    def element(self, index, flavour='et'):
+        ''' Materialize the node and its subtree. flavour is 'et', 'cet' or 'lxml' '''
+        xml = self._mm[self.starts[index]:self.ends[index]]
+        if self.encoding.upper() not in ('UTF-8', 'UTF8'):
+            xml = '<?xml version="1.0" encoding="%s"?>' % self.encoding + xml
+        if flavour == 'lxml':
+            return lxmlET.fromstring(xml)
+        if flavour == 'cet':
+            return xmlcET.fromstring(xml)
+        return ET.fromstring(xml)
+
+    def getroot(self):
+        return FreeMindMapNode(self, -1)
+
+
+class FreeMindMapNode(object):
+    ''' A node of FreeMindMap with the subset of the ElementTree API used to analyse a map without changing it
+        (tag, attrib, get, findall('node') and iter('node')). Only the ID, TEXT and LINK attributes are available,
+        element() gives the whole node. The map itself is the node with index -1.
+    '''
+
+    def __init__(self, fm_map, index):
+        self.fm_map = fm_map
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, FreeMindMapNode) and self.fm_map is other.fm_map and self.index == other.index
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.index)
+
+    @property
+    def tag(self):
+        return 'map' if self.index < 0 else 'node'
+
+    @property
+    def attrib(self):
+        attrib = {}
+        if self.index >= 0:
+            for key, value in (('ID', self.fm_map.ids[self.index]), ('TEXT', self.fm_map.texts[self.index]),
+                               ('LINK', self.fm_map.links[self.index])):
+                if value is not None:
+                    attrib[key] = value
+        return attrib
+
+    def get(self, key, default=None):
+        return self.attrib.get(key, default)
+
+    def icons(self):
+        return self.fm_map.icons.get(self.index, [])
+
+    def findall(self, tag):
+        if tag != 'node':
+            return []
+        return [FreeMindMapNode(self.fm_map, child) for child in self.fm_map.children(self.index)]
+
+    def iter(self, tag=None):
+        if self.index < 0 and tag in (None, 'map'):
+            yield self
+        if tag not in (None, 'node'):
+            return
+        if self.index >= 0:
+            yield self
+        last = self.fm_map.next[self.index] if self.index >= 0 else len(self.fm_map)
+        # The descendants are the nodes right after this node in document order
+        for index in xrange(self.index + 1, last):
+            yield FreeMindMapNode(self.fm_map, index)
+
+    def element(self, flavour='et'):
+        return self.fm_map.element(self.index, flavour)
+
+
+class NodeClassifier(object):
+    ''' Parse the LINK and TEXT of FreeMind nodes.
+        A LINK is either a TestLink link to a requirement (PFS link), to a test case (TC link) or to something else
+        (other link), the item ID is the value after the last '='. A TEXT is split into its fields by PREFIX_TITLE_SEP,
+        the first field is the prefix (the ID of a test case or requirement node).
+        The elements of ElementTree can't keep extra attributes, so the results are cached by the LINK/TEXT value,
+        thus every distinct value is only parsed once for all the passes over the maps of a run.
+    '''
+    PFS_LINK = 'pfs_link'
+    TC_LINK = 'tc_link'
+    OTHER_LINK = 'other_link'
+
+    def __init__(self, testlink_url, repo_prefix):
+        self.testlink_url = testlink_url
+        self.repo_prefix = repo_prefix
+        self.links = {None: (None, None)}
+        self.fields = {}
+        self.tc_ids = {}
+
+    def parse_link(self, link):
+        ''' Return (kind, item ID) of the link, kind is None if this is not a TestLink link '''
+        res = self.links.get(link)
+        if res is None:
+            res = (None, None)
+            if link.startswith(self.testlink_url):
+                if link.count('req&id') > 0:
+                    res = (self.PFS_LINK, link.split('=')[-1])
+                elif link.count('testcase&id') > 0:
+                    res = (self.TC_LINK, link.split('=')[-1].strip())
+                else:
+                    res = (self.OTHER_LINK, link.split('=')[-1])
+            self.links[link] = res
+        return res
+
+    def link_kind(self, node):
+        return self.parse_link(node.get('LINK'))[0]
+
+    def link_id(self, node):
+        return self.parse_link(node.get('LINK'))[1]
+
+    def text_fields(self, text):
+        res = self.fields.get(text)
+        if res is None:
+            res = tuple(text.split(PREFIX_TITLE_SEP))
+            self.fields[text] = res
+        return res
+
+    def text_prefix(self, text):
+        return self.text_fields(text)[0]
+
+    def tc_id(self, text):
+        ''' Return the test case ID if the text is the text of a test case node, otherwise return None '''
+        try:
+            return self.tc_ids[text]
+        except KeyError:
+            tc_id = text.strip().split(PREFIX_TITLE_SEP)[0]
+            # If this is the node for a test case
+            if tc_id.count(self.repo_prefix) <> 1:
+                tc_id = None
+            self.tc_ids[text] = tc_id
+            return tc_id
+
+
+class TdsMapAnalysis(object):
+    ''' Classify every node of a TDS FreeMind map in one pass.
+        A node is either a TestLink link (PFS link, test case link or other link), a last TDS node (TDS item) which
+        only has link nodes as children, or a container of other TDS nodes.
+        The PFS links of a TDS item are the PFS link nodes under the item itself and under all of its ancestors.
+    '''
+    TDS_ITEM = 'tds_item'
+    CONTAINER = 'container'
+    PFS_LINK = NodeClassifier.PFS_LINK
+    TC_LINK = NodeClassifier.TC_LINK
+    OTHER_LINK = NodeClassifier.OTHER_LINK
+
+    def __init__(self, fm_root, classifier):
+        self.classifier = classifier
+        self.node_kind = {}
+        self.tds_items = []
+        self.item_pfs_ids = {}
+        self.item_tc_ids = {}
+        if fm_root.tag == 'node' and classifier.link_kind(fm_root) is not None:
+            self.node_kind[fm_root] = classifier.link_kind(fm_root)
+        self._analyse(fm_root, [])
+
+    def _analyse(self, node, inherited_pfs_ids):
+        pfs_ids = inherited_pfs_ids
+        tc_ids = []
+        has_tds_child = False
+        children = node.findall('node')
+        for child in children:
+            kind, link_id = self.classifier.parse_link(child.get('LINK'))
+            if kind is None:
+                has_tds_child = True
+                continue
+            self.node_kind[child] = kind
+            if kind == self.PFS_LINK:
+                # This is a PFS node, so all valid TDS items under the parent node of this node will have this PFS ID.
+                if pfs_ids is inherited_pfs_ids:
+                    pfs_ids = list(inherited_pfs_ids)
+                pfs_ids.append(link_id)
+            elif kind == self.TC_LINK:
+                tc_ids.append(link_id)
+
+        if node.tag == 'node' and node not in self.node_kind:
+            if has_tds_child:
+                self.node_kind[node] = self.CONTAINER
+            else:
+                self.node_kind[node] = self.TDS_ITEM
+                self.tds_items.append(node)
+                self.item_pfs_ids[node] = pfs_ids
+                self.item_tc_ids[node] = tc_ids
+
+        for child in children:
+            self._analyse(child, pfs_ids)
 
+    def is_tds_item(self, node):
+        return self.node_kind.get(node) == self.TDS_ITEM
 
-def CDATA(text=None):
-    element = ET.Element('![CDATA[')
-    element.text = text
-    return element
+    def is_link(self, node):
+        return self.node_kind.get(node) in (self.PFS_LINK, self.TC_LINK, self.OTHER_LINK)
 
+    def get_pfs_ids(self, node):
+        return self.item_pfs_ids.get(node, [])
 
-_original_serialize_xml = ET._serialize_xml
+    def get_tc_ids(self, node):
+        return self.item_tc_ids.get(node, [])
 
 
-def _serialize_xml(write, elem, encoding, qnames, namespaces):
-    if elem.tag == '![CDATA[':
-        #write("<%s%s]]>%s" % (elem.tag, elem.text, elem.tail))
-        write("<%s%s]]>" % (elem.tag, elem.text))
-        return
-    return _original_serialize_xml(
-        write, elem, encoding, qnames, namespaces)
+class TestPlanDiff(object):
+    ''' Compare a baseline test plan FreeMind map with a new one.
+        Both maps are indexed once by the (parent text, node text) key of their test case nodes, then the test cases
+        are reported as added (only in the new plan), removed (only in the baseline) or moved (in both plans, but with
+        a different parent or text).
+    '''
 
+    def __init__(self, based_root, new_root, classifier):
+        self.classifier = classifier
+        self.based_index = OrderedDict()
+        self.new_index = OrderedDict()
+        self._index_node(based_root, self.based_index)
+        self._index_node(new_root, self.new_index)
+        self.added = []
+        self.removed = []
+        self.moved = []
+        self._compare()
+
+    def _index_node(self, root_node, index):
+        ''' index is (parent text, node text) -> test case id '''
+        parent_text = root_node.get('TEXT', '').strip()
+        for child in root_node.findall('node'):
+            node_text = child.get('TEXT', '').strip()
+            tc_id = self.classifier.tc_id(node_text)
+            if tc_id is not None:
+                index.setdefault((parent_text, node_text), tc_id)
+            else:
+                self._index_node(child, index)
+
+    def _get_keys_by_tc(self, index):
+        tc_keys = OrderedDict()
+        for key, tc_id in index.iteritems():
+            tc_keys.setdefault(tc_id, []).append(key)
+        return tc_keys
+
+    def _compare(self):
+        based_tc_keys = self._get_keys_by_tc(self.based_index)
+        new_tc_keys = self._get_keys_by_tc(self.new_index)
+        for key, tc_id in self.based_index.iteritems():
+            if self.new_index.has_key(key):
+                continue
+            if new_tc_keys.has_key(tc_id):
+                new_keys = [new_key for new_key in new_tc_keys[tc_id] if not self.based_index.has_key(new_key)]
+                self.moved.append({'tc_id': tc_id, 'from_parent': key[0], 'from_text': key[1],
+                                   'to': [{'parent': new_key[0], 'text': new_key[1]} for new_key in new_keys]})
+            else:
+                self.removed.append({'tc_id': tc_id, 'parent': key[0], 'text': key[1]})
+        for key, tc_id in self.new_index.iteritems():
+            if not self.based_index.has_key(key) and not based_tc_keys.has_key(tc_id):
+                self.added.append({'tc_id': tc_id, 'parent': key[0], 'text': key[1]})
 
-ET._serialize_xml = ET._serialize['xml'] = _serialize_xml
+    def as_dict(self):
+        return OrderedDict([('added', self.added), ('removed', self.removed), ('moved', self.moved)])
+
+
+class TestLinkResponseCache(object):
+    ''' An on-disk (SQLite) cache of TestLink API responses keyed by API method and arguments.
+        Each method has its own time to live (in seconds), methods without a TTL (e.g. updates) are never cached.
+        In offline mode the cached responses are always used regardless of their age.
+    '''
+    # getTestCase is not cached since the latest version of the test case is added to the test plans
+    TTLS = {'getTestProjectByName': 7 * 24 * 3600,
+            'getProjectTestPlans': 3600,
+            'getTestCasesForTestPlan': 3600}
+    # The cached responses of these methods are out of date once the update method is called
+    INVALIDATIONS = {'createTestPlan': ['getProjectTestPlans'],
+                     'addTestCaseToTestPlan': ['getTestCasesForTestPlan']}
+
+    def __init__(self, db_file, offline=False, ttls=None):
+        self.db_file = db_file
+        self.offline = offline
+        self.ttls = dict(self.TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.lock = threading.Lock()
+        # The same database could be used by the processes of parallel actions, thus wait for their locks
+        self.db = sqlite3.connect(db_file, timeout=60, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS responses '
+                        '(method TEXT, params TEXT, response TEXT, fetched REAL, PRIMARY KEY (method, params))')
+        self.db.commit()
+
+    def is_cached(self, method):
+        return self.ttls.get(method, 0) > 0
+
+    def _get_key(self, params):
+        params = dict(params)
+        params.pop('devKey', None)
+        return json.dumps(params, sort_keys=True)
+
+    def get(self, method, params):
+        ''' Return (True, response) if there is a fresh (or any in offline mode) response, otherwise (False, None) '''
+        if not self.is_cached(method):
+            return False, None
+        with self.lock:
+            row = self.db.execute('SELECT response, fetched FROM responses WHERE method = ? AND params = ?',
+                                  (method, self._get_key(params))).fetchone()
+        if row is None:
+            return False, None
+        if not self.offline and time.time() - row[1] > self.ttls[method]:
+            return False, None
+        return True, json.loads(row[0])
+
+    def put(self, method, params, response):
+        if self.is_cached(method):
+            with self.lock:
+                self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                                (method, self._get_key(params), json.dumps(response), time.time()))
+                self.db.commit()
+
+    def updated(self, method):
+        ''' Invalidate the cached responses which are out of date after the update method is called '''
+        for invalid_method in self.INVALIDATIONS.get(method, []):
+            self.invalidate(invalid_method)
+
+    def invalidate(self, method=None):
+        ''' Remove the cached responses of the method, or all cached responses if the method is not specified '''
+        with self.lock:
+            if method is None:
+                self.db.execute('DELETE FROM responses')
+            else:
+                self.db.execute('DELETE FROM responses WHERE method = ?', (method,))
+            self.db.commit()
+
+
+class TestLinkSync(object):
+    ''' A TestLink XML-RPC client for bulk requests.
+        Each worker thread keeps its own HTTP/1.1 keep-alive connection. Failed requests (network errors) are retried
+        with exponential backoff, and many calls of the same method are batched with system.multicall if the server
+        supports it. The batches are sent by a bounded pool of worker threads.
+    '''
+
+    def __init__(self, rpc_url, dev_key, logger, workers=8, batch_size=20, retries=3, backoff=1.0, cache=None):
+        ''' cache is an optional TestLinkResponseCache, only the stale or missing responses are requested then. '''
+        self.rpc_url = rpc_url
+        self.cache = cache
+        self.dev_key = dev_key
+        self.logger = logger
+        self.log_prefix = 'TestLink:'
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.retries = retries
+        self.backoff = backoff
+        self.multicall_supported = True
+        self.local = threading.local()
+
+    def _get_proxy(self):
+        # The transport of xmlrpclib keeps the HTTP connection alive, so one proxy is kept for each thread
+        if not hasattr(self.local, 'proxy'):
+            self.local.proxy = xmlrpclib.ServerProxy(self.rpc_url, allow_none=True)
+        return self.local.proxy
+
+    def _retry(self, request, description):
+        attempt = 0
+        while True:
+            try:
+                return request()
+            except (socket.error, httplib.HTTPException, xmlrpclib.ProtocolError), e:
+                # Start a new connection for the next attempt
+                if hasattr(self.local, 'proxy'):
+                    del self.local.proxy
+                if attempt >= self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                attempt += 1
+                self.logger.warning(self.log_prefix + \
+                                    "Request (%s) failed (%s), retry %d/%d in %.1f seconds." % \
+                                    (description, e, attempt, self.retries, delay))
+                time.sleep(delay)
+
+    def _get_params(self, params):
+        params = dict(params)
+        params['devKey'] = self.dev_key
+        return params
+
+    def _is_error(self, response):
+        return isinstance(response, xmlrpclib.Fault) or \
+            (isinstance(response, list) and len(response) > 0 and isinstance(response[0], dict) and
+             response[0].has_key('code') and response[0].has_key('message'))
+
+    def _get_offline_fault(self, method):
+        return xmlrpclib.Fault(0, 'The response of %s is not cached and TestLink is not requested in offline mode.' % \
+                               (method))
+
+    def call(self, method, **params):
+        ''' Call the TestLink API method (without the "tl." prefix), for instance call('getTestCase', testcaseexternalid='HDVB-1') '''
+        if self.cache is not None:
+            cached, response = self.cache.get(method, params)
+            if cached:
+                return response
+            if self.cache.offline:
+                raise self._get_offline_fault(method)
+        response = self._call_server(method, params)
+        if self.cache is not None:
+            self.cache.updated(method)
+            if not self._is_error(response):
+                self.cache.put(method, params, response)
+        return response
+
+    def _call_server(self, method, params):
+        params = self._get_params(params)
+        return self._retry(lambda: getattr(self._get_proxy(), 'tl.' + method)(params), method)
+
+    def _call_batch(self, method, params_list):
+        if self.cache is None:
+            return self._call_batch_server(method, params_list)
+        results = [None] * len(params_list)
+        missing = []
+        for i, params in enumerate(params_list):
+            cached, results[i] = self.cache.get(method, params)
+            if not cached:
+                missing.append(i)
+        if self.cache.offline:
+            for i in missing:
+                results[i] = self._get_offline_fault(method)
+            return results
+        if missing:
+            responses = self._call_batch_server(method, [params_list[i] for i in missing])
+            self.cache.updated(method)
+            for i, response in zip(missing, responses):
+                results[i] = response
+                if not self._is_error(response):
+                    self.cache.put(method, params_list[i], response)
+        return results
+
+    def _call_batch_server(self, method, params_list):
+        if self.multicall_supported and len(params_list) > 1:
+            def request():
+                multicall = xmlrpclib.MultiCall(self._get_proxy())
+                for params in params_list:
+                    getattr(multicall, 'tl.' + method)(self._get_params(params))
+                return multicall().results
+            try:
+                results = self._retry(request, 'system.multicall of ' + method)
+                # A failed call in the batch is returned as the Fault, the others are [result]
+                return [xmlrpclib.Fault(res['faultCode'], res['faultString']) if isinstance(res, dict) else res[0]
+                        for res in results]
+            except xmlrpclib.Fault, e:
+                self.logger.warning(self.log_prefix + \
+                                    "system.multicall is not supported by the server (%s), the calls are sent one by one." % \
+                                    (e))
+                self.multicall_supported = False
+        results = []
+        for params in params_list:
+            try:
+                results.append(self._call_server(method, params))
+            except xmlrpclib.Fault, e:
+                results.append(e)
+        return results
+
+    def map(self, method, params_list, batch_size=None):
+        ''' Call the method once for each parameter dictionary and return the results in the same order.
+            A failed call is returned as the xmlrpclib.Fault. Progress and throughput are reported after each batch.
+        '''
+        if batch_size is None:
+            batch_size = self.batch_size
+        batches = [params_list[i:i + batch_size] for i in range(0, len(params_list), batch_size)]
+        results = []
+        done = 0
+        start_time = time.time()
+        pool = ThreadPool(min(self.workers, max(1, len(batches))))
+        try:
+            for batch_results in pool.imap(lambda batch: self._call_batch(method, batch), batches):
+                results.extend(batch_results)
+                done += len(batch_results)
+                elapsed_time = max(time.time() - start_time, 0.001)
+                self.logger.info(self.log_prefix + \
+                                 "%s: %d/%d calls done (%.1f calls per second)." % \
+                                 (method, done, len(params_list), done / elapsed_time))
+        finally:
+            pool.close()
+            pool.join()
+        return results
 
 
 class FreeMind(object):
@@ -76,12 +1398,18 @@ class FreeMind(object):
         self.fm_file = None
         self.tc_tree = None
         self.tc_file = None
-        self.node_found = False
+        self.tc_repo = None
+        self.doc_cache = DocumentCache()
+        self.node_classifier = None
 
         self.testlink_url = None
         self.testlink_devkey = None
+        self.testlink_workers = 8
+        self.testlink_cache = None
         self.tls = None
         self.tc_prefix = None
+        self.repo_name = None
+        self.repo_prefix = None
         self.project_name = None
         self.pfs_prefix = None
         self.pmr_prefix = None
@@ -108,15 +1436,44 @@ class FreeMind(object):
             self._parse_cfg_file(cfg_file)
 
     def _parse_cfg_file(self, cfg_file):
+        # Parsed documents are only shared between the actions of this run
+        self.doc_cache = DocumentCache()
+        # Firstly get all configurations from the default configuration file
+        cfg_root = self._read_cfg_settings(cfg_file)
+
+        # Secondly perform all enabled actions.
+        actions = self._get_enabled_actions(cfg_root)
+        workers = 1
+        for item in cfg_root.iter('actions'):
+            workers = int(item.attrib.get('WORKERS', '1').strip() or '1')
+        res = self._perform_actions(cfg_file, actions, workers)
+
+        self._log_doc_cache('the configuration file (%s)' % (cfg_file))
+        return res
+
+    def _log_doc_cache(self, description):
+        ''' The document cache is per process, the actions performed in pool workers are not counted here '''
+        self.logger.info(self.log_prefix + \
+                         "Parsed %d documents for %s in process (%d), %d parses are saved by the document cache." % \
+                         (self.doc_cache.misses, description, os.getpid(), self.doc_cache.hits))
+
+    def _read_cfg_settings(self, cfg_file):
+        ''' Read all settings (urls, prefixes...) from the configuration file and return the root of it '''
         cfg_tree = ET.parse(cfg_file)
         cfg_root = cfg_tree.getroot()
 
-        # Firstly get all configurations from the default configuration file
         for item in cfg_root.iter():
             if item.tag == 'testlink':
                 self.testlink_rpc_url = item.attrib['URL'].strip()
                 self.testlink_url = '/'.join(self.testlink_rpc_url.split('/')[:4])
                 self.testlink_devkey = item.attrib['DEV_KEY'].strip()
+                self.testlink_workers = int(item.attrib.get('WORKERS', '8').strip() or '8')
+                self.testlink_cache = None
+                if item.attrib.get('CACHE', '0').strip() == '1':
+                    self.testlink_cache = TestLinkResponseCache('./testlink_cache.db',
+                                                                item.attrib.get('OFFLINE', '0').strip() == '1')
+                    if item.attrib.get('CLEAR_CACHE', '0').strip() == '1':
+                        self.testlink_cache.invalidate()
                 os.environ['TESTLINK_API_PYTHON_SERVER_URL'] = self.testlink_rpc_url
                 os.environ['TESTLINK_API_PYTHON_DEVKEY'] = self.testlink_devkey
             if item.tag == 'repository':
@@ -162,41 +1519,235 @@ class FreeMind(object):
             if item.tag == 'html_template':
                 self.html_template = freemind + item.text.strip()
 
-                # Secondly perform all enabled actions.
+        return cfg_root
+
+    def _get_enabled_actions(self, cfg_root):
+        actions = []
         for action in cfg_root.iter('action'):
             if action.attrib['ENABLE'].strip() <> '1':
                 continue
-            action_name = action.attrib['NAME'].strip()
-            self.logger.info(self.log_prefix + \
-                             "Perform the enabled action (%s) specified in the configuration file (%s)." % \
-                             (action_name, cfg_file))
-            if action_name == 'Extract_Requirements':
-                self.extract_requirements(self.requirements_url, action.attrib['TEMPLATE'].strip())
-            if action_name == 'Extract_TestCases':
-                self.extract_tc_from_file(self.tc_url, action.attrib['SHEET_NAME'].strip(), action.attrib['REVIEW_INFO'].strip())
-            if action_name == 'Link_PFS_with_PMR':
-                pass  #self.link_pfs_pmr(self.pmr_url, self.pfs_url)
-            if action_name == 'Link_PFS_with_TCs':
-                self.link_tc2pfs(action.attrib['TEAM'].strip())
-            if action_name == 'Generate_TDS':
-                self.gen_tds(self.tds_url, action.attrib['REMOVE_PREFIX'].strip())
-            if action_name == 'Link_TDS_with_TCs':
-                self.link_tc2tds(self.tds_url, self.tc_url)
-            if action_name == 'Link_TDS_with_TCs-TPs':
-                self.link_tp2tds_tc(self.tds_url, self.tc_url, action.attrib['FILTER'].strip())
-            if action_name == 'Link_TDS_with_TCs-PFS':
-                self.link_pfs2tds(self.tds_url, self.tc_url, self.pfs_url)
-            if action_name == 'Link_TCs_with_TDS':
-                self.link_tds2tc(self.tc_url, self.tds_url)
-            if action_name == 'Create_Test_Plan':
-                self.create_test_plan(self.tp_url, action.attrib['AUTO'].strip(), action.attrib['TEAM'].strip())
-            if action_name == 'Generate_TCs_from_TDS':
-                self.Generate_TCs_from_TDS(action.attrib['NODE_LIST'].strip(), action.attrib['TC_READY'].strip())
-            if action_name == 'Check_PFS_Traceablity':
-                self.chk_pfs_traceability(action.attrib['TEAM'].strip())
-            if action_name == 'Generate_PFS_TC_Traceablity':
-                self.gen_pfs_tc_traceability(action.attrib['TEAM'].strip())
+            actions.append(action.attrib)
+        return actions
 
+    def _perform_action(self, cfg_file, action):
+        action_name = action['NAME'].strip()
+        self.logger.info(self.log_prefix + \
+                         "Perform the enabled action (%s) specified in the configuration file (%s)." % \
+                         (action_name, cfg_file))
+        if action_name == 'Extract_Requirements':
+            self.extract_requirements(self.requirements_url, action['TEMPLATE'].strip(),
+                                      int(action.get('WORKERS', '1').strip() or '1'))
+        if action_name == 'Extract_TestCases':
+            self.extract_tc_from_file(self.tc_url, action['SHEET_NAME'].strip(), action['REVIEW_INFO'].strip(),
+                                      int(action.get('WORKERS', '1').strip() or '1'), action.get('MERGED', '0').strip(),
+                                      action.get('ERROR_REPORT', '0').strip())
+        if action_name == 'Link_PFS_with_PMR':
+            pass  #self.link_pfs_pmr(self.pmr_url, self.pfs_url)
+        if action_name == 'Link_PFS_with_TCs':
+            self.link_tc2pfs(action['TEAM'].strip())
+        if action_name == 'Generate_TDS':
+            self.gen_tds(self.tds_url, action['REMOVE_PREFIX'].strip(), action.get('INCREMENTAL', '0').strip())
+        if action_name == 'Link_TDS_with_TCs':
+            self.link_tc2tds(self.tds_url, self.tc_url)
+        if action_name == 'Link_TDS_with_TCs-TPs':
+            self.link_tp2tds_tc(self.tds_url, self.tc_url, action['FILTER'].strip())
+        if action_name == 'Link_TDS_with_TCs-PFS':
+            self.link_pfs2tds(self.tds_url, self.tc_url, self.pfs_url)
+        if action_name == 'Link_TCs_with_TDS':
+            self.link_tds2tc(self.tc_url, self.tds_url)
+        if action_name == 'Create_Test_Plan':
+            self.create_test_plan(self.tp_url, action['AUTO'].strip(), action['TEAM'].strip())
+        if action_name == 'Generate_TCs_from_TDS':
+            self.Generate_TCs_from_TDS(action['NODE_LIST'].strip(), action['TC_READY'].strip())
+        if action_name == 'Check_PFS_Traceablity':
+            self.chk_pfs_traceability(action['TEAM'].strip())
+        if action_name == 'Generate_PFS_TC_Traceablity':
+            self.gen_pfs_tc_traceability(action['TEAM'].strip())
+        return 0
+
+    def _get_action_files(self, action):
+        ''' Return the (input_files, output_files) of an action, or None if they are unknown.
+            A file could be a path or a (prefix, suffix) pair which matches all paths with the prefix and suffix.
+            TestLink is handled as a file as well since some actions read test plans which are created by others.
+        '''
+        action_name = action['NAME'].strip()
+        testlink_server = 'testlink:' + str(self.testlink_url)
+        tds_file = str(self.tds_url)
+        pfs_fm_file = str(self.pfs_url).replace('.xml', '.mm')
+        tc_fm_file = str(self.tc_url).replace('.xml', '.mm')
+        if action_name == 'Extract_Requirements':
+            files = ([self.requirements_url],
+                     [self.pmr_url, self.pfs_url, str(self.pmr_url).replace('.xml', '.mm'), pfs_fm_file,
+                      str(self.pfs_url).replace('.xml', '[PFS-PMR].mm'), str(self.pmr_url).replace('.xml', '[PMR-PFS].mm')])
+        elif action_name == 'Extract_TestCases':
+            # One xml file is generated for each sheet
+            files = ([self.tc_url], [(os.path.splitext(str(self.tc_url))[0], '.xml')])
+        elif action_name == 'Link_PFS_with_PMR':
+            files = ([], [])
+        elif action_name == 'Generate_TDS':
+            files = ([self.tds_url, os.path.splitext(tds_file)[0] + '.manifest.json',
+                      os.path.splitext(tds_file)[0] + '[Delta].xml', os.path.splitext(tds_file)[0] + '[Delta].manifest.json'],
+                     [self.tds_url, os.path.splitext(tds_file)[0] + '.xml', os.path.splitext(tds_file)[0] + '[Delta].xml',
+                      os.path.splitext(tds_file)[0] + '.manifest.json',
+                      os.path.splitext(tds_file)[0] + '[Delta].manifest.json'])
+        elif action_name == 'Link_TDS_with_TCs':
+            files = ([self.tds_url, self.tc_url], [tc_fm_file, self.tds_url, tds_file.replace('.mm', '[TDS-TC].mm')])
+        elif action_name == 'Link_TDS_with_TCs-TPs':
+            files = ([tds_file.replace('.mm', '[TDS-TC].mm'), testlink_server], [tds_file.replace('.mm', '[TDS-TC]-TP.mm')])
+        elif action_name == 'Link_TDS_with_TCs-PFS':
+            files = ([self.tds_url, self.tc_url, pfs_fm_file],
+                     [tc_fm_file, self.tds_url, tds_file.replace('.mm', '[TDS-TC].mm'),
+                      tds_file.replace('.mm', '[TDS-TC-PFS].mm')])
+        elif action_name == 'Link_TCs_with_TDS':
+            files = ([self.tc_url, self.tds_url], [os.path.splitext(tds_file)[0] + '_New.xml'])
+        elif action_name == 'Create_Test_Plan':
+            files = ([self.tp_url, self.based_tp_url, testlink_server],
+                     [self.tp_url, os.path.splitext(str(self.tp_url))[0] + '[Diff].json'])
+            if action['AUTO'].strip() == '1':
+                files[1].append(testlink_server)
+        elif action_name == 'Generate_TCs_from_TDS':
+            files = ([self.tds_url, self.based_tc_url], [self.tc_url, self.tds_url])
+        elif action_name == 'Check_PFS_Traceablity':
+            files = ([pfs_fm_file, self.tds_url], [str(self.pfs_url).replace('.xml', '[PFS-TDS].mm')])
+        elif action_name == 'Generate_PFS_TC_Traceablity':
+            req_file = str(self.requirements_url)
+            files = ([self.tc_url, self.requirements_url], [tc_fm_file, self._get_pfs_tc_file(req_file)])
+        else:
+            return None
+
+        res = []
+        for file_list in files:
+            file_set = set()
+            for file_name in file_list:
+                if file_name is None or file_name == 'None':
+                    continue
+                if isinstance(file_name, tuple):
+                    file_set.add((os.path.abspath(file_name[0]), file_name[1]))
+                elif file_name.startswith('testlink:'):
+                    file_set.add(file_name)
+                else:
+                    file_set.add(os.path.abspath(file_name))
+            res.append(file_set)
+        return tuple(res)
+
+    def _files_overlap(self, file_set, other_file_set):
+        if file_set & other_file_set:
+            return True
+        for file_name in file_set:
+            for other_file_name in other_file_set:
+                if isinstance(file_name, tuple) and isinstance(other_file_name, tuple):
+                    if file_name[0].startswith(other_file_name[0]) or other_file_name[0].startswith(file_name[0]):
+                        return True
+                elif isinstance(file_name, tuple):
+                    if other_file_name.startswith(file_name[0]) and other_file_name.endswith(file_name[1]):
+                        return True
+                elif isinstance(other_file_name, tuple):
+                    if file_name.startswith(other_file_name[0]) and file_name.endswith(other_file_name[1]):
+                        return True
+        return False
+
+    def _get_action_dependencies(self, actions):
+        ''' Build the dependency DAG of the actions. An action depends on all previous actions which write its inputs,
+            read its outputs or write the same outputs, so the declared order is kept for them.
+            An action with unknown files depends on all previous actions and all following actions depend on it.
+        '''
+        action_files = [self._get_action_files(action) for action in actions]
+        dependencies = []
+        for j, files in enumerate(action_files):
+            dependencies.append(set())
+            for i in range(j):
+                if files is None or action_files[i] is None or \
+                        self._files_overlap(action_files[i][1], files[0]) or \
+                        self._files_overlap(action_files[i][0], files[1]) or \
+                        self._files_overlap(action_files[i][1], files[1]):
+                    dependencies[j].add(i)
+        return dependencies
+
+    def _perform_actions(self, cfg_file, actions, workers):
+        ''' Perform the actions one by one in the declared order, or on a process pool if more workers are specified.
+            Please note a pool cannot be created in a pool worker, thus the actions are performed one by one there.
+        '''
+        if workers <= 1 or len(actions) <= 1 or multiprocessing.current_process().daemon:
+            for action in actions:
+                self._perform_action(cfg_file, action)
+            return 0
+
+        dependencies = self._get_action_dependencies(actions)
+        for i, action in enumerate(actions):
+            self.logger.info(self.log_prefix + \
+                             "Action (%s) depends on actions (%s)." % \
+                             (action['NAME'].strip(), ', '.join([actions[j]['NAME'].strip() for j in sorted(dependencies[i])])))
+
+        start_time = time.time()
+        started_queue = multiprocessing.Queue()
+        with PoolLogListener() as log_queue:
+            pool = multiprocessing.Pool(min(workers, len(actions)), _init_pool_worker, (log_queue, started_queue))
+            pending = range(len(actions))
+            finished = set()
+            failed = set()
+            lost = set()
+            # Action index -> AsyncResult of the running actions, -> time it's applied and -> process ID of its worker
+            running = {}
+            apply_times = {}
+            worker_pids = {}
+            seen_pids = set()
+            while pending or running:
+                for i in list(pending):
+                    if dependencies[i] & failed:
+                        self.logger.error(self.log_prefix + \
+                                          "Action (%s) is skipped since the actions it depends on failed." % \
+                                          (actions[i]['NAME'].strip()))
+                        failed.add(i)
+                        pending.remove(i)
+                    elif dependencies[i] <= finished:
+                        running[i] = pool.apply_async(_perform_action_in_worker, (cfg_file, i))
+                        apply_times[i] = time.time()
+                        pending.remove(i)
+                if not running:
+                    continue
+                # The results are polled with a short timeout, thus the waiting can still be interrupted by Ctrl+C and
+                # the action of a worker which died (e.g. killed or crashed) is not waited for forever.
+                running.values()[0].wait(0.1)
+                try:
+                    while True:
+                        i, pid = started_queue.get_nowait()
+                        worker_pids[i] = pid
+                except Queue.Empty:
+                    pass
+                alive_pids = set([process.pid for process in pool._pool if process.exitcode is None])
+                seen_pids |= alive_pids
+                for i, result in running.items():
+                    if result.ready():
+                        elapsed_time, error = result.get()[1:]
+                    elif worker_pids.has_key(i) and worker_pids[i] in seen_pids - alive_pids and not result.wait(1):
+                        # The pool replaces the dead worker, but the action in it is lost
+                        elapsed_time, error = time.time() - apply_times[i], \
+                                              "The worker process (%d) exited unexpectedly." % (worker_pids[i])
+                        lost.add(i)
+                    else:
+                        continue
+                    del running[i]
+                    if error is None:
+                        finished.add(i)
+                        self.logger.info(self.log_prefix + \
+                                         "Action (%s) finished in %.1f seconds." % \
+                                         (actions[i]['NAME'].strip(), elapsed_time))
+                    else:
+                        failed.add(i)
+                        self.logger.error(self.log_prefix + \
+                                          "Action (%s) failed in %.1f seconds: %s" % \
+                                          (actions[i]['NAME'].strip(), elapsed_time, error))
+            if lost:
+                # A closed pool is never joined while the results of the lost actions are outstanding
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+        self.logger.info(self.log_prefix + \
+                         "Performed %d actions with %d workers in %.1f seconds, %d actions failed or skipped." % \
+                         (len(actions), workers, time.time() - start_time, len(failed)))
+        if failed:
+            return -1
         return 0
 
     def _get_url(self, file_location, file_name):
@@ -210,13 +1761,31 @@ class FreeMind(object):
 
         return res
 
+    def _parse_xml(self, file_name, flavour='et', readonly=False):
+        ''' Parse the xml file through the document cache. flavour is 'et', 'cet' or 'lxml'.
+            The tree is shared with the cache if readonly is True, thus it must not be updated then.
+        '''
+        return self.doc_cache.parse(file_name, flavour, readonly)
+
+    def _write_xml(self, tree, file_name, flavour='et'):
+        ''' Write the tree to file_name and keep it in the document cache, the tree must not be updated afterwards '''
+        self.doc_cache.write(tree, file_name, flavour)
+        return 0
+
+    def _get_node_classifier(self):
+        ''' The classifier (and its cache) is shared by all actions as long as the TestLink url and prefix are same '''
+        if self.node_classifier is None or self.node_classifier.testlink_url <> self.testlink_url or \
+                self.node_classifier.repo_prefix <> self.repo_prefix:
+            self.node_classifier = NodeClassifier(self.testlink_url, self.repo_prefix)
+        return self.node_classifier
+
     def parse_freemind(self, file_name):
-        self.fm_tree = ET.parse(file_name)
+        self.fm_tree = self._parse_xml(file_name)
         self.fm_file = file_name
         return 0
 
     def _gen_freemind(self):
-        self.fm_tree.write(os.path.splitext(self.fm_file)[0] + "_New.mm")
+        self._write_xml(self.fm_tree, os.path.splitext(self.fm_file)[0] + "_New.mm")
         return 0
 
     def add_prefix(self, file_name):
@@ -231,57 +1800,158 @@ class FreeMind(object):
         self._gen_freemind()
         return 0
 
-    def gen_tds(self, file_name, remove_prefix):
-        tds_item_list = ['TDS', []]
-        fm_tree = ET.parse(file_name)
+    def gen_tds(self, file_name, remove_prefix, incremental='0'):
+        ''' Generate the TDS xml file for importing to TestLink from the TDS FreeMind file.
+            A manifest (TDS item ID -> prefix, hash of the content) of the TDS items imported into TestLink is kept
+            beside the FreeMind file. In incremental mode only the added, changed and removed (obsolete) TDS items
+            since the imported manifest are written into the delta file ([Delta].xml), and the manifest of the delta
+            is kept as [Delta].manifest.json until the delta file is imported. The delta file is to be deleted once
+            it's imported, the next run then takes the manifest of the delta as the imported manifest. Thus a delta
+            file which is not imported yet is merged into the next one.
+            The FreeMind file is only written if it's changed.
+        '''
+        tds_group = RequirementGroup('TDS')
+        fm_tree = self._parse_xml(file_name)
         tds_root = fm_tree.getroot()
         #Firstly remove all prefix hence we will number them again.
-        self._remove_node_prefix(tds_root)
+        changed_nodes = self._remove_node_prefix(tds_root)
 
         self.logger.info(self.log_prefix + \
                          "Read TDS file (%s) and get the information of last nodes which will be used to generate the xml file for importing to TestLink" % \
                          (file_name))
-        self._get_tds_items(tds_root, '0', '', tds_item_list[1])
+        tds_analysis = TdsMapAnalysis(tds_root, self._get_node_classifier())
+        self._get_tds_items(tds_root, '0', '', tds_group.items, tds_analysis)
 
-        filename = os.path.splitext(file_name)[0] + '.xml'
         title = os.path.splitext(os.path.split(file_name)[-1])[0]
-        self._gen_req_xml([tds_item_list], title, filename, self.tds_prefix)
+        manifest_file = os.path.splitext(file_name)[0] + '.manifest.json'
+        delta_file = os.path.splitext(file_name)[0] + '[Delta].xml'
+        delta_manifest_file = os.path.splitext(file_name)[0] + '[Delta].manifest.json'
+        if os.path.exists(delta_manifest_file) and not os.path.exists(delta_file):
+            # The delta file of the last run is imported (and deleted), its TDS items are imported now
+            self._write_tds_manifest(manifest_file, self._read_tds_manifest(delta_manifest_file))
+            os.remove(delta_manifest_file)
+        old_manifest = self._read_tds_manifest(manifest_file)
+        manifest = self._get_tds_manifest(tds_group.items)
+        if incremental == '1' and old_manifest is not None:
+            res = self._gen_tds_delta_xml(tds_group.items, manifest, old_manifest, title, delta_file)
+            if os.path.exists(delta_file):
+                self._write_tds_manifest(delta_manifest_file, manifest)
+            elif os.path.exists(delta_manifest_file):
+                os.remove(delta_manifest_file)
+        else:
+            filename = os.path.splitext(file_name)[0] + '.xml'
+            self._gen_req_xml([tds_group], title, filename, self.tds_prefix)
+            if manifest != old_manifest:
+                self._write_tds_manifest(manifest_file, manifest)
+            # All TDS items are in the xml file, thus a delta file not imported yet is out of date
+            for out_of_date_file in [delta_file, delta_manifest_file]:
+                if os.path.exists(out_of_date_file):
+                    os.remove(out_of_date_file)
+
+        changed_nodes += self._update_pfs_node_format(tds_root)
+        if remove_prefix == '1':
+            changed_nodes += self._remove_node_prefix(tds_root)
 
-        self._update_pfs_node_format(tds_root)
-        fm_tree.write(file_name)
+        if changed_nodes > 0:
+            self._write_xml(fm_tree, file_name)
+        else:
+            self.logger.info(self.log_prefix + \
+                             "TDS file (%s) is not changed, thus it's not written again." % \
+                             (file_name))
 
-        if remove_prefix == '1':
-            self._remove_node_prefix(tds_root)
-            fm_tree.write(file_name)
+        return 0
+
+    def _get_tds_manifest(self, item_list):
+        manifest = OrderedDict()
+        for item in item_list:
+            content = PREFIX_TITLE_SEP.join([item.title, item.desc, item.ver_team])
+            if isinstance(content, unicode):
+                content = content.encode('utf-8')
+            manifest[item.req_id] = {'prefix': item.prefix,
+                                     'hash': hashlib.md5(content).hexdigest(),
+                                     'title': item.title}
+        return manifest
+
+    def _read_tds_manifest(self, manifest_file):
+        if not os.path.exists(manifest_file):
+            return None
+        f = open(manifest_file, 'r')
+        manifest = json.load(f, object_pairs_hook=OrderedDict)
+        f.close()
+        return manifest
 
+    def _write_tds_manifest(self, manifest_file, manifest):
+        f = open(manifest_file, 'w')
+        json.dump(manifest, f, indent=1)
+        f.close()
+        self.logger.info(self.log_prefix + \
+                         "TDS manifest file (%s) is updated with %d TDS items." % \
+                         (manifest_file, len(manifest)))
         return 0
 
-    def _get_tds_items(self, node, num, desc, item_list):
+    def _gen_tds_delta_xml(self, item_list, manifest, old_manifest, title, filename):
+        ''' Write the TDS items which are added, changed or removed since the imported manifest into the delta file.
+            The removed TDS items are written with the obsolete status, thus they are not lost in TestLink.
+            The delta file is deleted if there is no such TDS item, thus an out of date one is not imported again.
+        '''
+        delta_list = []
+        status_dict = {}
+        for item in item_list:
+            if not old_manifest.has_key(item.req_id):
+                delta_list.append(item)
+                self.logger.info(self.log_prefix + \
+                                 "TDS item (%s) is added." % \
+                                 (item.title))
+            elif old_manifest[item.req_id]['hash'] <> manifest[item.req_id]['hash']:
+                delta_list.append(item)
+                self.logger.info(self.log_prefix + \
+                                 "TDS item (%s) is changed." % \
+                                 (item.title))
+        for node_id, old_item in old_manifest.iteritems():
+            if manifest.has_key(node_id):
+                continue
+            delta_list.append(TdsItem(node_id, old_item['title'], old_item['title']))
+            status_dict[node_id] = 'O'
+            self.logger.info(self.log_prefix + \
+                             "TDS item (%s) is removed." % \
+                             (old_item['title']))
+
+        if delta_list == []:
+            if os.path.exists(filename):
+                os.remove(filename)
+            self.logger.info(self.log_prefix + \
+                             "No TDS item is changed since the last import, the delta file (%s) is not generated." % \
+                             (filename))
+            return 0
+        return self._gen_req_xml([RequirementGroup('TDS', delta_list)], title, filename, self.tds_prefix, status_dict=status_dict)
+
+    def _get_tds_items(self, node, num, desc, item_list, tds_analysis):
         res = 0
         i = 0
         prefix = ''
         content = ''
         for child in node:
             if child.tag == 'node':
-                if child.attrib.has_key('LINK') and child.attrib['LINK'].startswith(self.testlink_url):
+                if tds_analysis.is_link(child):
                     continue
                 i += 1
                 prefix = str(num) + '.' + str(i)
                 node_id = child.attrib['ID']
                 content = desc + '|' + child.attrib['TEXT']
                 # If this is the last TDS node
-                if self._last_tds_node(child):
+                if tds_analysis.is_tds_item(child):
                     # Keep the TDS title as long as possible to about 100 characters (limitation in TestLink)
                     item_list.append(
-                        [node_id, prefix[4:] + PREFIX_TITLE_SEP + '|'.join(content[-100:].split('|')[2:]), \
-                         prefix[4:] + PREFIX_TITLE_SEP + '|'.join(content.split('|')[2:]), 'SIT'])
+                        TdsItem(node_id, prefix[4:] + PREFIX_TITLE_SEP + '|'.join(content[-100:].split('|')[2:]), \
+                                prefix[4:] + PREFIX_TITLE_SEP + '|'.join(content.split('|')[2:])))
                     continue
-                self._get_tds_items(child, prefix, content, item_list)
+                self._get_tds_items(child, prefix, content, item_list, tds_analysis)
 
         return res
 
-    def _gen_req_xml(self, item_list, doc_title, filename, prefix, relation_list=None):
-        ''' item_list is a list like [GROUP_NAME, [ [REQ_ID, REQ_TITLE, REQ_DESC, REQ_VER_TEAM], ... ] ]
+    def _gen_req_xml(self, item_list, doc_title, filename, prefix, relation_graph=None, status_dict=None):
+        ''' item_list is a list of RequirementGroup.
+            status_dict is requirement ID -> status for the requirements which are not valid ('V'), e.g. obsolete ('O').
         '''
         res = 0
 
@@ -289,85 +1959,27 @@ class FreeMind(object):
                          "Generating the xml file %s (Document Title: %s. Document ID Prefix: %s) for importing to TestLink." % \
                          (filename, doc_title, prefix))
 
-        tds = ET.Element('requirement-specification')
-        #title = ''.join(self.fm_file.split('.')[:-1])
-        req_spec = ET.SubElement(tds, 'req_spec', {'title': doc_title, 'doc_id': doc_title})
-        req_type = ET.SubElement(req_spec, 'type')
-        req_type.append(CDATA(2))
-        node_order = ET.SubElement(req_spec, 'node_order')
-        node_order.append(CDATA(1))
-        total_req = ET.SubElement(req_spec, 'total_req')
-        total_req.append(CDATA(0))
-        scope = ET.SubElement(req_spec, 'scope')
-        scope.append(CDATA(''))
-
-        #pprint.pprint(item_list)
-        i = 0
-        for group in item_list:
-            for item in group[1]:
-                i = i + 1
-                requirement = ET.SubElement(req_spec, 'requirement')
-                docid = ET.SubElement(requirement, 'docid')
-                docid.append(CDATA(prefix + item[REQ_ID]))
-                title = ET.SubElement(requirement, 'title')
-                title.append(CDATA(item[REQ_TITLE]))
-                node_order = ET.SubElement(requirement, 'node_order')
-                node_order.append(CDATA(i))
-                description = ET.SubElement(requirement, 'description')
-                description.append(CDATA('<p>' + item[REQ_DESC].replace('\n', '</p><p>') + '</p>'))
-                status = ET.SubElement(requirement, 'status')
-                status.append(CDATA('V'))
-                req_type = ET.SubElement(requirement, 'type')
-                req_type.append(CDATA(2))
-                expected_coverage = ET.SubElement(requirement, 'expected_coverage')
-                expected_coverage.append(CDATA(1))
-                custom_fields = ET.SubElement(requirement, 'custom_fields')
-                custom_field = ET.SubElement(custom_fields, 'custom_field')
-                name = ET.SubElement(custom_field, 'name')
-                name.append(CDATA('HGI Req Verification Team'))
-                value = ET.SubElement(custom_field, 'value')
-                ver_team = item[REQ_VER_TEAM].split('\n')
-                if len(ver_team) == 1:
-                    ver_team = item[REQ_VER_TEAM].split(' ')
-                if len(ver_team) == 1:
-                    ver_team = item[REQ_VER_TEAM].split(',')
-                if len(ver_team) == 1:
-                    ver_team = item[REQ_VER_TEAM].split('|')
-                if len(ver_team) == 1:
-                    ver_team = item[REQ_VER_TEAM].split(';')
-                ver_team = '|'.join(ver_team)
-                value.append(CDATA(ver_team))
-
-                if len(item) > REQ_COMMENT:
-                    custom_field = ET.SubElement(custom_fields, 'custom_field')
-                    name = ET.SubElement(custom_field, 'name')
-                    name.append(CDATA('HGI Req Review Comments'))
-                    value = ET.SubElement(custom_field, 'value')
-                    value.append(CDATA(item[REQ_COMMENT]))
-                    custom_field = ET.SubElement(custom_fields, 'custom_field')
-                    name = ET.SubElement(custom_field, 'name')
-                    name.append(CDATA('HGI Feature Phase'))
-                    value = ET.SubElement(custom_field, 'value')
-                    value.append(CDATA(item[REQ_PHASE]))
-
-        if relation_list is not None:
-            for relation_src in relation_list:
-                for relation_dst in relation_src[1]:
-                    relation = ET.SubElement(req_spec, 'relation')
-                    source = ET.SubElement(relation, 'source')
-                    source.text = relation_src[0]
-                    destination = ET.SubElement(relation, 'destination')
-                    destination.text = relation_dst
-                    relation_type = ET.SubElement(relation, 'type')
-                    relation_type.text = '1'
-
-        rough_string = ET.tostring(tds, 'utf-8')
-        #print rough_string
-        reparsed = minidom.parseString(rough_string)
-        f = open(filename, 'w')
-        #reparsed.writexml(f, newl='\n', encoding='utf-8')
-        reparsed.writexml(f, encoding='utf-8')
-        f.close()
+        with ReqSpecWriter(filename, doc_title) as writer:
+            i = 0
+            for group in item_list:
+                for item in group.items:
+                    i = i + 1
+                    status = 'V'
+                    if status_dict is not None and status_dict.has_key(item.req_id):
+                        status = status_dict[item.req_id]
+                    custom_fields = [('HGI Req Verification Team', item.ver_teams)]
+                    if item.comment is not None:
+                        custom_fields.append(('HGI Req Review Comments', item.comment))
+                        custom_fields.append(('HGI Feature Phase', item.phase))
+                    writer.write_requirement(prefix + item.req_id, item.title, i,
+                                             '<p>' + item.desc.replace('\n', '</p><p>') + '</p>', status,
+                                             custom_fields)
+
+            if relation_graph is not None:
+                for relation_src in relation_graph.items():
+                    for relation_dst in relation_src[1]:
+                        writer.write_relation(relation_src[0], relation_dst)
+        self.doc_cache.invalidate(filename)
 
         self.logger.info(self.log_prefix + \
                          "xml file %s was generated successfully." % \
@@ -375,39 +1987,36 @@ class FreeMind(object):
         return res
 
     def link_pfs2tds(self, tds_url, tc_url, pfs_url):
-        tc_req_list = []
-        req_tc_list = []
+        tc_req_graph = TraceabilityGraph()
         res = None
 
-        res = self.link_tc2tds(tds_url, tc_url, tc_req_list, req_tc_list)
+        res = self.link_tc2tds(tds_url, tc_url, tc_req_graph)
 
-        #pprint.pprint(tc_req_list)
+        #pprint.pprint(tc_req_graph.items())
         pfs_file = os.path.splitext(self.pfs_url)[0] + '.mm'
         tds_tc_file = self.tds_url.replace('.mm', '[TDS-TC].mm')
-        res = self._build_fm_traceability(tds_tc_file, pfs_file, tc_req_list,
+        res = self._build_fm_traceability(tds_tc_file, pfs_file, tc_req_graph,
                                           self.tds_url.replace('.mm', '[TDS-TC-PFS].mm'))
 
         return res
 
-    def link_tc2tds(self, tds_file, tc_file, tc_req_list=None, req_tc_list=None):
-        if tc_req_list == None:
-            tc_req_list = []
-        if req_tc_list == None:
-            req_tc_list = []
+    def link_tc2tds(self, tds_file, tc_file, tc_req_graph=None):
+        if tc_req_graph == None:
+            tc_req_graph = TraceabilityGraph()
 
         tc_fm_file = tc_file.replace('.xml', '.mm')
-        res = self._read_tc_from_xml(tc_file, tc_fm_file, tc_req_list)
-        res = self._reverse_links(tc_req_list, req_tc_list)
-        #pprint.pprint(req_tc_list)
+        res = self._read_tc_from_xml(tc_file, tc_fm_file, tc_req_graph)
+        req_tc_graph = self._reverse_links(tc_req_graph)
+        #pprint.pprint(req_tc_graph.items())
 
-        fm_tree = ET.parse(tds_file)
+        fm_tree = self._parse_xml(tds_file)
         fm_root = fm_tree.getroot()
         #self._remove_node_prefix(fm_root)
         #self._add_node_prefix(fm_root, '0')
         #self._remove_link_node(fm_root)
-        fm_tree.write(tds_file)
-        #pprint.pprint(req_tc_list)
-        res = self._build_fm_traceability(tds_file, tc_fm_file, req_tc_list, tds_file.replace('.mm', '[TDS-TC].mm'),
+        self._write_xml(fm_tree, tds_file)
+        #pprint.pprint(req_tc_graph.items())
+        res = self._build_fm_traceability(tds_file, tc_fm_file, req_tc_graph, tds_file.replace('.mm', '[TDS-TC].mm'),
                                           True)
 
         return res
@@ -433,43 +2042,32 @@ class FreeMind(object):
 
         return None
 
-    def _read_tc_from_xml(self, xml_file, fm_file, tc_req_list):
-        tc_tree = xmlcET.parse(xml_file)
-        tc_root = tc_tree.getroot()
-
-        # Build the FreeMind for test case
+    def _read_tc_from_xml(self, xml_file, fm_file, tc_req_graph):
+        # Build the FreeMind for test case and construct the traceability list between Test cases and
+        # Requirements/Test Design Specification while streaming the file only once.
         title = os.path.splitext(os.path.split(xml_file)[-1])[0]
-        res = self._gen_tc_freemind(xml_file, title, fm_file)
-        # Construct the traceability list between Test cases and Requirements/Test Design Specification  
-        self.logger.info(self.log_prefix + \
-                         "Getting traceability information from file %s" % \
-                         (xml_file))
-        prefix_list = [self.pmr_prefix, self.tds_prefix]
-        #Could be multiple PFS prefix since some requirements will be reused between projects.
-        prefix_list.extend(self.pfs_prefix.split('|'))
-        for tc in tc_root.iter('testcase'):
-            req_links = []
-            tc_id = self.repo_prefix + '-' + str(tc.find('externalid').text)
-            for req in tc.iter('requirement'):
-                doc_id = req.find('doc_id').text
-
-                for prefix in prefix_list:
-                    # Check if this is a valid requirement/TDS for this project
-                    if len(doc_id.split(prefix)) == 2:
-                        req_links.append(doc_id.split(prefix)[1])
-                        break
-            # Please note the tc_id here is with the project prefix, and the req_id is without requirement prefix
-            tc_req_list.append([tc_id, req_links])
-
+        res = self._gen_tc_freemind(xml_file, title, fm_file, tc_req_graph)
         return res
 
-    def _gen_tc_freemind(self, tc_file, title, output_file):
-        ''' req_list is a list like [GROUP_NAME, [ [REQ_ID, REQ_TITLE, REQ_DESC, REQ_VER_TEAM], ... ] ]
-            REQ_ID and REQ_TITLE will be combined as the node text and REQ_DESC will be displayed as comments
-        '''
-        tc_tree = xmlcET.parse(tc_file)
-        tc_root = tc_tree.getroot()
+    def _add_tc_req_traceability(self, record, prefix_list, tc_req_graph):
+        req_links = []
+        tc_id = self.repo_prefix + '-' + str(record.externalid)
+        for doc_id in record.requirements:
+            if doc_id is None:
+                continue
+            for prefix in prefix_list:
+                # Check if this is a valid requirement/TDS for this project
+                if len(doc_id.split(prefix)) == 2:
+                    req_links.append(doc_id.split(prefix)[1])
+                    break
+        # Please note the tc_id here is with the project prefix, and the req_id is without requirement prefix
+        tc_req_graph.add_links(tc_id, req_links)
+        return 0
 
+    def _gen_tc_freemind(self, tc_file, title, output_file, tc_req_graph=None):
+        ''' Stream the test cases of tc_file into a FreeMind file, the test suites are kept as folder nodes.
+            If tc_req_graph is given, the traceability between test cases and requirements is added into it.
+        '''
         freemind = ET.Element('map', {'version': '1.0.1'})
 
         ET.SubElement(freemind, 'attribute_registry', {'SHOW_ATTRIBUTES': 'hide'})
@@ -477,260 +2075,260 @@ class FreeMind(object):
         ET.SubElement(root_node, 'font', {'NAME': 'SansSerif', 'SIZE': '20'})
         ET.SubElement(root_node, 'hook', {'NAME': 'accessories/plugins/AutomaticLayout.properties'})
 
-        self._add_tc_details(tc_root, root_node)
-        ET.ElementTree(freemind).write(output_file)
+        if tc_req_graph is not None:
+            self.logger.info(self.log_prefix + \
+                             "Getting traceability information from file %s" % \
+                             (tc_file))
+        prefix_list = [self.pmr_prefix, self.tds_prefix]
+        #Could be multiple PFS prefix since some requirements will be reused between projects.
+        prefix_list.extend(self.pfs_prefix.split('|'))
+
+        # Test suite nodes in FreeMind indexed by the unique suite ids from the reader
+        suite_nodes = {(): root_node}
+        for item_type, item, suite_ids in TestCaseReader(tc_file).iter_items():
+            if item_type == 'testsuite':
+                #add a node in Freemind for the test suite
+                testsuite_node = ET.SubElement(suite_nodes[suite_ids[:-1]], 'node',
+                                               {'COLOR': '#990000', 'FOLDED': "true", 'TEXT': item[-1]})
+                ET.SubElement(testsuite_node, 'icon', {'BUILTIN': 'folder'})
+                suite_nodes[suite_ids] = testsuite_node
+                continue
+            self._add_tc_details(item, suite_nodes[item.suite_ids])
+            if tc_req_graph is not None:
+                self._add_tc_req_traceability(item, prefix_list, tc_req_graph)
+
+        self._write_xml(ET.ElementTree(freemind), output_file)
         self.logger.info(self.log_prefix + \
                          "Successfully generate test case FreeMind file %s" % \
                          (output_file))
         return 0
 
-    def _add_tc_details(self, tc_root, fm_root):
-        for child in tc_root:
-            if child.tag == 'testsuite':
-                #add a node in Freemind and call again.
-                testsuite_node = ET.SubElement(fm_root, 'node',
-                                               {'COLOR': '#990000', 'FOLDED': "true", 'TEXT': child.attrib['name']})
-                ET.SubElement(testsuite_node, 'icon', {'BUILTIN': 'folder'})
-                self._add_tc_details(child, testsuite_node)
-                continue
-            if child.tag == 'testcase':
-                #add a node in Freemind
-                valid_tc = False
-                node_comment = ''
-                node_text = child.attrib['name']
-                expected_results = ''
-                tc_id = ''
-                regression_level = ''
-                for item in child:
-                    if item.tag == 'externalid':
-                        tc_id = str(item.text)
-                        node_text = self.repo_prefix + '-' + tc_id + PREFIX_TITLE_SEP + node_text
-                    if item.tag == 'summary':
-                        node_comment = '<p>Summary:</p>' + str(item.text) + '<p></p>'
-                    if item.tag == 'preconditions':
-                        node_comment = node_comment + '<p>Preconditions:</p>' + str(item.text) + '<p></p>'
-                    if item.tag == 'steps':
-                        node_comment = node_comment + '<p>Steps:</p>'
-                        expected_results = '<p>Expected results:</p>'
-                        for step in item.iter():
-                            if step.tag == 'step_number':
-                                node_comment = node_comment + '<p>' + step.text + '.'
-                                expected_results = expected_results + '<p>' + step.text + '.'
-                            if step.tag == 'actions':
-                                node_comment = node_comment + str(step.text).replace('<p>', '', 1)
-                            if step.tag == 'expected_results':
-                                expected_results = expected_results + str(step.text).replace('<p>', '', 1)
-                    if item.tag == 'custom_fields':
-                        for custom_field in item:
-                            if list(custom_field)[0].text == 'HGI Regression Level':
-                                if list(custom_field)[1].text is None:
-                                    regression_level = 0
-                                else:
-                                    regression_level = 6 - len(list(custom_field)[1].text.split('|'))
-                                    #Enable this once the test case is linked with requirements
-                                    #                    if item.tag == 'requirements':
-                                    #                        for requirement in item:
-                                    #                            doc_id = list(requirement)[1].text
-                                    #                            for prefix in [self.pfs_prefix, self.pmr_prefix, self.tds_prefix]:
-                                    #                                if len(doc_id.split(prefix)) == 2:
-                                    #                                    valid_tc = True
-                                    #                                    break
-                                    #                if not valid_tc:
-                                    #                    continue
-                node_comment = node_comment + '<p></p>' + expected_results
-                node_link = self.testlink_url + '/linkto.php?tprojectPrefix=' + self.repo_prefix + '&item=testcase&id=' + self.repo_prefix + '-' + tc_id
-                tc_node = ET.SubElement(fm_root, 'node', {'COLOR': '#990000', 'LINK': node_link, 'TEXT': node_text})
-                richcontent = ET.SubElement(tc_node, 'richcontent', {'TYPE': 'NOTE'})
-                html = ET.SubElement(richcontent, 'html')
-                ET.SubElement(richcontent, 'head')
-                body = ET.SubElement(html, 'body')
-                for section in node_comment.replace('</p>', '').split('<p>'):
-                    comment = ET.SubElement(body, 'p')
-                    comment.text = section
-
-                ET.SubElement(tc_node, 'icon', {'BUILTIN': 'full-' + str(regression_level)})
+    def _add_tc_details(self, record, fm_root):
+        ''' Add a test case record from TestCaseReader as a node in FreeMind '''
+        node_comment = ''
+        node_text = record.name
+        expected_results = ''
+        tc_id = ''
+        regression_level = ''
+        if record.externalid is not None:
+            tc_id = str(record.externalid)
+            node_text = self.repo_prefix + '-' + tc_id + PREFIX_TITLE_SEP + node_text
+        if record.summary is not None:
+            node_comment = '<p>Summary:</p>' + record.summary + '<p></p>'
+        if record.preconditions is not None:
+            node_comment = node_comment + '<p>Preconditions:</p>' + record.preconditions + '<p></p>'
+        if record.steps is not None:
+            node_comment = node_comment + '<p>Steps:</p>'
+            expected_results = '<p>Expected results:</p>'
+            for step in record.steps:
+                if step.step_number is not None:
+                    node_comment = node_comment + '<p>' + step.step_number + '.'
+                    expected_results = expected_results + '<p>' + step.step_number + '.'
+                if step.actions is not None:
+                    node_comment = node_comment + step.actions.replace('<p>', '', 1)
+                if step.expectedresults is not None:
+                    expected_results = expected_results + step.expectedresults.replace('<p>', '', 1)
+        if record.custom_fields.has_key('HGI Regression Level'):
+            if record.custom_fields['HGI Regression Level'] is None:
+                regression_level = 0
+            else:
+                regression_level = 6 - len(record.custom_fields['HGI Regression Level'].split('|'))
+        node_comment = node_comment + '<p></p>' + expected_results
+        node_link = self.testlink_url + '/linkto.php?tprojectPrefix=' + self.repo_prefix + '&item=testcase&id=' + self.repo_prefix + '-' + tc_id
+        tc_node = ET.SubElement(fm_root, 'node', {'COLOR': '#990000', 'LINK': node_link, 'TEXT': node_text})
+        richcontent = ET.SubElement(tc_node, 'richcontent', {'TYPE': 'NOTE'})
+        html = ET.SubElement(richcontent, 'html')
+        ET.SubElement(richcontent, 'head')
+        body = ET.SubElement(html, 'body')
+        for section in node_comment.replace('</p>', '').split('<p>'):
+            comment = ET.SubElement(body, 'p')
+            comment.text = section
+
+        ET.SubElement(tc_node, 'icon', {'BUILTIN': 'full-' + str(regression_level)})
         return 0
 
-    def link_tds2tc(self, fm_file, tc_file):
-        test_suite = []
-        tc_tds_list = []
-        tc_pfs_list = []
-
-        #res = self._read_tc_from_xml(tc_file, test_suite, tc_tds_list, tc_pfs_list)
-        #res = self._gen_tc_freemind(test_suite)
-
-        # res = self._link_tds_tc(self.tds_url)
-        # res = self._link_tds_pfs()
-        # res = self._link_pfs_tc()
+    def _get_xml_start_tag(self, elem):
+        attrib = ''
+        for key, value in elem.attrib.items():
+            attrib += ' %s=%s' % (key, quoteattr(value))
+        text = '<%s%s>' % (elem.tag, attrib)
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        return text
 
+    def link_tds2tc(self, fm_file, tc_file):
         self.fm_file = fm_file
         tds_title = os.path.split(os.path.splitext(self.fm_file)[0])[1]
-        self.fm_tree = xmlcET.parse(fm_file)
+        self.fm_tree = self._parse_xml(fm_file, 'cet', readonly=True)
         fm_root = self.fm_tree.getroot()
 
-        #parser = lxmlET.XMLParser(False)
-        self.tc_file = tc_file
-        self.tc_tree = ET.parse(tc_file)
-        tc_root = self.tc_tree.getroot()
-
-        # Firstly put all test cases with requirements/TDS links into a list
+        # Firstly put all test cases with requirements/TDS links into a list and index it by test case id
         link_list = []
         self._get_link_node(fm_root, link_list)
-        #pprint.pprint(link_list)
-
-        #Secondly loop through all test cases and add the TDS linkage in
-        for tc in tc_root.iter('testcase'):
-            tc_name = tc.get('name')
-            tc_id = tc.find('externalid').text
-            for tds_link in link_list:
-                if tc_id == tds_link[0].split('-')[-1]:
-                    if 1:
-                        tds_link_found = False
-                        for req in tc.iter('requirement'):
-                            if (req.find('req_spec_title').text == tds_title) and \
-                                    (req.find('doc_id').text.split('_')[-1] == tds_link[3]):
-                                tds_link_found = True
-                                break
-                        if not tds_link_found:
-                            requirements = tc.find('requirements')
-                            if requirements == None:
-                                requirements = ET.SubElement(tc, 'requirements')
-                            link_item = ET.SubElement(requirements, 'requirement')
-                            req_spec_title = ET.SubElement(link_item, 'req_spec_title')
-                            #req_spec_title.text = lxmlET.CDATA(tds_title)
-                            req_spec_title.append(CDATA(tds_title))
-                            doc_id = ET.SubElement(link_item, 'doc_id')
-                            doc_id.append(CDATA(tds_link[2]))
-                            #                            self.logger.info(self.log_prefix + \
-                            #                                "Add TDS link (%s) in test case (%s:%s)" % \
-                            #                                (tds_link[3], tc_id, tc_name)
-
-                            #        filename = os.path.splitext(self.tc_file)[0] + "_New.xml"
-                            #        rough_string = ET.tostring(tc_root, 'utf-8')
-                            #        reparsed = minidom.parseString(rough_string)
-                            #        f= open(filename, 'w')
-                            #        reparsed.writexml(f, addindent='  ', newl='\n',encoding='utf-8')
-                            #        f.close()
-
-        self.tc_tree.write(os.path.splitext(self.tc_file)[0] + "_New.xml")
-        return 0
+        tc_link_dict = {}
+        for tds_link in link_list:
+            tc_link_dict.setdefault(tds_link.tc_number, []).append(tds_link)
 
-    #    def create_test_plan(self, tp_url, based_tp_url, auto_sync, ver_team):
-    #        ''' The inputs could be TDS aided test planning, Test Suites aided test planning or PFS aided test planning.
-    #
-    #        '''
-    #        removed_tc_list = []
-    #        tc_list = []
-    #        new_tc_list = []
-    #        fm_tree = ET.parse(tp_url)
-    #        tp_root = fm_tree.getroot()
-    #        based_tp_root = ET.parse(based_tp_url).getroot()
-    #        #Firstly we need to go through the based test plan to see if there any node or test cases are removed from the based test plan.
-    #        res = self._find_removed_tc(based_tp_root, tp_root, removed_tc_list)
-    #        pprint.pprint(removed_tc_list)
-    #        #Secondly we need to go through the new test plan and remove all the test cases based on information above, regression levels and verification teams.
-    #        res = self._update_tp(tp_root, ver_team, removed_tc_list)
-    #        #Remove the nodes without any test case
-    #        res = self._remove_node_wo_tc(tp_root)
-    #        #Get test case list
-    #        res = self._get_fm_tc_list(tp_root, tc_list)
-    #        #Remove duplicate test cases in list
-    #        res = self._remove_duplicate(tc_list, new_tc_list)
-    #        pprint.pprint(new_tc_list)
-    #        #Generate the test plan for importing to TestLink
-    #        # platform, name, id, version, order
-    #
-    #        #Create the test plan
-    #        if auto_sync == '1':
-    #            tp_name = os.path.split(os.path.splitext(tp_url)[0])[-1]
-    #            res = self._create_test_plan_in_tl(tp_name, new_tc_list)
-    #
-    #        return res
+        #Secondly stream all test cases, add the TDS linkage in and write them out one by one
+        self.tc_file = tc_file
+        output_file = os.path.splitext(self.tc_file)[0] + "_New.xml"
+        f = open(output_file, 'w')
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        for event, elem in TestCaseReader(tc_file).iter_elements():
+            if event == 'start':
+                f.write(self._get_xml_start_tag(elem) + '\n')
+                continue
+            if event == 'end':
+                f.write('</%s>\n' % (elem.tag))
+                continue
+            if elem.tag == 'testcase':
+                tc_id = elem.findtext('externalid')
+                for tds_link in tc_link_dict.get(tc_id, []):
+                    tds_link_found = False
+                    for req in elem.iter('requirement'):
+                        if (req.findtext('req_spec_title') == tds_title) and \
+                                (str(req.findtext('doc_id')).split('_')[-1] == tds_link.tds_number):
+                            tds_link_found = True
+                            break
+                    if not tds_link_found:
+                        requirements = elem.find('requirements')
+                        if requirements is None:
+                            requirements = lxmlET.SubElement(elem, 'requirements')
+                        link_item = lxmlET.SubElement(requirements, 'requirement')
+                        lxmlET.SubElement(link_item, 'req_spec_title').text = lxmlET.CDATA(tds_title)
+                        lxmlET.SubElement(link_item, 'doc_id').text = lxmlET.CDATA(tds_link.tds_id)
+            f.write(lxmlET.tostring(elem, encoding='UTF-8', xml_declaration=False, with_tail=False) + '\n')
+        f.close()
+        self.doc_cache.invalidate(output_file)
+        return 0
 
     def gen_pfs_tc_traceability(self, ver_team):
-        tc_req_list = []
-        req_tc_list = []
+        tc_req_graph = TraceabilityGraph()
         tc_fm_file = self.tc_url.replace('.xml', '.mm')
-        res = self._read_tc_from_xml(self.tc_url, tc_fm_file, tc_req_list)
-        res = self._reverse_links(tc_req_list, req_tc_list)
-        #pprint.pprint(req_tc_list)
-        self._update_pfs_with_tc_traceability(self.requirements_url, req_tc_list)
+        res = self._read_tc_from_xml(self.tc_url, tc_fm_file, tc_req_graph)
+        req_tc_graph = self._reverse_links(tc_req_graph)
+        #pprint.pprint(req_tc_graph.items())
+        self._update_pfs_with_tc_traceability(self.requirements_url, req_tc_graph)
 
-    def _update_pfs_with_tc_traceability(self, pfs_url, req_tc_list):
+    def _update_pfs_with_tc_traceability(self, pfs_url, req_tc_graph):
         self.logger.info(self.log_prefix + \
                          "Reading requirement file (%s) and updating traceability. This is going to take a while..." % \
                          (pfs_url))
-        src_wb = open_workbook(pfs_url, formatting_info=True)
+        if os.path.splitext(pfs_url)[-1].lower() == '.xls':
+            # xlutils needs the whole workbook with formatting to make the copy
+            src_wb = open_workbook(pfs_url, formatting_info=True)
+        else:
+            src_wb = self._open_spreadsheet(pfs_url)
+            if src_wb is None:
+                return -1
         for index, s in enumerate(src_wb.sheets()):
             if s.name.lower().count('specification') > 0:
                 src_req_sheet = s
                 break
-        dst_wb = copy(src_wb)
-        dst_req_sheet = dst_wb.get_sheet(index)
-        plain = easyxf('')
 
+        # The cells to be updated: row -> {col: value}. A value starting with '=' is a formula.
+        updates = {}
         pfs_index_col = 0
         pfs_tc_col = 0
         col_defined = False
-        for i, cell in enumerate(src_req_sheet.col(0)):
+        # The coverage formulas (row, coverage col, SI&T col) need the number of rows, they're added after the sheet
+        # is streamed
+        coverage_cells = []
+        nrows = 0
+        for i, row in enumerate(iter_sheet_rows(src_req_sheet)):
+            nrows = i + 1
             if not col_defined:
-                for j in range(0, src_req_sheet.ncols):
-                    cell_text = str(src_req_sheet.cell_value(i, j)).strip()
+                for j, cell_value in enumerate(row):
+                    cell_text = str(cell_value).strip()
                     if cell_text.lower() == 'index':
                         pfs_index_col = j
                     if cell_text.lower() == 'si&t':
                         ver_sit_col = j
                         col_defined = True
-                        coverage_formula = 'COUNTA(' + unichr(ord('A')+pfs_tc_col) + str(i+2) + ':' + \
-                                           unichr(ord('A')+pfs_tc_col) + str(src_req_sheet.nrows+1) + ')/COUNTA('+ \
-                                           unichr(ord('A')+ver_sit_col) + str(i+2) + ':' + unichr(ord('A')+ver_sit_col) + \
-                                           str(src_req_sheet.nrows+1) + ')'
-                        dst_req_sheet.write(i, pfs_tc_col, Formula(coverage_formula), plain)
-                        #print i+1,unichr(ord('A')+pfs_tc_col), coverage_formula
+                        coverage_cells.append((i, pfs_tc_col, ver_sit_col))
                     if cell_text.lower() == 'si&t coverage':
                         pfs_tc_col = j
                 continue
 
-            pfs_index = str(src_req_sheet.cell_value(i, pfs_index_col)).strip()
+            pfs_index = str(row[pfs_index_col] if pfs_index_col < len(row) else u'').strip()
             if pfs_index == '':
                 continue
-            for req_item in req_tc_list:
-                if req_item[0] == pfs_index:
-                    pfs_tc_traceability = ', '.join(req_item[1])
-                    dst_req_sheet.write(i, pfs_tc_col, pfs_tc_traceability, plain)
-
-        output_file_name = pfs_url.replace(os.path.splitext(pfs_url)[-1], '[PFS-TC].xls')
-        dst_wb.save(output_file_name)
+            if pfs_index in req_tc_graph:
+                updates.setdefault(i, {})[pfs_tc_col] = ', '.join(req_tc_graph.links(pfs_index))
+        for i, tc_col, sit_col in coverage_cells:
+            coverage_formula = 'COUNTA(' + unichr(ord('A')+tc_col) + str(i+2) + ':' + \
+                               unichr(ord('A')+tc_col) + str(nrows+1) + ')/COUNTA('+ \
+                               unichr(ord('A')+sit_col) + str(i+2) + ':' + unichr(ord('A')+sit_col) + \
+                               str(nrows+1) + ')'
+            updates.setdefault(i, {})[tc_col] = '=' + coverage_formula
+
+        output_file_name = self._get_pfs_tc_file(pfs_url)
+        if isinstance(src_wb, XlsxWorkbook):
+            self._write_xlsx_copy(src_wb, src_req_sheet.name, updates, output_file_name)
+        else:
+            dst_wb = copy(src_wb)
+            dst_req_sheet = dst_wb.get_sheet(index)
+            plain = easyxf('')
+            for i, row_updates in updates.items():
+                for j, value in row_updates.items():
+                    if value.startswith('='):
+                        value = Formula(value[1:])
+                    dst_req_sheet.write(i, j, value, plain)
+            dst_wb.save(output_file_name)
         self.logger.info(self.log_prefix + \
                          "Successfully generated PFS-TC traceaility file (%s)" % \
                          (output_file_name))
 
+    def _get_pfs_tc_file(self, pfs_url):
+        ''' The PFS-TC traceability file is a xlsx file for the requirement files read as xlsx, otherwise a xls file '''
+        ext = os.path.splitext(pfs_url)[-1]
+        if SPREADSHEET_BACKENDS.get(ext.lower()) is _open_xlsx_workbook:
+            return pfs_url.replace(ext, '[PFS-TC].xlsx')
+        return pfs_url.replace(ext, '[PFS-TC].xls')
+
+    def _write_xlsx_copy(self, src_wb, sheet_name, updates, output_file_name):
+        ''' Copy the cell values of all sheets to a new xlsx file and apply the updates (row -> {col: value}) to the
+            specified sheet. The rows are streamed with the write-only mode of openpyxl, but the cell formatting and
+            the merged cells are not copied.
+        '''
+        dst_wb = XlsxWriteWorkbook(write_only=True)
+        for src_sheet in src_wb.sheets():
+            dst_sheet = dst_wb.create_sheet(src_sheet.name)
+            for i, row in enumerate(iter_sheet_rows(src_sheet)):
+                row = [None if value == u'' else value for value in row]
+                if src_sheet.name == sheet_name and updates.has_key(i):
+                    for j, value in updates[i].items():
+                        if j >= len(row):
+                            row.extend([None] * (j + 1 - len(row)))
+                        row[j] = value
+                dst_sheet.append(row)
+        dst_wb.save(output_file_name)
+
     def chk_pfs_traceability(self, ver_team):
         """
         This function will check the traceability between PFS and TDS items. Only PFS applied to specified verification
         team will be checked and marked.
         """
-        tc_pfs_dict = {}
-        pfs_tc_dict = {}
-        pfs_tree = lxmlET.parse(self.pfs_url.replace('.xml', '.mm'))
+        tc_pfs_graph = TraceabilityGraph()
+        pfs_tree = self._parse_xml(self.pfs_url.replace('.xml', '.mm'), 'lxml')
         pfs_root = pfs_tree.getroot()
 
-        tds_tree = lxmlET.parse(self.tds_url)
-        tds_root = tds_tree.getroot()
-        res = self._get_tc_pfs_traceability(tds_root, tc_pfs_dict)
-        self._reverse_dict(tc_pfs_dict, pfs_tc_dict)
+        # The TDS map is only read, so only its node skeleton is loaded
+        with FreeMindMap(self.tds_url) as tds_map:
+            res = self._get_tc_pfs_traceability(tds_map.getroot(), tc_pfs_graph)
+        pfs_tc_graph = tc_pfs_graph.reverse()
 
         ver_team = ver_team.split('|')
         ver_team_list = [item.strip() for item in ver_team]
+        classifier = self._get_node_classifier()
         for pfs_node in pfs_root.iter('node'):
-            if pfs_node.attrib.has_key('LINK') and pfs_node.attrib['LINK'].startswith(self.testlink_url) and \
-                            pfs_node.attrib['LINK'].count('req&id') > 0:
-                pfs_ver_team = pfs_node.attrib['TEXT'].split(PREFIX_TITLE_SEP)[1]
+            kind, pfs_id = classifier.parse_link(pfs_node.get('LINK'))
+            if kind == classifier.PFS_LINK:
+                pfs_ver_team = classifier.text_fields(pfs_node.attrib['TEXT'])[1]
                 pfs_ver_team = pfs_ver_team.split('|')
-                pfs_id = pfs_node.attrib['LINK'].split('=')[-1]
                 for ver_team in ver_team_list:
                     if ver_team in pfs_ver_team:
-                        if not pfs_tc_dict.has_key(pfs_id):
+                        if pfs_id not in pfs_tc_graph:
                             self.logger.error(self.log_prefix + \
                                               "PFS item (%s) with verification team (%s) doesn't have a traceable TDS item. Highlights it with red backgroud color" % \
                                               (pfs_id, pfs_ver_team))
@@ -738,22 +2336,9 @@ class FreeMind(object):
                         else:
                             self.logger.info(self.log_prefix + \
                                              "PFS item (%s) with verification team (%s) has %d TDS items traced." % \
-                                             (pfs_id, pfs_ver_team, len(pfs_tc_dict[pfs_id])))
-
-        pfs_tree.write(self.pfs_url.replace('.xml', '[PFS-TDS].mm'))
-
-    def _reverse_dict(self, src_dict, dst_dict):
-        """
-        This function will reverse the traceability dictionary. The source dictionary has format like this:
-        {SRC_ID1: [DST_ID1, DST_ID2], SRC_ID2:[DST_ID1, DST_ID2]}
-        """
-        for id, value_list in src_dict.iteritems():
-            for value in value_list:
-                if dst_dict.has_key(value):
-                    dst_dict[value].append(id)
-                else:
-                    dst_dict[value] = [id]
+                                             (pfs_id, pfs_ver_team, len(pfs_tc_graph.links(pfs_id))))
 
+        self._write_xml(pfs_tree, self.pfs_url.replace('.xml', '[PFS-TDS].mm'), 'lxml')
 
     def Generate_TCs_from_TDS(self, node_list, tc_ready):
         """
@@ -762,62 +2347,80 @@ class FreeMind(object):
         The generated xml file need to be imported into testlink manually.
         """
         tc_tds_dict = {}
-        tc_pfs_dict = {}
+        tc_pfs_graph = TraceabilityGraph()
+        # Make sure the based test cases file is read again for each generation
+        self.tc_repo = None
 
-        fm_tree = lxmlET.parse(self.tds_url)
+        fm_tree = self._parse_xml(self.tds_url, 'lxml')
         tds_root = fm_tree.getroot()
         node_list = node_list.split('|')
         node_list = [item.strip() for item in node_list]
         # Create traceability dictionary for last TDS nodes. (Including traceability to both PFS and TDS)
-        res = self._get_tc_tds_traceability(tds_root, tc_tds_dict)
-        res = self._get_tc_pfs_traceability(tds_root, tc_pfs_dict)
-        #pprint.pprint(tc_pfs_dict)
+        tds_analysis = TdsMapAnalysis(tds_root, self._get_node_classifier())
+        res = self._get_tc_tds_traceability(tds_root, tc_tds_dict, tds_analysis)
+        res = self._get_tc_pfs_traceability(tds_root, tc_pfs_graph, tds_analysis)
+        #pprint.pprint(tc_pfs_graph.items())
         # Generate test cases automatically with traceability
         tc_root = lxmlET.Element('testsuite', {'name': ''})
         lxmlET.SubElement(tc_root, 'node_order').text = lxmlET.CDATA('')
         lxmlET.SubElement(tc_root, 'details').text = lxmlET.CDATA('')
-        res = self._gen_tc_xml_from_tds(tc_root, tds_root, tc_tds_dict, tc_pfs_dict, node_list, tc_ready)
+        res = self._gen_tc_xml_from_tds(tc_root, tds_root, tc_tds_dict, tc_pfs_graph, node_list, tc_ready, tds_analysis)
         f = open(self.tc_url, 'w')
         f.write(lxmlET.tostring(tc_root, xml_declaration=True, encoding='UTF-8', pretty_print=True))
-        f.close
+        f.close()
+        self.doc_cache.invalidate(self.tc_url)
         self.logger.info(self.log_prefix + \
                          "Successfully generated the test cases xml file (%s)." % \
                          (self.tc_url))
 
         res = self._update_pfs_node_format(tds_root)
-        fm_tree.write(self.tds_url)
+        self._write_xml(fm_tree, self.tds_url, 'lxml')
         self.logger.info(self.log_prefix + \
                          "Updated PFS nodes in  TDS document (%s)." % \
                          (self.tds_url))
 
     def _update_pfs_node_format(self, tds_root):
+        ''' Update the format of PFS link nodes and return the number of nodes changed '''
+        changed_nodes = 0
+        pfs_format = {'BACKGROUND_COLOR': '#ffffff', 'COLOR': '#00b439', 'STYLE': 'bubble'}
+        classifier = self._get_node_classifier()
         for tds_item in tds_root.iter('node'):
-            if tds_item.attrib.has_key('LINK') and tds_item.attrib['LINK'].startswith(self.testlink_url) and \
-                            tds_item.attrib['LINK'].count('req&id') > 0:
-                tds_item.attrib['TEXT'] = tds_item.attrib['TEXT'].split(PREFIX_TITLE_SEP)[0]
-                tds_item.attrib['BACKGROUND_COLOR'] = '#ffffff'
-                tds_item.attrib['COLOR'] = '#00b439'
-                tds_item.attrib['STYLE'] = 'bubble'
+            if classifier.link_kind(tds_item) == classifier.PFS_LINK:
+                node_format = dict(pfs_format)
+                node_format['TEXT'] = classifier.text_prefix(tds_item.attrib['TEXT'])
+                changed = self._update_attrib(tds_item, node_format)
                 font = tds_item.find('font')
                 if font is not None:
-                    font.attrib['NAME'] = 'SansSerif'
-                    font.attrib['SIZE'] = '8'
+                    changed = self._update_attrib(font, {'NAME': 'SansSerif', 'SIZE': '8'}) or changed
                 else:
-                    lxmlET.SubElement(tds_item, 'font', {'NAME': 'SansSerif', 'SIZE': '8'})
+                    tds_item.append(tds_item.makeelement('font', {'NAME': 'SansSerif', 'SIZE': '8'}))
+                    changed = True
                 edge = tds_item.find('edge')
                 if edge is not None:
-                    edge.attrib['STYLE'] = 'bezier'
-                    edge.attrib['WIDTH'] = 'thin'
+                    changed = self._update_attrib(edge, {'STYLE': 'bezier', 'WIDTH': 'thin'}) or changed
                 else:
-                    lxmlET.SubElement(tds_item, 'edge', {'STYLE': 'bezier', 'WIDTH': 'thin'})
-
-
-    def _gen_tc_xml_from_tds(self, ts_node, root_node, tc_tds_dict, tc_pfs_dict, node_list, tc_ready):
-        existing_tc_list = []
+                    tds_item.append(tds_item.makeelement('edge', {'STYLE': 'bezier', 'WIDTH': 'thin'}))
+                    changed = True
+                if changed:
+                    changed_nodes += 1
+        return changed_nodes
+
+    def _update_attrib(self, elem, attrib):
+        ''' Set the attributes of elem and return True if any of them is changed '''
+        changed = False
+        for key, value in attrib.items():
+            if elem.get(key) <> value:
+                elem.set(key, value)
+                changed = True
+        return changed
+
+    def _gen_tc_xml_from_tds(self, ts_node, root_node, tc_tds_dict, tc_pfs_graph, node_list, tc_ready, tds_analysis):
+        existing_tc_list = set()
         if node_list == ['']:
             self.logger.info(self.log_prefix + \
                              "Generating test cases xml file for all TDS nodes.")
-            self._gen_tc_xml_from_tds_node(ts_node, root_node, tc_tds_dict, tc_pfs_dict, existing_tc_list, tc_ready)
+            self._gen_tc_xml_from_tds_node(ts_node, root_node, tc_tds_dict, tc_pfs_graph, existing_tc_list, tc_ready,
+                                           tds_analysis)
             return
         for tds_item in root_node.iter('node'):
             if tds_item.attrib['ID'] in node_list:
@@ -827,14 +2430,15 @@ class FreeMind(object):
                 child_ts_node = lxmlET.SubElement(ts_node, 'testsuite', {'name': tds_item.attrib['TEXT'].strip()})
                 lxmlET.SubElement(child_ts_node, 'node_order').text = lxmlET.CDATA('')
                 lxmlET.SubElement(child_ts_node, 'details').text = lxmlET.CDATA('')
-                self._gen_tc_xml_from_tds_node(child_ts_node, tds_item, tc_tds_dict, tc_pfs_dict, existing_tc_list,
-                                               tc_ready)
+                self._gen_tc_xml_from_tds_node(child_ts_node, tds_item, tc_tds_dict, tc_pfs_graph, existing_tc_list,
+                                               tc_ready, tds_analysis)
 
-    def _gen_tc_xml_from_tds_node(self, ts_node, root_node, tc_tds_dict, tc_pfs_dict, existing_tc_list, tc_ready):
+    def _gen_tc_xml_from_tds_node(self, ts_node, root_node, tc_tds_dict, tc_pfs_graph, existing_tc_list, tc_ready,
+                                  tds_analysis):
         ts_node_order = -1
         tc_node_order = -1
         for tds_item in root_node.findall('node'):
-            if tds_item.attrib.has_key('LINK') and tds_item.attrib['LINK'].startswith(self.testlink_url):
+            if tds_analysis.is_link(tds_item):
                 continue
             is_testsuite = False
             for item_icon in tds_item.findall('icon'):
@@ -847,20 +2451,20 @@ class FreeMind(object):
                     is_testsuite = True
                     break
             if is_testsuite:
-                self._gen_tc_xml_from_tds_node(child_ts_node, tds_item, tc_tds_dict, tc_pfs_dict, existing_tc_list,
-                                               tc_ready)
+                self._gen_tc_xml_from_tds_node(child_ts_node, tds_item, tc_tds_dict, tc_pfs_graph, existing_tc_list,
+                                               tc_ready, tds_analysis)
                 continue
-            if not self._last_tds_node(tds_item):
-                self._gen_tc_xml_from_tds_node(ts_node, tds_item, tc_tds_dict, tc_pfs_dict, existing_tc_list, tc_ready)
+            if not tds_analysis.is_tds_item(tds_item):
+                self._gen_tc_xml_from_tds_node(ts_node, tds_item, tc_tds_dict, tc_pfs_graph, existing_tc_list, tc_ready,
+                                               tds_analysis)
                 continue
             # This must be the last TDS node
-            tc_list = []
-            res = self._get_linked_tc(tds_item, tc_list)
+            tc_list = tds_analysis.get_tc_ids(tds_item)
             if not tc_list:
                 # There is no linked test case nodes (which mainly used for reusing test cases between projects)
                 if tds_item.attrib['ID'].strip() in existing_tc_list:
                     continue
-                existing_tc_list.append(tds_item.attrib['ID'].strip())
+                existing_tc_list.add(tds_item.attrib['ID'].strip())
                 tc_node_order += 1
                 if tc_ready:
                     # Test cases for some of the nodes are ready in a xml file (for instance, tester has created
@@ -868,53 +2472,56 @@ class FreeMind(object):
                     tc_node = self._get_tc_node_from_xml_by_name(self.based_tc_url, tds_item.attrib['TEXT'].strip())
                     if tc_node is None:
                         # If we don't have a test case for this TDS node, create a dummy test case.
-                        res = self._add_dummy_testcase(ts_node, tds_item, tc_tds_dict, tc_pfs_dict, tc_node_order)
+                        res = self._add_dummy_testcase(ts_node, tds_item, tc_tds_dict, tc_pfs_graph, tc_node_order)
                         continue
-                    res = self._update_tc_node(tc_node, tc_node_order, tds_item, tc_tds_dict, tc_pfs_dict)
+                    res = self._update_tc_node(tc_node, tc_node_order, tds_item, tc_tds_dict, tc_pfs_graph)
                     ts_node.append(tc_node)
                 else:
                     # If this node doesn't have a test case associated, create a new dummy test case with traceability.
-                    res = self._add_dummy_testcase(ts_node, tds_item, tc_tds_dict, tc_pfs_dict, tc_node_order)
+                    res = self._add_dummy_testcase(ts_node, tds_item, tc_tds_dict, tc_pfs_graph, tc_node_order)
                 continue
             # If this node already have test cases associated, update its traceability if necessary.
             # Get the test case from original xml file and copy it into the new xml file
             for tc_id in tc_list:
                 if tc_id in existing_tc_list:
                     continue
-                existing_tc_list.append(tc_id)
+                existing_tc_list.add(tc_id)
                 tc_node_order += 1
                 tc_node = self._get_tc_node_from_xml_by_id(self.based_tc_url, tc_id)
                 if tc_node is None:
                     return
-                res = self._update_tc_node(tc_node, tc_node_order, tds_item, tc_tds_dict, tc_pfs_dict, tc_id)
+                res = self._update_tc_node(tc_node, tc_node_order, tds_item, tc_tds_dict, tc_pfs_graph, tc_id)
                 ts_node.append(tc_node)
 
+    def _get_tc_repository(self, xml_file):
+        ''' The based test case file is parsed only once for all TDS nodes.
+        '''
+        if self.tc_repo is None or self.tc_repo.xml_file != xml_file:
+            self.logger.info(self.log_prefix + \
+                             "Reading and indexing test cases from file (%s)." % \
+                             (xml_file))
+            self.tc_repo = TestCaseRepository(xml_file)
+        return self.tc_repo
+
     def _get_tc_node_from_xml_by_id(self, xml_file, tc_id):
-        parser = lxmlET.XMLParser(strip_cdata=False)
-        tc_root = lxmlET.parse(xml_file, parser)
-        for tc_node in tc_root.iter('testcase'):
-            if tc_node.find('externalid').text == tc_id.split('-')[-1]:
-                return tc_node
+        tc_node = self._get_tc_repository(xml_file).get_by_id(tc_id)
+        if tc_node is not None:
+            return tc_node
         self.logger.warning(self.log_prefix + \
                          "Test case (%s) can not be found in file (%s)." % \
                          (tc_id, xml_file))
         return None
 
     def _get_tc_node_from_xml_by_name(self, xml_file, tc_name):
-        parser = lxmlET.XMLParser(strip_cdata=False)
-        tc_root = lxmlET.parse(xml_file, parser)
-        for tc_node in tc_root.iter('testcase'):
-            if tc_node.attrib['name'].strip() == tc_name:
-            #if tc_node.attrib['name'].strip().count(tc_name) > 0: # For Li Tong Only
-            # if tc_name.count(tc_node.attrib['name'].strip()) > 0:# For Teng Chong Only
-            #     tc_node.attrib['name'] = tc_name # For Teng Chong Only
-                return tc_node
+        tc_node = self._get_tc_repository(xml_file).get_by_name(tc_name)
+        if tc_node is not None:
+            return tc_node
         self.logger.warning(self.log_prefix + \
                          "Test case (%s) can not be found in file (%s)." % \
                          (tc_name, xml_file))
         return None
 
-    def _update_tc_node(self, tc_node, tc_node_order, tds_item, tc_tds_dict, tc_pfs_dict, tc_id=None):
+    def _update_tc_node(self, tc_node, tc_node_order, tds_item, tc_tds_dict, tc_pfs_graph, tc_id=None):
         """
         Update traceability in this test case node
         TODO: If this test case is copied from another project (Can be known from tc_id),
@@ -931,15 +2538,13 @@ class FreeMind(object):
         lxmlET.SubElement(requirement, 'req_spec_title').text = lxmlET.CDATA(
             os.path.splitext(os.path.split(self.tds_url)[-1])[0])
         lxmlET.SubElement(requirement, 'doc_id').text = lxmlET.CDATA(tc_tds_dict[tds_item.attrib['ID']][0])
-        if not tc_pfs_dict.has_key(tds_item.attrib['ID']):
-            return
-        for pfs_id in tc_pfs_dict[tds_item.attrib['ID']]:
+        for pfs_id in tc_pfs_graph.links(tds_item.attrib['ID']):
             requirement = lxmlET.SubElement(requirements, 'requirement')
             lxmlET.SubElement(requirement, 'req_spec_title').text = lxmlET.CDATA(
                 os.path.splitext(os.path.split(self.pfs_url)[-1])[0])
             lxmlET.SubElement(requirement, 'doc_id').text = lxmlET.CDATA(pfs_id)
 
-    def _add_dummy_testcase(self, ts_node, tds_item, tc_tds_dict, tc_pfs_dict, tc_node_order):
+    def _add_dummy_testcase(self, ts_node, tds_item, tc_tds_dict, tc_pfs_graph, tc_node_order):
         if not tds_item.attrib.has_key('TEXT'):
             self.logger.error(self.log_prefix + \
                              "Please check node (%s) since it may use a long name. Please convert it to plain text via FreeMind Menu Format=>Use Plaine Text." % \
@@ -983,15 +2588,13 @@ class FreeMind(object):
         lxmlET.SubElement(requirement, 'req_spec_title').text = lxmlET.CDATA(
             os.path.splitext(os.path.split(self.tds_url)[-1])[0])
         lxmlET.SubElement(requirement, 'doc_id').text = lxmlET.CDATA(tc_tds_dict[tds_item.attrib['ID']][0])
-        if not tc_pfs_dict.has_key(tds_item.attrib['ID']):
-            return
-        for pfs_id in tc_pfs_dict[tds_item.attrib['ID']]:
+        for pfs_id in tc_pfs_graph.links(tds_item.attrib['ID']):
             requirement = lxmlET.SubElement(requirements, 'requirement')
             lxmlET.SubElement(requirement, 'req_spec_title').text = lxmlET.CDATA(
                 os.path.splitext(os.path.split(self.pfs_url)[-1])[0])
             lxmlET.SubElement(requirement, 'doc_id').text = lxmlET.CDATA(pfs_id)
 
-    def _add_codecs_testcase(self, ts_node, tds_item, tc_tds_dict, tc_pfs_dict, tc_node_order):
+    def _add_codecs_testcase(self, ts_node, tds_item, tc_tds_dict, tc_pfs_graph, tc_node_order):
         if not tds_item.attrib.has_key('TEXT'):
             self.logger.error(self.log_prefix + \
                              "Please check node (%s) since it may use a long name. Please convert it to plain text via FreeMind Menu Format=>Use Plaine Text." % \
@@ -1045,49 +2648,34 @@ class FreeMind(object):
         lxmlET.SubElement(requirement, 'req_spec_title').text = lxmlET.CDATA(
             os.path.splitext(os.path.split(self.tds_url)[-1])[0])
         lxmlET.SubElement(requirement, 'doc_id').text = lxmlET.CDATA(tc_tds_dict[tds_item.attrib['ID']][0])
-        if not tc_pfs_dict.has_key(tds_item.attrib['ID']):
-            return
-        for pfs_id in tc_pfs_dict[tds_item.attrib['ID']]:
+        for pfs_id in tc_pfs_graph.links(tds_item.attrib['ID']):
             requirement = lxmlET.SubElement(requirements, 'requirement')
             lxmlET.SubElement(requirement, 'req_spec_title').text = lxmlET.CDATA(
                 os.path.splitext(os.path.split(self.pfs_url)[-1])[0])
             lxmlET.SubElement(requirement, 'doc_id').text = lxmlET.CDATA(pfs_id)
 
-    def _get_tc_pfs_traceability(self, root_node, tc_pfs_dict):
+    def _get_tc_pfs_traceability(self, root_node, tc_pfs_graph, tds_analysis=None):
         self.logger.info(self.log_prefix + \
                          "Getting traceability between PFS and TDS items.")
-        for tds_node in root_node.iter('node'):
-            if tds_node.attrib.has_key('LINK'):
-                if tds_node.attrib['LINK'].startswith(self.testlink_url) and tds_node.attrib['LINK'].count(
-                        'req&id') > 0:
-                    # This is a PFS node, so all valid TDS items under the parent node of this node will have this PFS ID as traceability.
-                    self._add_tc_pfs_traceability(tds_node.getparent(), tc_pfs_dict,
-                                                  tds_node.attrib['LINK'].split('=')[-1])
-
-    def _add_tc_pfs_traceability(self, root_node, tc_pfs_dict, pfs_id):
-        for tds_item in root_node.iter('node'):
-            if not self._last_tds_node(tds_item):
-                continue
-            if tc_pfs_dict.has_key(tds_item.attrib['ID']):
-                duplicated_pfs = False
-                for orig_pfs_id in tc_pfs_dict[tds_item.attrib['ID']]:
-                    if orig_pfs_id == pfs_id:
-                        duplicated_pfs = True
-                        self.logger.warning(self.log_prefix + \
-                                            "Duplicated PFS item (%s) found for TDS node (%s:%s)" % \
-                                            (pfs_id, tds_item.attrib['ID'], tds_item.attrib['TEXT']))
-                        break
-                if not duplicated_pfs:
-                    tc_pfs_dict[tds_item.attrib['ID']].append(pfs_id)
-            else:
-                tc_pfs_dict[tds_item.attrib['ID']] = [pfs_id]
-
-    def _get_tc_tds_traceability(self, root_node, tc_tds_dict):
+        if tds_analysis is None:
+            tds_analysis = TdsMapAnalysis(root_node, self._get_node_classifier())
+        for tds_item in tds_analysis.tds_items:
+            # All valid TDS items under the parent node of a PFS node will have this PFS ID as traceability.
+            for pfs_id in tds_analysis.get_pfs_ids(tds_item):
+                self._add_tc_pfs_traceability(tds_item, tc_pfs_graph, pfs_id)
+
+    def _add_tc_pfs_traceability(self, tds_item, tc_pfs_graph, pfs_id):
+        if not tc_pfs_graph.add_link(tds_item.attrib['ID'], pfs_id):
+            self.logger.warning(self.log_prefix + \
+                                "Duplicated PFS item (%s) found for TDS node (%s:%s)" % \
+                                (pfs_id, tds_item.attrib['ID'], tds_item.attrib['TEXT']))
+
+    def _get_tc_tds_traceability(self, root_node, tc_tds_dict, tds_analysis=None):
         self.logger.info(self.log_prefix + \
                          "Getting traceability between test cases and TDS items.")
-        for tds_item in root_node.iter('node'):
-            if not self._last_tds_node(tds_item):
-                continue
+        if tds_analysis is None:
+            tds_analysis = TdsMapAnalysis(root_node, self._get_node_classifier())
+        for tds_item in tds_analysis.tds_items:
             # If this is the last node and a node with only PFS items (we called 'valid tds item'), then this is a valid node that will be imported into testlink for traceability.
             if not tc_tds_dict.has_key(tds_item.attrib['ID']):
                 tc_tds_dict[tds_item.attrib['ID']] = [self.tds_prefix + tds_item.attrib['ID']]
@@ -1097,29 +2685,15 @@ class FreeMind(object):
                                   "Duplicated TDS item (%s) found. Please check your FreeMind file in text mode." % \
                                   (tds_item.attrib['ID']))
 
-    def _last_tds_node(self, node):
-        if node.attrib.has_key('LINK') and node.attrib['LINK'].startswith(self.testlink_url):
-            # This maybe a PFS/TC item, we need ignore it
-            return False
-        for child in node.findall('node'):
-            if not (child.attrib.has_key('LINK') and child.attrib['LINK'].startswith(self.testlink_url)):
-                return False
-        return True
-
-    def _get_linked_tc(self, tds_item, tc_list):
-        for child in tds_item.findall('node'):
-            if child.attrib.has_key('LINK') and child.attrib['LINK'].startswith(self.testlink_url) and child.attrib[
-                'LINK'].count('testcase&id') > 0:
-                tc_list.append(child.attrib['LINK'].split('=')[-1].strip())
-
     def create_test_plan(self, tp_url, auto_sync, ver_team):
         ''' The inputs could be TDS aided test planning, Test Suites aided test planning or PFS aided test planning.                        
         '''
+        res = 0
         removed_tc_list = []
         kept_tc_list = []
         tc_list = []
         new_tc_list = []
-        fm_tree = ET.parse(tp_url)
+        fm_tree = self._parse_xml(tp_url)
         tp_root = fm_tree.getroot()
 
         #Firstly we need to go through the test plan to see if there any test case is removed or there are any test cases need to be kept.
@@ -1131,15 +2705,19 @@ class FreeMind(object):
                          "Test cases marked with must-keep icon are (%s)." % \
                          (kept_tc_list))
         #Secondly we need to get all test cases based on information above, regression levels and verification teams.
-        res = self._get_tc_list(tp_root, removed_tc_list, kept_tc_list, tc_list, ver_team)
-        res = self._remove_duplicate(tc_list, new_tc_list)
+        self._get_tc_list(tp_root, set(removed_tc_list), set(kept_tc_list), tc_list, ver_team)
+        self._remove_duplicate(tc_list, new_tc_list)
         self.logger.info(self.log_prefix + \
                          "Test cases planned in this test cycle are (%s)." % \
                          (new_tc_list))
 
+        #Compare with the baseline test plan
+        if self.based_tp_url is not None and os.path.exists(self.based_tp_url):
+            self._diff_test_plan(self.based_tp_url, tp_url, tp_root)
+
         #Update Test Plan
-        res = self._update_fm_tp(tp_root, new_tc_list)
-        fm_tree.write(tp_url)
+        self._update_fm_tp(tp_root, set(new_tc_list))
+        self._write_xml(fm_tree, tp_url)
         self.logger.info(self.log_prefix + \
                          "The original test plan file (%s) is updated." % \
                          (tp_url))
@@ -1154,6 +2732,29 @@ class FreeMind(object):
 
         return res
 
+    def _diff_test_plan(self, based_tp_url, tp_url, tp_root):
+        ''' Compare the test plan with the baseline test plan and write the added/removed/moved test cases
+            into the [Diff].json file beside the test plan.
+        '''
+        with FreeMindMap(based_tp_url) as based_tp_map:
+            tp_diff = TestPlanDiff(based_tp_map.getroot(), tp_root, self._get_node_classifier())
+        self.logger.info(self.log_prefix + \
+                         "Compared with the baseline test plan (%s): %d test cases added, %d removed and %d moved." % \
+                         (based_tp_url, len(tp_diff.added), len(tp_diff.removed), len(tp_diff.moved)))
+        for item in tp_diff.removed:
+            self.logger.info(self.log_prefix + \
+                             "Test case (%s) under (%s) is removed from the baseline test plan." % \
+                             (item['tc_id'], item['parent']))
+        for item in tp_diff.moved:
+            self.logger.info(self.log_prefix + \
+                             "Test case (%s) is moved from (%s) to (%s)." % \
+                             (item['tc_id'], item['from_parent'], ', '.join([to['parent'] for to in item['to']])))
+        diff_file = os.path.splitext(tp_url)[0] + '[Diff].json'
+        f = open(diff_file, 'w')
+        json.dump(tp_diff.as_dict(), f, indent=1)
+        f.close()
+        return tp_diff
+
     def _create_test_plan_in_tl(self, tp_name, tc_list):
         ''' Establish a connection with TestLink and then create a new test plan.
             Get the latest version the assigned test cases and then add them into the test plan.
@@ -1162,46 +2763,61 @@ class FreeMind(object):
         self.logger.info(self.log_prefix + \
                          "Test plan (%s) will be created and updated in TestLink. This is going to take a while. Please wait..." % \
                          (tp_name))
-        self.tls = testlink.TestLinkHelper().connect(testlink.TestlinkAPIClient)
-        prj = self.tls.getTestProjectByName(self.repo_name)
+        self.tls = self._get_testlink_sync()
+        prj = self.tls.call('getTestProjectByName', testprojectname=self.repo_name)
         prj_id = prj['id']
-        tp = self.tls.createTestPlan(tp_name, self.repo_name)
+        tp = self.tls.call('createTestPlan', testplanname=tp_name, testprojectname=self.repo_name)
         tp_id = tp[0]['id']
         #tp_id = self.tls.getTestPlanByName(self.repo_name, tp_name)[0]['id']
-        for tc_id in tc_list:
-            tc_version = self.tls.getTestCase(None, testcaseexternalid=tc_id)[0]['version']
-            self.tls.addTestCaseToTestPlan(prj_id, tp_id, tc_id, int(tc_version))
+        tc_list = list(tc_list)
+        tc_info_list = self.tls.map('getTestCase', [{'testcaseexternalid': tc_id} for tc_id in tc_list])
+        add_params_list = []
+        for tc_id, tc_info in zip(tc_list, tc_info_list):
+            if self.tls._is_error(tc_info) or not isinstance(tc_info, list) or len(tc_info) == 0 or \
+                    not isinstance(tc_info[0], dict) or not tc_info[0].has_key('version'):
+                self.logger.error(self.log_prefix + \
+                                  "Cannot get the version of test case (%s): %s" % \
+                                  (tc_id, tc_info))
+                continue
+            add_params_list.append({'testprojectid': prj_id, 'testplanid': tp_id, 'testcaseexternalid': tc_id,
+                                    'version': int(tc_info[0]['version'])})
+        for params, res in zip(add_params_list, self.tls.map('addTestCaseToTestPlan', add_params_list)):
+            if isinstance(res, list) and len(res) > 0 and isinstance(res[0], dict) and res[0].has_key('code'):
+                self.logger.error(self.log_prefix + \
+                                  "Cannot add test case (%s) to test plan (%s): %s" % \
+                                  (params['testcaseexternalid'], tp_name, res[0].get('message')))
 
         self.logger.info(self.log_prefix + \
                          "Test plan (%s) is created and updated successfully." % \
                          (tp_name))
 
+    def _get_testlink_sync(self):
+        return TestLinkSync(self.testlink_rpc_url, self.testlink_devkey, self.logger, self.testlink_workers,
+                            cache=self.testlink_cache)
+
     def link_tp2tds_tc(self, tds_url, tc_url, name_filter):
-        tc_list = []
-        res = self._get_test_plan_info(name_filter, tc_list)
-        #pprint.pprint(tc_list) 
+        tc_tp_graph = TraceabilityGraph()
+        res = self._get_test_plan_info(name_filter, tc_tp_graph)
+        #pprint.pprint(tc_tp_graph.items())
         # Link TDS_TC file with Test Plan and Execution status
         #res = self.link_tc2tds(self.tds_url, self.tc_url)
-        res = self._link_tp2fm(tds_url.replace('.mm', '[TDS-TC].mm'), tc_list)
+        res = self._link_tp2fm(tds_url.replace('.mm', '[TDS-TC].mm'), tc_tp_graph)
 
-    def _link_tp2fm(self, fm_file, tc_list):
+    def _link_tp2fm(self, fm_file, tc_tp_graph):
         tp_list = []
-        fm_tree = ET.parse(fm_file)
+        fm_tree = self._parse_xml(fm_file)
         root_node = fm_tree.getroot()
+        classifier = self._get_node_classifier()
         for child in root_node.iter('node'):
-            node_text = child.attrib['TEXT'].strip()
-            tc_id = node_text.split(PREFIX_TITLE_SEP)[0]
-            # If this is the node for a test case            
-            if (tc_id.count(self.repo_prefix) == 1):
-                tp_list = []
-                for tc in tc_list:
-                    if tc[0] == tc_id:
-                        tp_list = tc[1]
-                        break
+            tc_id = classifier.tc_id(child.attrib['TEXT'])
+            # If this is the node for a test case
+            if tc_id is not None:
+                # Each link is an Execution (test plan name and execution status)
+                tp_list = tc_tp_graph.links(tc_id)
                 #print tp_list
                 for tp in tp_list:
-                    tp_name = tp[0]
-                    tp_sts = tp[1]
+                    tp_name = tp.tp_name
+                    tp_sts = tp.status
                     tp_node = ET.SubElement(child, 'node', {'TEXT': tp_name})
                     if tp_sts == 'p':
                         ET.SubElement(tp_node, 'icon', {'BUILTIN': 'go'})
@@ -1211,89 +2827,93 @@ class FreeMind(object):
                         ET.SubElement(tp_node, 'icon', {'BUILTIN': 'prepare'})
                     if tp_sts == 'n':
                         ET.SubElement(tp_node, 'icon', {'BUILTIN': 'help'})
-        fm_tree.write(fm_file.replace('.mm', '-TP.mm'))
+        self._write_xml(fm_tree, fm_file.replace('.mm', '-TP.mm'))
         self.logger.info(self.log_prefix + \
                          "Successfully linked the test plan and execution results to file (%s)." % \
                          (fm_file.replace('.mm', '-TP.mm')))
 
-    def _get_test_plan_info(self, name_filter, tc_list):
+    def _get_test_plan_info(self, name_filter, tc_tp_graph):
+        ''' Get the test cases and execution status of the test plans whose name contains any of the filters
+            (separated by |, all test plans if it's empty). The test plans are fetched concurrently and merged into
+            tc_tp_graph (full_external_id -> Execution) in the order of the test plans.
+        '''
         self.logger.info(self.log_prefix + \
                          "Getting test plan and execution status from TestLink. This is going to take a while. Please wait...")
-        self.tls = testlink.TestLinkHelper().connect(testlink.TestlinkAPIClient)
-        prj = self.tls.getTestProjectByName(self.repo_name)
+        self.tls = self._get_testlink_sync()
+        prj = self.tls.call('getTestProjectByName', testprojectname=self.repo_name)
         prj_id = prj['id']
-        tp_list = self.tls.getProjectTestPlans(prj_id)
+        tp_list = self.tls.call('getProjectTestPlans', testprojectid=prj_id)
         self.logger.info(self.log_prefix + \
                          "There are totally %d test plan for this project (%s)." % \
                          (len(tp_list), self.repo_name))
-        for tp in tp_list:
-            tp_name = tp['name']
-            #TODO: Apply the name filter
-            tp_id = tp['id']
-            tc_dict = self.tls.getTestCasesForTestPlan(tp_id)
-            for k in tc_dict.keys():
-                tc = tc_dict[k][0]
-                tc_id = tc['full_external_id']
-                tc_sts = tc['exec_status']
-                self._add_tc_history_list(tc_id, tc_sts, tp_name, tc_list)
+        name_filter_list = [item.strip() for item in name_filter.split('|') if item.strip() <> '']
+        if name_filter_list:
+            tp_list = [tp for tp in tp_list if [item for item in name_filter_list if tp['name'].count(item) > 0]]
+            self.logger.info(self.log_prefix + \
+                             "There are %d test plans matching the filter (%s)." % \
+                             (len(tp_list), name_filter))
+
+        # Each test plan could be big, so they are not batched and fetched concurrently.
+        tc_dict_list = self.tls.map('getTestCasesForTestPlan', [{'testplanid': tp['id']} for tp in tp_list], 1)
+        for tp, tc_dict in zip(tp_list, tc_dict_list):
+            if not isinstance(tc_dict, dict):
+                # An empty list is returned if there is no test case in the test plan
+                if tc_dict:
+                    self.logger.error(self.log_prefix + \
+                                      "Cannot get the test cases of test plan (%s): %s" % \
+                                      (tp['name'], tc_dict))
+                continue
+            for tc_platforms in tc_dict.itervalues():
+                # The test case is a list (one for each platform) or a dictionary keyed by platform id
+                if isinstance(tc_platforms, dict):
+                    tc_platforms = tc_platforms.values()
+                tc = tc_platforms[0]
+                tc_tp_graph.add_link(tc['full_external_id'], Execution(tp['name'], tc['exec_status']))
 
         return 0
 
-    def _add_tc_history_list(self, tc_id, tc_sts, tp_name, tc_list):
-        for tc in tc_list:
-            if tc_id == tc[0]:
-                tc[1].append([tp_name, tc_sts])
-                return True
-        tc_list.append([tc_id, [[tp_name, tc_sts]]])
-        return True
-
     def _remove_duplicate(self, old_list, new_list):
+        # Only the first occurrence is kept, hence the order of the list is not changed
+        existing_items = set(new_list)
         for i in old_list:
-            if not i in new_list:
+            if i not in existing_items:
+                existing_items.add(i)
                 new_list.append(i)
 
     def _get_fm_tc_list(self, root_node, tc_list):
+        classifier = self._get_node_classifier()
         for child in root_node.iter('node'):
-            node_text = child.attrib['TEXT'].strip()
-            tc_id = node_text.split(PREFIX_TITLE_SEP)[0]
+            tc_id = classifier.tc_id(child.attrib['TEXT'])
             # If this is the node for a test case
-            if tc_id.count(self.repo_prefix) == 1:
+            if tc_id is not None:
                 tc_list.append(tc_id)
 
-    def _update_fm_tp(self, root_node, tc_list):
+    def _update_fm_tp(self, root_node, tc_set):
+        ''' Highlight the nodes with planned test cases (in tc_set) under them and grey out (fold) the others.
+            The flag of each subtree is computed bottom up in one pass, thus return True if any node under
+            root_node is a planned test case.
+        '''
+        has_planned_tc = False
         for child in root_node.findall('node'):
             for hook_node in child.findall('hook'):
                 if hook_node.attrib['NAME'].strip() == 'accessories/plugins/AutomaticLayout.properties':
                     child.remove(hook_node)
 
-            node_text = child.attrib['TEXT'].strip()
-            #print node_text
-            tc_id = node_text.split(PREFIX_TITLE_SEP)[0]
-            # If this is the node for a test case
-            if tc_id.count(self.repo_prefix) == 1:
-                if tc_id in tc_list:
-                    child.attrib['COLOR'] = '#000000'
-                else:
-                    child.attrib['COLOR'] = '#cccccc'
+            tc_id = self._get_node_classifier().tc_id(child.attrib['TEXT'])
+            child_has_planned_tc = self._update_fm_tp(child, tc_set)
+            # If this is the node for a planned test case
+            if tc_id is not None and tc_id in tc_set:
+                child_has_planned_tc = True
 
-            if not self._has_valid_tc_node(child, tc_list):
+            if not child_has_planned_tc:
                 child.attrib['COLOR'] = '#cccccc'
                 child.attrib['FOLDED'] = 'true'
             else:
                 child.attrib['COLOR'] = '#000000'
                 child.attrib['FOLDED'] = 'false'
-            self._update_fm_tp(child, tc_list)
-
-        return 0
+                has_planned_tc = True
 
-    def _has_valid_tc_node(self, root_node, tc_list):
-        for child in root_node.iter('node'):
-            node_text = child.attrib['TEXT'].strip()
-            tc_id = node_text.split(PREFIX_TITLE_SEP)[0]
-            # If this is the node for a test case
-            if (tc_id.count(self.repo_prefix) == 1) and (tc_id in tc_list):
-                return True
-        return False
+        return has_planned_tc
 
     def _remove_node_wo_tc(self, root_node):
         for child in root_node.findall('node'):
@@ -1305,47 +2925,48 @@ class FreeMind(object):
         return 0
 
     def _has_tc_node(self, root_node):
+        classifier = self._get_node_classifier()
         for child in root_node.iter('node'):
-            node_text = child.attrib['TEXT'].strip()
-            tc_id = node_text.split(PREFIX_TITLE_SEP)[0]
             # If this is the node for a test case
-            if tc_id.count(self.repo_prefix) == 1:
+            if classifier.tc_id(child.attrib['TEXT']) is not None:
                 return True
         return False
 
-    def _get_tc_list(self, root_node, exclude_tc_list, kept_tc_list, tc_list, ver_team, regression_level='5'):
+    def _get_tc_list(self, root_node, exclude_tc_set, kept_tc_set, tc_list, ver_team, regression_level='5'):
+        ''' Append the planned test cases into tc_list in the order of the test plan.
+            exclude_tc_set and kept_tc_set are sets, thus the membership checks are O(1).
+        '''
         for child in root_node.findall('node'):
-            node_text = child.attrib['TEXT'].strip()
-            tc_id = node_text.split(PREFIX_TITLE_SEP)[0]
+            tc_id = self._get_node_classifier().tc_id(child.attrib['TEXT'])
             node_reg_lvl = regression_level
             for node_icon in child.findall('icon'):
                 if node_icon.attrib['BUILTIN'].strip().count('full-') == 1:
                     node_reg_lvl = node_icon.attrib['BUILTIN'].strip()[-1]
             # If this is the node for a test case
-            if tc_id.count(self.repo_prefix) == 1:
+            if tc_id is not None:
                 # TODO: If we want to implement verification team, we need add this information in this node  
-                # Keep the node if regression level is matched and not in the exclude_tc_list, or it's in the must keep list kept_tc_list    
-                if ((tc_id not in exclude_tc_list) and (int(node_reg_lvl) <= int(regression_level))) \
-                        or (tc_id in kept_tc_list):
+                # Keep the node if regression level is matched and not in the exclude_tc_set, or it's in the must keep set kept_tc_set
+                if ((tc_id not in exclude_tc_set) and (int(node_reg_lvl) <= int(regression_level))) \
+                        or (tc_id in kept_tc_set):
                     tc_list.append(tc_id)
                     #child.attrib['COLOR'] = '#000000'          
                     #else:
                     #child.attrib['COLOR'] = '#cccccc'
             else:
-                self._get_tc_list(child, exclude_tc_list, kept_tc_list, tc_list, ver_team, node_reg_lvl)
+                self._get_tc_list(child, exclude_tc_set, kept_tc_set, tc_list, ver_team, node_reg_lvl)
 
         return 0
 
     def _update_tp(self, root_node, ver_team, exclude_tc_list, regression_level='5'):
         for child in root_node.findall('node'):
             node_text = child.attrib['TEXT'].strip()
-            tc_id = node_text.split(PREFIX_TITLE_SEP)[0]
+            tc_id = self._get_node_classifier().tc_id(child.attrib['TEXT'])
             node_reg_lvl = regression_level
             for reg_lvl_icon in child.findall('icon'):
                 if reg_lvl_icon.attrib['BUILTIN'].strip().count('full-') == 1:
                     node_reg_lvl = reg_lvl_icon.attrib['BUILTIN'].strip()[-1]
             # If this is the node for a test case
-            if tc_id.count(self.repo_prefix) == 1:
+            if tc_id is not None:
                 # TODO: If we want to implement verification team, we need add this information in this node
                 #tc_ver_team = node_text.split(PREFIX_TITLE_SEP)[1].split('|')
                 if (tc_id in exclude_tc_list) or (int(node_reg_lvl) > int(regression_level)):
@@ -1358,10 +2979,9 @@ class FreeMind(object):
 
     def _find_removed_kept_tc(self, root_node, removed_tc_list, kept_tc_list):
         for child in root_node.findall('node'):
-            node_text = child.attrib['TEXT'].strip()
-            tc_id = node_text.split(PREFIX_TITLE_SEP)[0]
+            tc_id = self._get_node_classifier().tc_id(child.attrib['TEXT'])
             # If this is the node for a test case
-            if tc_id.count(self.repo_prefix) == 1:
+            if tc_id is not None:
                 for icon_node in child.findall('icon'):
                     # TODO: How about multiple icons?
                     if icon_node.attrib['BUILTIN'].strip() == 'button_cancel':
@@ -1371,49 +2991,24 @@ class FreeMind(object):
             else:
                 self._find_removed_kept_tc(child, removed_tc_list, kept_tc_list)
 
-    def _find_removed_tc(self, root_node, tp_root, removed_tc_list):
-        for child in root_node.findall('node'):
-            node_text = child.attrib['TEXT'].strip()
-            tc_id = node_text.split(PREFIX_TITLE_SEP)[0]
-            # If this is the node for a test case
-            if tc_id.count(self.repo_prefix) == 1:
-                parent_text = root_node.attrib['TEXT'].strip()
-                self.node_found = False
-                self._find_combined_node(parent_text, node_text, tp_root)
-                if not self.node_found:
-                    removed_tc_list.append(tc_id)
-            else:
-                self._find_removed_tc(child, tp_root, removed_tc_list)
-
-    def _find_combined_node(self, parent_text, tc_text, root_node):
-        for child in root_node.findall('node'):
-            node_text = child.attrib['TEXT'].strip()
-            tc_id = node_text.split(PREFIX_TITLE_SEP)[0]
-            # If this is the node for a test case
-            if tc_id.count(self.repo_prefix) == 1:
-                # Check the node text to see if it matches thus we know if this node exist in new test plan
-                if (root_node.attrib['TEXT'].strip() == parent_text) and (node_text == tc_text):
-                    # Need a global variable for this, haven't find a new way to replace this.
-                    self.node_found = True
-            else:
-                self._find_combined_node(parent_text, tc_text, child)
-        return 0
-
     def _get_link_node(self, node, link_list):
         for child in node.findall('node'):
             if child.attrib.has_key('LINK'):
                 tds_id = node.attrib['TEXT'].split(' ')[0]
                 tc_id = child.attrib['TEXT'].split(':')[0]
                 tc_title = ''.join(child.attrib['TEXT'].split(':')[1:])
-                link_list.append([tc_id, tc_title, tds_id])
+                link_list.append(TcLink(tc_id, tc_title, tds_id))
             else:
                 self._get_link_node(child, link_list)
         return 0
 
     def _remove_node_prefix(self, node):
+        ''' Remove the prefix of all nodes and return the number of nodes changed '''
+        changed_nodes = 0
+        classifier = self._get_node_classifier()
         for child in node.iter('node'):
             # Make sure this is not the test case or requirement link node since only they are nodes with links
-            if child.attrib.has_key('LINK') and child.attrib['LINK'].startswith(self.testlink_url):
+            if classifier.link_kind(child) is not None:
                 continue
             # If the node text is started with a number, then we consider it having added prefix
             # if child.attrib['TEXT'][0].isdigit:
@@ -1430,8 +3025,9 @@ class FreeMind(object):
                               "Prefix of node (%s) has been removed" % \
                               (child.attrib['TEXT']))
             child.attrib['TEXT'] = ''.join(child.attrib['TEXT'].split(PREFIX_TITLE_SEP)[1:])
+            changed_nodes += 1
 
-        return 0
+        return changed_nodes
 
     def _remove_link_node(self, node):
         '''The key here is to use findall method since it will create a new children list'''
@@ -1451,7 +3047,7 @@ class FreeMind(object):
         res = 0
         i = 0
         for child in node.findall('node'):
-            if child.attrib.has_key('LINK') and child.attrib['LINK'].startswith(self.testlink_url):
+            if self._get_node_classifier().link_kind(child) is not None:
                 continue
             i += 1
             prefix = str(num) + '.' + str(i)
@@ -1463,7 +3059,7 @@ class FreeMind(object):
 
         return res
 
-    def extract_tc_from_docx(self, file_name, review_info):
+    def extract_tc_from_docx(self, file_name, review_info, workers=1):
         self.logger.info(self.log_prefix + \
                          "Reading test cases from file (%s). This is going to take a while. Please wait..." % \
                          file_name)
@@ -1487,22 +3083,25 @@ class FreeMind(object):
         lxmlET.SubElement(child_ts_node, 'node_order').text = lxmlET.CDATA('')
         lxmlET.SubElement(child_ts_node, 'details').text = lxmlET.CDATA('')
 
-        document = Document(file_name)
+        if workers <= 0:
+            workers = multiprocessing.cpu_count()
         tc_node_order = -1
-        for table in document.tables:
-            if table.cell(0, 0).paragraphs[0].text != 'Test case ID':
+        for table in read_docx_tables(file_name, workers):
+            if table.cell(0, 0)[0] != 'Test case ID':
                 continue
             tc_node_order += 1
-            col_index = len(table.columns) - 2
-            tc_id = table.cell(0, col_index).paragraphs[0].text.strip()
-            print tc_id
-            tc_purpose = '\n'.join([paragraph.text.strip() for paragraph in table.cell(1, col_index).paragraphs])
+            col_index = table.ncols - 2
+            tc_id = table.cell(0, col_index)[0].strip()
+            self.logger.debug(self.log_prefix + \
+                              "Reading test case (%s) from file (%s)." % \
+                              (tc_id, file_name))
+            tc_purpose = '\n'.join([paragraph.strip() for paragraph in table.cell(1, col_index)])
             tc_cfg = 'Test Configuration：\n'+ \
-                     '\n'.join([paragraph.text.strip() for paragraph in table.cell(2, col_index).paragraphs])
+                     '\n'.join([paragraph.strip() for paragraph in table.cell(2, col_index)])
             tc_pre_cond = 'Precondition：\n'+ \
-                          '\n'.join([paragraph.text.strip() for paragraph in table.cell(3, col_index).paragraphs])
+                          '\n'.join([paragraph.strip() for paragraph in table.cell(3, col_index)])
             tc_post_cond = 'Postcondition：\n'+ \
-                           '\n'.join([paragraph.text.strip() for paragraph in table.cell(4, col_index).paragraphs])
+                           '\n'.join([paragraph.strip() for paragraph in table.cell(4, col_index)])
             #print '\n'.join([tc_id, tc_purpose, tc_cfg, tc_pre_cond, tc_post_cond])
             testcase = lxmlET.SubElement(child_ts_node, 'testcase', {'name': tc_id})
             lxmlET.SubElement(testcase, 'node_order').text = lxmlET.CDATA(str(tc_node_order))
@@ -1515,12 +3114,12 @@ class FreeMind(object):
             lxmlET.SubElement(testcase, 'importance').text = lxmlET.CDATA('3')
 
             steps = lxmlET.SubElement(testcase, 'steps')
-            for i in range(6, len(table.rows)):
+            for i in range(6, table.nrows):
                 step = lxmlET.SubElement(steps, 'step')
                 lxmlET.SubElement(step, 'step_number').text = lxmlET.CDATA(str(i-5))
-                action = '\n'.join([paragraph.text.strip() for paragraph in table.cell(i, 0).paragraphs])
+                action = '\n'.join([paragraph.strip() for paragraph in table.cell(i, 0)])
                 lxmlET.SubElement(step, 'actions').text = lxmlET.CDATA(self._replace_new_line(action))
-                result = '\n'.join([paragraph.text.strip() for paragraph in table.cell(i, 1).paragraphs])
+                result = '\n'.join([paragraph.strip() for paragraph in table.cell(i, 1)])
                 lxmlET.SubElement(step, 'expectedresults').text = lxmlET.CDATA(self._replace_new_line(result))
                 lxmlET.SubElement(step, 'execution_type').text = lxmlET.CDATA('1')
 
@@ -1544,26 +3143,42 @@ class FreeMind(object):
         output_file_name = file_name.replace(os.path.splitext(file_name)[-1], '.xml')
         f = open(output_file_name, 'w')
         f.write(lxmlET.tostring(tc_root, xml_declaration=True, encoding='UTF-8', pretty_print=True))
-        f.close
+        f.close()
+        self.doc_cache.invalidate(output_file_name)
         self.logger.info(self.log_prefix + \
                          "Successfully generated test case file (%s). You can now import it into TestLink" % \
                          (output_file_name))
 
-    def extract_tc_from_file(self, file_name, sheet_name, review_info):
-        if os.path.splitext(file_name)[-1] == '.xls':
-            self.extract_tc_from_xls(file_name, sheet_name, review_info)
-        elif os.path.splitext(file_name)[-1].count('.doc') > 0:
-            self.extract_tc_from_docx(file_name, review_info)
-
-    def extract_tc_from_xls(self, file_name, sheet_name, review_info):
-        xls_col_dict = {'TS_Name': -1, 'TS_Details': -1, 'Name': -1, 'Summary': -1, 'Preconditions': -1,
-                        'Test Execution Type': -1, 'Importance': -1, 'HGI Regression Level': -1,
-                        'HGI Test Team': -1, 'Steps': -1, 'Expected Results': -1, 'Step Execution Type': -1
-                        , 'Requirements': -1}
-        execution_type_dict = {'Manual': '1', 'Automated': '2'}
-        importance_dict = {'H': '3', 'M': '2', 'L': '1'}
-        regression_level_list = '5 - First Time Run|4 - Full Regression|3 - Regular Regression|2 - Basic Regression|1 - Basic Sanity'.split('|')
+    def _open_spreadsheet(self, file_name, formatting_info=False):
+        ''' Open the workbook with the backend of its file type (see SPREADSHEET_BACKENDS).
+            Return None if the file type is not supported.
+        '''
+        ext = os.path.splitext(file_name)[-1].lower()
+        if not SPREADSHEET_BACKENDS.has_key(ext):
+            self.logger.error(self.log_prefix + \
+                              "I am sorry that I can not parse this file (%s). Please convert it to a xls or xlsx file." % \
+                              (file_name))
+            return None
+        if SPREADSHEET_BACKENDS[ext] is _open_xlsx_workbook and load_workbook is None:
+            self.logger.error(self.log_prefix + \
+                              "Python package openpyxl is needed to read the file (%s). Please install it or convert the file to a xls file." % \
+                              (file_name))
+            return None
+        return SPREADSHEET_BACKENDS[ext](file_name, formatting_info)
 
+    def extract_tc_from_file(self, file_name, sheet_name, review_info, workers=1, merged='0', error_report='0'):
+        if SPREADSHEET_BACKENDS.has_key(os.path.splitext(file_name)[-1].lower()):
+            self.extract_tc_from_xls(file_name, sheet_name, review_info, workers, merged, error_report)
+        elif os.path.splitext(file_name)[-1].count('.doc') > 0:
+            self.extract_tc_from_docx(file_name, review_info, workers)
+
+    def extract_tc_from_xls(self, file_name, sheet_name, review_info, workers=1, merged='0', error_report='0'):
+        ''' Convert each selected sheet to a test case file (<file>_<sheet>.xml). The sheets are converted in parallel
+            worker processes if workers > 1 (0 means one per CPU), and all sheets are merged into <file>.xml if merged
+            is '1'.
+            Each row is validated before it's converted. The errors are reported (and highlighted in <file>[Errors].xls
+            if error_report is '1'), and no file is written for a sheet with errors.
+        '''
         if not os.path.exists(file_name):
             self.logger.error(self.log_prefix + \
                               "Cannot find the specified file (%s). Action aborted." % \
@@ -1572,7 +3187,9 @@ class FreeMind(object):
         self.logger.info(self.log_prefix + \
                          "Reading test cases from file (%s). This is going to take a while. Please wait..." % \
                          (file_name))
-        src_wb = open_workbook(file_name, on_demand=True)
+        src_wb = self._open_spreadsheet(file_name)
+        if src_wb is None:
+            return None
 
         sheet_name = sheet_name.split('|')
         sheet_name = [item.strip() for item in sheet_name]
@@ -1580,133 +3197,285 @@ class FreeMind(object):
         review_info = [item.strip() for item in review_info]
         if review_info == ['']:
             review_info = ['', '', '']
-        for s in src_wb.sheets():
-            if sheet_name <> [''] and s.name not in sheet_name:
+        sheet_names = [name for name in src_wb.sheet_names() if sheet_name == [''] or name in sheet_name]
+        if workers <= 0:
+            workers = multiprocessing.cpu_count()
+
+        results = []
+        if workers <= 1 or len(sheet_names) <= 1 or multiprocessing.current_process().daemon:
+            # Pool workers are daemonic and cannot have their own pool, so the sheets are converted one by one
+            for name in sheet_names:
+                results.append(self._extract_tc_from_sheet(src_wb, name, file_name, review_info))
+        else:
+            with PoolLogListener() as log_queue:
+                pool = multiprocessing.Pool(min(workers, len(sheet_names)), _init_pool_worker, (log_queue,))
+                results = pool.map(_extract_tc_sheet_in_worker,
+                                   [(file_name, name, review_info) for name in sheet_names])
+                pool.close()
+                pool.join()
+
+        errors = []
+        for name, output_file_name, tc_count, sheet_errors in results:
+            if sheet_errors:
+                errors.extend(sheet_errors)
                 continue
+            self.doc_cache.invalidate(output_file_name)
+            self.logger.info(self.log_prefix + \
+                             "Successfully generated test case file (%s) with %d test cases. You can now import it into TestLink" % \
+                             (output_file_name, tc_count))
+        for error in errors:
+            self.logger.error(self.log_prefix + error[3])
+        if errors:
+            self.logger.error(self.log_prefix + \
+                              "%d errors found in file (%s). No test case file is generated for the sheets with errors." % \
+                              (len(errors), file_name))
+            if error_report == '1':
+                self._write_tc_error_report(file_name, errors)
+            return -1
+
+        if merged == '1':
+            # All sheet test suites are merged into one test suite file
             tc_root = lxmlET.Element('testsuite', {'name': ''})
             lxmlET.SubElement(tc_root, 'node_order').text = lxmlET.CDATA('')
             lxmlET.SubElement(tc_root, 'details').text = lxmlET.CDATA('')
+            for name, output_file_name, tc_count, sheet_errors in results:
+                for ts_node in self._parse_xml(output_file_name, 'lxml').getroot().iterchildren('testsuite'):
+                    tc_root.append(ts_node)
+            output_file_name = file_name.replace(os.path.splitext(file_name)[-1], '.xml')
+            self._write_xml(lxmlET.ElementTree(tc_root), output_file_name, 'lxml')
+            self.logger.info(self.log_prefix + \
+                             "Successfully generated merged test case file (%s) for %d sheets." % \
+                             (output_file_name, len(results)))
+        return 0
 
-            src_sheet = src_wb.sheet_by_name(s.name)
-            ts_node = lxmlET.SubElement(tc_root, 'testsuite', {'name': s.name})
-            child_ts_node = ts_node
-            lxmlET.SubElement(ts_node, 'node_order').text = lxmlET.CDATA('')
-            lxmlET.SubElement(ts_node, 'details').text = lxmlET.CDATA('')
+    def _extract_tc_from_sheet(self, src_wb, sheet_name, file_name, review_info):
+        ''' Validate a sheet and convert it to the test case file <file>_<sheet>.xml if there is no error.
+            The rows are streamed once, each row is validated before it's converted and the conversion stops at the
+            first error, but the remaining rows are still validated.
+            Return (sheet_name, output_file_name, tc_count, errors), see _validate_tc_row for the errors.
+        '''
+        src_sheet = src_wb.sheet_by_name(sheet_name)
+        output_file_name = file_name.replace(os.path.splitext(file_name)[-1], '_' + sheet_name + '.xml')
+        xls_col_dict = dict((name, -1) for name in TC_SHEET_COLUMNS)
+        errors = []
+        tc_found = False
+        tc_count = 0
 
-            for i, cell in enumerate(src_sheet.col(0)):
-                if i < 1:
-                    continue
-                if i == 1:
-                    # Update the column index
-                    for j in range(0, src_sheet.ncols):
-                        cell_value = src_sheet.cell_value(i, j).strip()
-                        if xls_col_dict.has_key(cell_value):
-                            xls_col_dict[cell_value] = j
-                    continue
+        tc_root = lxmlET.Element('testsuite', {'name': ''})
+        lxmlET.SubElement(tc_root, 'node_order').text = lxmlET.CDATA('')
+        lxmlET.SubElement(tc_root, 'details').text = lxmlET.CDATA('')
 
-                ts_name = src_sheet.cell_value(i, xls_col_dict['TS_Name']).strip()
-                if ts_name <> '':
-                    child_ts_node = lxmlET.SubElement(ts_node, 'testsuite', {'name': ts_name})
-                    lxmlET.SubElement(child_ts_node, 'node_order').text = lxmlET.CDATA('')
-                    lxmlET.SubElement(child_ts_node, 'details').text = lxmlET.CDATA(
-                        self._replace_new_line(src_sheet.cell_value(i, xls_col_dict['TS_Details']).strip()))
-                tc_name = src_sheet.cell_value(i, xls_col_dict['Name']).strip()
-                if tc_name <> '':
-                    step_number = 1
-                    testcase = lxmlET.SubElement(child_ts_node, 'testcase', {'name': tc_name})
-                    lxmlET.SubElement(testcase, 'node_order').text = lxmlET.CDATA('')
-                    lxmlET.SubElement(testcase, 'externalid').text = lxmlET.CDATA('')
-                    lxmlET.SubElement(testcase, 'version').text = lxmlET.CDATA('1')
-                    lxmlET.SubElement(testcase, 'summary').text = lxmlET.CDATA(self._replace_new_line(src_sheet.cell_value(i, xls_col_dict['Summary']).strip()))
-                    lxmlET.SubElement(testcase, 'preconditions').text = lxmlET.CDATA(self._replace_new_line(src_sheet.cell_value(i, xls_col_dict['Preconditions']).strip()))
-                    if not execution_type_dict.has_key(src_sheet.cell_value(i, xls_col_dict['Test Execution Type']).strip()):
-                        self.logger.error(self.log_prefix + \
-                                         "Wrong test case execution type (%s) in row(%d), col(%d) in sheet(%s) of file(%s)" % \
-                                         (src_sheet.cell_value(i, xls_col_dict['Test Execution Type']).strip(), i+1, xls_col_dict['Test Execution Type']+1, s.name, file_name))
-                        return
-                    lxmlET.SubElement(testcase, 'execution_type').text = lxmlET.CDATA(execution_type_dict[src_sheet.cell_value(i, xls_col_dict['Test Execution Type']).strip()])
-                    if not importance_dict.has_key(src_sheet.cell_value(i, xls_col_dict['Importance']).strip()):
-                        self.logger.error(self.log_prefix + \
-                                         "Wrong importance type (%s) in row(%d), col(%d) in sheet(%s) of file(%s)" % \
-                                         (src_sheet.cell_value(i, xls_col_dict['Importance']).strip(), i+1, xls_col_dict['Importance']+1, s.name, file_name))
-                        return
-                    lxmlET.SubElement(testcase, 'importance').text = lxmlET.CDATA(importance_dict[src_sheet.cell_value(i, xls_col_dict['Importance']).strip()])
-                    #lxmlET.SubElement(testcase, 'status').text = lxmlET.CDATA('Final')
-
-                    steps = lxmlET.SubElement(testcase, 'steps')
-                    step = lxmlET.SubElement(steps, 'step')
-                    lxmlET.SubElement(step, 'step_number').text = lxmlET.CDATA(str(step_number))
-                    lxmlET.SubElement(step, 'actions').text = lxmlET.CDATA(self._replace_new_line(src_sheet.cell_value(i, xls_col_dict['Steps']).strip()))
-                    lxmlET.SubElement(step, 'expectedresults').text = lxmlET.CDATA(self._replace_new_line(src_sheet.cell_value(i, xls_col_dict['Expected Results']).strip()))
-                    if not execution_type_dict.has_key(src_sheet.cell_value(i, xls_col_dict['Step Execution Type']).strip()):
-                        self.logger.error(self.log_prefix + \
-                                         "Wrong test step execution type (%s) in row(%d), col(%d) in sheet(%s) of file(%s)" % \
-                                         (src_sheet.cell_value(i, xls_col_dict['Step Execution Type']).strip(), i+1, xls_col_dict['Step Execution Type']+1, s.name, file_name))
-                        return
-                    lxmlET.SubElement(step, 'execution_type').text = lxmlET.CDATA(execution_type_dict[src_sheet.cell_value(i, xls_col_dict['Step Execution Type']).strip()])
-
-                    custom_fields = lxmlET.SubElement(testcase, 'custom_fields')
-                    custom_field = lxmlET.SubElement(custom_fields, 'custom_field')
-                    lxmlET.SubElement(custom_field, 'name').text = lxmlET.CDATA('HGI Regression Level')
-                    regression_level = int(src_sheet.cell_value(i, xls_col_dict['HGI Regression Level']))
-                    regression_level = '|'.join(regression_level_list[:len(regression_level_list) - regression_level + 1])
-                    lxmlET.SubElement(custom_field, 'value').text = lxmlET.CDATA(regression_level)
-                    custom_field = lxmlET.SubElement(custom_fields, 'custom_field')
-                    lxmlET.SubElement(custom_field, 'name').text = lxmlET.CDATA('HGI Test Team')
-                    lxmlET.SubElement(custom_field, 'value').text = lxmlET.CDATA(src_sheet.cell_value(i, xls_col_dict['HGI Test Team']).strip())
-                    custom_field = lxmlET.SubElement(custom_fields, 'custom_field')
-                    lxmlET.SubElement(custom_field, 'name').text = lxmlET.CDATA('Reviewed')
-                    lxmlET.SubElement(custom_field, 'value').text = lxmlET.CDATA(review_info[0])
-                    custom_field = lxmlET.SubElement(custom_fields, 'custom_field')
-                    lxmlET.SubElement(custom_field, 'name').text = lxmlET.CDATA('Reviewed Version')
-                    lxmlET.SubElement(custom_field, 'value').text = lxmlET.CDATA(review_info[1])
-                    custom_field = lxmlET.SubElement(custom_fields, 'custom_field')
-                    lxmlET.SubElement(custom_field, 'name').text = lxmlET.CDATA('Review Info')
-                    lxmlET.SubElement(custom_field, 'value').text = lxmlET.CDATA(review_info[2])
-
-                step_info = src_sheet.cell_value(i, xls_col_dict['Steps'])
-                if step_info <> "":
-                    step_number += 1
-                    step = lxmlET.SubElement(steps, 'step')
-                    lxmlET.SubElement(step, 'step_number').text = lxmlET.CDATA(str(step_number))
-                    lxmlET.SubElement(step, 'actions').text = lxmlET.CDATA(self._replace_new_line(src_sheet.cell_value(i, xls_col_dict['Steps']).strip()))
-                    lxmlET.SubElement(step, 'expectedresults').text = lxmlET.CDATA(self._replace_new_line(src_sheet.cell_value(i, xls_col_dict['Expected Results']).strip()))
-                    if not execution_type_dict.has_key(src_sheet.cell_value(i, xls_col_dict['Step Execution Type']).strip()):
-                        self.logger.error(self.log_prefix + \
-                                         "Wrong test step execution type (%s) in row(%d), col(%d) in sheet(%s) of file(%s)" % \
-                                         (src_sheet.cell_value(i, xls_col_dict['Step Execution Type']).strip(), i+1, xls_col_dict['Step Execution Type'] + 1, s.name, file_name))
-                        return
-                    lxmlET.SubElement(step, 'execution_type').text = lxmlET.CDATA(execution_type_dict[src_sheet.cell_value(i, xls_col_dict['Step Execution Type']).strip()])
-                    # requirements = lxmlET.SubElement(testcase, 'requirements')
-                    # requirement = lxmlET.SubElement(requirements, 'requirement')
-                    # lxmlET.SubElement(requirement, 'req_spec_title').text = lxmlET.CDATA(
-                    #     os.path.splitext(os.path.split(self.tds_url)[-1])[0])
-                    # lxmlET.SubElement(requirement, 'doc_id').text = lxmlET.CDATA(tc_tds_dict[tds_item.attrib['ID']][0])
-                    # if not tc_pfs_dict.has_key(tds_item.attrib['ID']):
-                    #     return
-                    # for pfs_id in tc_pfs_dict[tds_item.attrib['ID']]:
-                    #     requirement = lxmlET.SubElement(requirements, 'requirement')
-                    #     lxmlET.SubElement(requirement, 'req_spec_title').text = lxmlET.CDATA(
-                    #         os.path.splitext(os.path.split(self.pfs_url)[-1])[0])
-                    #     lxmlET.SubElement(requirement, 'doc_id').text = lxmlET.CDATA(pfs_id)
-
-            output_file_name = file_name.replace(os.path.splitext(file_name)[-1], '_' + s.name + '.xml')
-            f = open(output_file_name, 'w')
-            f.write(lxmlET.tostring(tc_root, xml_declaration=True, encoding='UTF-8', pretty_print=True))
-            f.close
-            self.logger.info(self.log_prefix + \
-                             "Successfully generated test case file (%s). You can now import it into TestLink" % \
-                             (output_file_name))
+        ts_node = lxmlET.SubElement(tc_root, 'testsuite', {'name': sheet_name})
+        child_ts_node = ts_node
+        lxmlET.SubElement(ts_node, 'node_order').text = lxmlET.CDATA('')
+        lxmlET.SubElement(ts_node, 'details').text = lxmlET.CDATA('')
+
+        for i, row in enumerate(iter_sheet_rows(src_sheet)):
+            if i == 1:
+                errors = self._read_tc_sheet_header(row, xls_col_dict, src_sheet.name, file_name)
+                if errors:
+                    return sheet_name, output_file_name, 0, errors
+                row_len = max(xls_col_dict.values()) + 1
+            if i < 2:
+                continue
+            if len(row) < row_len:
+                # The trailing empty cells are not given for the xlsx files
+                row = row + [u''] * (row_len - len(row))
+            row_errors = self._validate_tc_row(i, row, xls_col_dict, tc_found, src_sheet.name, file_name)
+            tc_found = tc_found or unicode(row[xls_col_dict['Name']]).strip() <> ''
+            if row_errors or errors:
+                errors.extend(row_errors)
+                continue
+
+            ts_name = row[xls_col_dict['TS_Name']].strip()
+            if ts_name <> '':
+                child_ts_node = lxmlET.SubElement(ts_node, 'testsuite', {'name': ts_name})
+                lxmlET.SubElement(child_ts_node, 'node_order').text = lxmlET.CDATA('')
+                lxmlET.SubElement(child_ts_node, 'details').text = lxmlET.CDATA(
+                    self._replace_new_line(row[xls_col_dict['TS_Details']].strip()))
+            tc_name = row[xls_col_dict['Name']].strip()
+            if tc_name <> '':
+                tc_count += 1
+                step_number = 1
+                testcase = lxmlET.SubElement(child_ts_node, 'testcase', {'name': tc_name})
+                lxmlET.SubElement(testcase, 'node_order').text = lxmlET.CDATA('')
+                lxmlET.SubElement(testcase, 'externalid').text = lxmlET.CDATA('')
+                lxmlET.SubElement(testcase, 'version').text = lxmlET.CDATA('1')
+                lxmlET.SubElement(testcase, 'summary').text = lxmlET.CDATA(self._replace_new_line(row[xls_col_dict['Summary']].strip()))
+                lxmlET.SubElement(testcase, 'preconditions').text = lxmlET.CDATA(self._replace_new_line(row[xls_col_dict['Preconditions']].strip()))
+                lxmlET.SubElement(testcase, 'execution_type').text = lxmlET.CDATA(TC_EXECUTION_TYPES[row[xls_col_dict['Test Execution Type']].strip()])
+                lxmlET.SubElement(testcase, 'importance').text = lxmlET.CDATA(TC_IMPORTANCE[row[xls_col_dict['Importance']].strip()])
+                #lxmlET.SubElement(testcase, 'status').text = lxmlET.CDATA('Final')
+
+                steps = lxmlET.SubElement(testcase, 'steps')
+                step = lxmlET.SubElement(steps, 'step')
+                lxmlET.SubElement(step, 'step_number').text = lxmlET.CDATA(str(step_number))
+                lxmlET.SubElement(step, 'actions').text = lxmlET.CDATA(self._replace_new_line(row[xls_col_dict['Steps']].strip()))
+                lxmlET.SubElement(step, 'expectedresults').text = lxmlET.CDATA(self._replace_new_line(row[xls_col_dict['Expected Results']].strip()))
+                lxmlET.SubElement(step, 'execution_type').text = lxmlET.CDATA(TC_EXECUTION_TYPES[row[xls_col_dict['Step Execution Type']].strip()])
+
+                custom_fields = lxmlET.SubElement(testcase, 'custom_fields')
+                custom_field = lxmlET.SubElement(custom_fields, 'custom_field')
+                lxmlET.SubElement(custom_field, 'name').text = lxmlET.CDATA('HGI Regression Level')
+                regression_level = int(row[xls_col_dict['HGI Regression Level']])
+                regression_level = '|'.join(TC_REGRESSION_LEVELS[:len(TC_REGRESSION_LEVELS) - regression_level + 1])
+                lxmlET.SubElement(custom_field, 'value').text = lxmlET.CDATA(regression_level)
+                custom_field = lxmlET.SubElement(custom_fields, 'custom_field')
+                lxmlET.SubElement(custom_field, 'name').text = lxmlET.CDATA('HGI Test Team')
+                lxmlET.SubElement(custom_field, 'value').text = lxmlET.CDATA(row[xls_col_dict['HGI Test Team']].strip())
+                custom_field = lxmlET.SubElement(custom_fields, 'custom_field')
+                lxmlET.SubElement(custom_field, 'name').text = lxmlET.CDATA('Reviewed')
+                lxmlET.SubElement(custom_field, 'value').text = lxmlET.CDATA(review_info[0])
+                custom_field = lxmlET.SubElement(custom_fields, 'custom_field')
+                lxmlET.SubElement(custom_field, 'name').text = lxmlET.CDATA('Reviewed Version')
+                lxmlET.SubElement(custom_field, 'value').text = lxmlET.CDATA(review_info[1])
+                custom_field = lxmlET.SubElement(custom_fields, 'custom_field')
+                lxmlET.SubElement(custom_field, 'name').text = lxmlET.CDATA('Review Info')
+                lxmlET.SubElement(custom_field, 'value').text = lxmlET.CDATA(review_info[2])
+
+            step_info = row[xls_col_dict['Steps']]
+            if step_info <> "":
+                step_number += 1
+                step = lxmlET.SubElement(steps, 'step')
+                lxmlET.SubElement(step, 'step_number').text = lxmlET.CDATA(str(step_number))
+                lxmlET.SubElement(step, 'actions').text = lxmlET.CDATA(self._replace_new_line(row[xls_col_dict['Steps']].strip()))
+                lxmlET.SubElement(step, 'expectedresults').text = lxmlET.CDATA(self._replace_new_line(row[xls_col_dict['Expected Results']].strip()))
+                lxmlET.SubElement(step, 'execution_type').text = lxmlET.CDATA(TC_EXECUTION_TYPES[row[xls_col_dict['Step Execution Type']].strip()])
+
+        if errors:
+            return sheet_name, output_file_name, 0, errors
+        f = open(output_file_name, 'w')
+        f.write(lxmlET.tostring(tc_root, xml_declaration=True, encoding='UTF-8', pretty_print=True))
+        f.close()
+        return sheet_name, output_file_name, tc_count, errors
+
+    def _read_tc_sheet_header(self, row, xls_col_dict, sheet_name, file_name):
+        ''' Find the columns of TC_SHEET_COLUMNS in the header row (the second row) of a test case sheet and set
+            their indexes in xls_col_dict (column name -> column index). Return the errors of the missing columns.
+        '''
+        errors = []
+        for j, cell_value in enumerate(row):
+            cell_value = unicode(cell_value).strip()
+            if xls_col_dict.has_key(cell_value):
+                xls_col_dict[cell_value] = j
+        for name in TC_SHEET_COLUMNS:
+            if xls_col_dict[name] == -1:
+                errors.append((sheet_name, 1, -1, "Missing column (%s) in row(2) in sheet(%s) of file(%s)" % \
+                               (name, sheet_name, file_name)))
+        return errors
+
+    def _validate_tc_row(self, i, row, xls_col_dict, tc_found, sheet_name, file_name):
+        ''' Check a row of a test case sheet against the schema (TC_SHEET_COLUMNS...) before any xml is generated
+            for it. tc_found tells if a test case is given by the previous rows.
+            Return a list of errors (sheet_name, row, col, message), row and col are 0-based and col is -1 if the
+            error is not on a cell.
+        '''
+        errors = []
+
+        def add_error(name, message):
+            col = xls_col_dict[name]
+            errors.append((sheet_name, i, col, "%s (%s) in row(%d), col(%d) in sheet(%s) of file(%s)" % \
+                           (message, row[col], i + 1, col + 1, sheet_name, file_name)))
+
+        for name in TC_SHEET_TEXT_COLUMNS:
+            if not isinstance(row[xls_col_dict[name]], basestring):
+                add_error(name, "Not a text value")
+
+        is_tc = unicode(row[xls_col_dict['Name']]).strip() <> ''
+        is_step = row[xls_col_dict['Steps']] <> ''
+        if is_step and not (tc_found or is_tc):
+            add_error('Steps', "Test step without test case")
+        if is_tc:
+            if not TC_EXECUTION_TYPES.has_key(unicode(row[xls_col_dict['Test Execution Type']]).strip()):
+                add_error('Test Execution Type', "Wrong test case execution type")
+            if not TC_IMPORTANCE.has_key(unicode(row[xls_col_dict['Importance']]).strip()):
+                add_error('Importance', "Wrong importance type")
+            try:
+                regression_level = int(row[xls_col_dict['HGI Regression Level']])
+            except ValueError:
+                regression_level = 0
+            if not 1 <= regression_level <= len(TC_REGRESSION_LEVELS):
+                add_error('HGI Regression Level', "Wrong HGI regression level")
+        if is_tc or is_step:
+            if not TC_EXECUTION_TYPES.has_key(unicode(row[xls_col_dict['Step Execution Type']]).strip()):
+                add_error('Step Execution Type', "Wrong test step execution type")
+        errors.sort(key=lambda error: error[2])
+        return errors
+
+    def _write_tc_error_report(self, file_name, errors):
+        ''' Write the values of the sheets with errors to <file>[Errors].xls (or [Errors].xlsx for the xlsx files).
+            The cells with errors are highlighted with red background color and the error messages of each row are
+            added as the last column, the messages of the header row (missing columns) follow its title.
+        '''
+        ext = os.path.splitext(file_name)[-1]
+        src_wb = self._open_spreadsheet(file_name)
+        if isinstance(src_wb, XlsxWorkbook):
+            # The rows are streamed to the report, and an xls report could not hold more than 65536 rows
+            output_file_name = file_name.replace(ext, '[Errors].xlsx')
+            dst_wb = XlsxWriteWorkbook(write_only=True)
+            error_fill = PatternFill('solid', fgColor='FF0000')
+        else:
+            output_file_name = file_name.replace(ext, '[Errors].xls')
+            dst_wb = XlsWriteWorkbook()
+            error_style = easyxf('pattern: pattern solid, fore_colour red;')
+        sheet_errors = OrderedDict()
+        for sheet_name, row, col, message in errors:
+            sheet_errors.setdefault(sheet_name, []).append((row, col, message))
+        for sheet_name, row_errors in sheet_errors.items():
+            src_sheet = src_wb.sheet_by_name(sheet_name)
+            if isinstance(src_wb, XlsxWorkbook):
+                dst_sheet = dst_wb.create_sheet(sheet_name)
+                for row in self._iter_tc_error_report_rows(src_sheet, row_errors):
+                    cells = []
+                    for value, error in row:
+                        cell = WriteOnlyCell(dst_sheet, value=None if value == u'' else value)
+                        if error:
+                            cell.fill = error_fill
+                        cells.append(cell)
+                    dst_sheet.append(cells)
+            else:
+                dst_sheet = dst_wb.add_sheet(sheet_name)
+                for i, row in enumerate(self._iter_tc_error_report_rows(src_sheet, row_errors)):
+                    for j, (value, error) in enumerate(row):
+                        if error:
+                            dst_sheet.write(i, j, value, error_style)
+                        elif value <> '':
+                            dst_sheet.write(i, j, value)
+        dst_wb.save(output_file_name)
+        self.logger.info(self.log_prefix + \
+                         "The test case errors are highlighted in file (%s)." % \
+                         (output_file_name))
+
+    def _iter_tc_error_report_rows(self, src_sheet, row_errors):
+        ''' Iterate the rows of the error report of a sheet as lists of (value, highlighted). The sheet is streamed
+            twice, once for the number of columns and once for the values.
+        '''
+        error_cells = set((row, col) for row, col, message in row_errors)
+        row_messages = {}
+        for row, col, message in row_errors:
+            row_messages.setdefault(row, []).append(message)
+        ncols = 0
+        for row in iter_sheet_rows(src_sheet):
+            ncols = max(ncols, len(row))
+        header_messages = row_messages.pop(1, [])
+        for i, row in enumerate(iter_sheet_rows(src_sheet)):
+            row = [(value, (i, j) in error_cells) for j, value in enumerate(row)]
+            if i == 1:
+                row.extend([(u'', False)] * (ncols - len(row)))
+                row.append(('\n'.join(['Validation Errors'] + header_messages), len(header_messages) > 0))
+            elif row_messages.has_key(i):
+                row.extend([(u'', False)] * (ncols - len(row)))
+                row.append(('\n'.join(row_messages[i]), True))
+            yield row
 
     def _replace_new_line(self, text):
         return '<p>' + text.replace('\n', '</p><p>') + '</p>'
 
-    def extract_requirements(self, req_file_name, template):
+    def extract_requirements(self, req_file_name, template, workers=1):
         pmr_list = []
         pfs_list = []
-        pfs_pmr_list = []
-        pmr_pfs_list = []
-        prefixed_pmr_pfs_list = []
+        pfs_pmr_graph = TraceabilityGraph()
+        prefixed_pmr_pfs_graph = TraceabilityGraph()
 
         if not os.path.exists(req_file_name):
             self.logger.error(self.log_prefix + \
@@ -1715,23 +3484,23 @@ class FreeMind(object):
             return None
 
         if template == 'KreaTV':
-            res = self._read_req_from_xls_kreatv(req_file_name, pmr_list, pfs_list, pfs_pmr_list)
+            res = self._read_req_from_xls_kreatv(req_file_name, pmr_list, pfs_list, pfs_pmr_graph)
         else:
             if os.path.splitext(req_file_name)[-1] in ['.doc', '.docx']:
-                res = self._read_req_from_docx_hgi(req_file_name, pmr_list, pfs_list, pfs_pmr_list)
+                res = self._read_req_from_docx_hgi(req_file_name, pmr_list, pfs_list, pfs_pmr_graph, workers)
             else:
-                res = self._read_req_from_xls_hgi(req_file_name, pmr_list, pfs_list, pfs_pmr_list)
+                res = self._read_req_from_xls_hgi(req_file_name, pmr_list, pfs_list, pfs_pmr_graph)
 
-        if len(pfs_pmr_list) > 0:
-            res = self._reverse_links(pfs_pmr_list, pmr_pfs_list)
-            res = self._add_req_prefix(pmr_pfs_list, prefixed_pmr_pfs_list)
+        if len(pfs_pmr_graph) > 0:
+            pmr_pfs_graph = self._reverse_links(pfs_pmr_graph)
+            res = self._add_req_prefix(pmr_pfs_graph, prefixed_pmr_pfs_graph)
 
         # Get the filename without extension.
         title = os.path.splitext(os.path.split(self.pmr_url)[-1])[0]
         if len(pmr_list) > 0:
-            res = self._gen_req_xml(pmr_list, title, self.pmr_url, self.pmr_prefix, prefixed_pmr_pfs_list)
+            res = self._gen_req_xml(pmr_list, title, self.pmr_url, self.pmr_prefix, prefixed_pmr_pfs_graph)
         title = os.path.splitext(os.path.split(self.pfs_url)[-1])[0]
-        res = self._gen_req_xml(pfs_list, title, self.pfs_url, self.pfs_prefix, prefixed_pmr_pfs_list)
+        res = self._gen_req_xml(pfs_list, title, self.pfs_url, self.pfs_prefix, prefixed_pmr_pfs_graph)
 
         title = os.path.splitext(os.path.split(self.pmr_url)[-1])[0]
         if len(pmr_list) > 0:
@@ -1739,106 +3508,100 @@ class FreeMind(object):
         title = os.path.splitext(os.path.split(self.pfs_url)[-1])[0]
         res = self._gen_req_freemind(pfs_list, title, self.pfs_url.replace('.xml', '.mm'), self.pfs_prefix)
 
-        if len(pfs_pmr_list) > 0:
+        if len(pfs_pmr_graph) > 0:
             res = self._build_fm_traceability(self.pfs_url.replace('.xml', '.mm'), self.pmr_url.replace('.xml', '.mm'),
-                                              pfs_pmr_list, self.pfs_url.replace('.xml', '[PFS-PMR].mm'))
+                                              pfs_pmr_graph, self.pfs_url.replace('.xml', '[PFS-PMR].mm'))
             res = self._build_fm_traceability(self.pmr_url.replace('.xml', '.mm'), self.pfs_url.replace('.xml', '.mm'),
-                                              pmr_pfs_list, self.pmr_url.replace('.xml', '[PMR-PFS].mm'))
+                                              pmr_pfs_graph, self.pmr_url.replace('.xml', '[PMR-PFS].mm'))
         return res
 
-    def _add_req_prefix(self, pmr_pfs_list, prefixed_pmr_pfs_list):
-        for i, pmr_item in enumerate(pmr_pfs_list):
-            prefixed_pmr_pfs_list.append([self.pmr_prefix + pmr_item[0], []])
-            for pfs_item in pmr_item[1]:
-                prefixed_pmr_pfs_list[i][1].append(self.pfs_prefix + pfs_item)
+    def _add_req_prefix(self, pmr_pfs_graph, prefixed_pmr_pfs_graph):
+        for pmr_id in pmr_pfs_graph:
+            prefixed_pmr_pfs_graph.add_links(self.pmr_prefix + pmr_id,
+                                             [self.pfs_prefix + pfs_id for pfs_id in pmr_pfs_graph.links(pmr_id)])
         return 0
 
-    def _reverse_links(self, orig_list, reversed_list):
-        ''' The original list is something like [PFS_ID, [PMR_ID1, PMRID2,...]].
-            The reversed list is something like [PMR_ID, [PFS_ID1, PFS_ID2]]
+    def _reverse_links(self, orig_graph):
+        ''' The original graph is something like PFS_ID->[PMR_ID1, PMRID2,...].
+            The reversed graph is something like PMR_ID->[PFS_ID1, PFS_ID2]
+            Links are kept in both directions, so this is only a view of the same traceability graph.
         '''
         self.logger.debug(self.log_prefix + \
                           "Reversing the traceability links.")
-        for orig_link in orig_list:
-            src_id = orig_link[0]
-            for link_id in orig_link[1]:
-                if link_id == '':
-                    continue
-                reversed_link_exist = False
-                i = 0
-                for i, reversed_link in enumerate(reversed_list):
-                    if reversed_link[0] == link_id:
-                        reversed_link_exist = True
-                        break
-                if reversed_link_exist:
-                    reversed_list[i][1].append(src_id)
-                else:
-                    reversed_list.append([link_id, [src_id]])
+        return orig_graph.reverse()
 
-                    #pprint.pprint(pmr_pfs_list)
-        return 0
+    def _get_prefix_index(self, fm_root, link_only=False):
+        ''' Index the FreeMind nodes by the prefix ID (the node text before PREFIX_TITLE_SEP) thus the traceability
+            can be built without looping through the whole map for each link.
+            The first node will be used if there are nodes with the same prefix ID.
+        '''
+        prefix_index = {}
+        classifier = self._get_node_classifier()
+        for node in fm_root.iter('node'):
+            if link_only and not node.attrib.has_key('LINK'):
+                continue
+            prefix_index.setdefault(classifier.text_prefix(node.attrib['TEXT']), node)
+        return prefix_index
 
-    def _build_fm_traceability(self, dst_fm, src_fm, link_list, output_file, tds_file=False):
-        ''' This function is using to two FreeMind maps by using the traceability list in link_list[]
-            link_list[] has the format of either [PFS_ID, [PMR_ID1, PMRID2,...]] or [PMR_ID, [PFS_ID1, PFS_ID2]] depends on 
+    def _build_fm_traceability(self, dst_fm, src_fm, link_graph, output_file, tds_file=False):
+        ''' This function is using to two FreeMind maps by using the traceability graph link_graph
+            link_graph has the links of either PFS_ID->[PMR_ID1, PMRID2,...] or PMR_ID->[PFS_ID1, PFS_ID2] depends on
             what's the destination FreeMind map.
         '''
         self.logger.info(self.log_prefix + \
                          "Building the FreeMind traceability file %s (Between %s and %s)." % \
                          (output_file, dst_fm, src_fm))
-        dst_fm_tree = ET.parse(dst_fm)
+        dst_fm_tree = self._parse_xml(dst_fm)
         dst_fm_root = dst_fm_tree.getroot()
-        src_fm_root = ET.parse(src_fm).getroot()
-        new_added_nodes = []
-
-        for dst_node in dst_fm_root.iter('node'):
+        # Only the source nodes which are linked are materialized (once) from the source map
+        src_map = FreeMindMap(src_fm)
+        src_index = self._get_prefix_index(src_map.getroot())
+        src_elements = {}
+        if tds_file:
+            tds_analysis = TdsMapAnalysis(dst_fm_root, self._get_node_classifier())
+
+        # Please note the linked source nodes are appended to the destination nodes, so all destination nodes are
+        # collected before the map is changed. Thus the new added nodes will never be looped through.
+        for dst_node in list(dst_fm_root.iter('node')):
             if tds_file:
-                if not self._last_tds_node(dst_node):
+                if not tds_analysis.is_tds_item(dst_node):
                     continue
             else:
                 if dst_node.find('node') is not None:
                     continue
-            # Please note the new added nodes will be looped through iter again so we need to ignore that by using new_added_nodes[]
-            if dst_node.attrib['TEXT'] not in new_added_nodes:
-                if tds_file:
-                    dst_id = dst_node.attrib['ID'].strip()
+            if tds_file:
+                dst_id = dst_node.attrib['ID'].strip()
+            else:
+                dst_id = self._get_node_classifier().text_prefix(dst_node.attrib['TEXT'].strip())
+            traceability_links = link_graph.links(dst_id)
+            if traceability_links == []:
+                # Highlight the node with traceability missing
+                self.logger.warning(self.log_prefix + \
+                                    "Highlight the node (%s) with missing traceability for file %s." % \
+                                    (dst_node.attrib['TEXT'].strip(), output_file))
+                dst_node.set('BACKGROUND_COLOR', '#ff0000')
+            for link_id in traceability_links:
+                if link_id == '':
+                    continue
+                if src_index.has_key(link_id):
+                    if not src_elements.has_key(link_id):
+                        src_elements[link_id] = src_index[link_id].element()
+                    dst_node.append(src_elements[link_id])
+                    self.logger.debug(self.log_prefix + \
+                                      "Add link %s to %s." % \
+                                      (link_id, dst_id))
                 else:
-                    dst_id = dst_node.attrib['TEXT'].strip().split(PREFIX_TITLE_SEP)[0]
-                traceability_links = []
-                for traceability in link_list:
-                    if dst_id == traceability[0]:
-                        traceability_links = traceability[1]
-                        break
-                if (traceability_links == []) or (traceability_links == ['']):
+                    self.logger.warning(self.log_prefix + \
+                                        "Cannot find link %s for %s for file %s." % \
+                                        (link_id, dst_id, output_file))
                     # Highlight the node with traceability missing
                     self.logger.warning(self.log_prefix + \
                                         "Highlight the node (%s) with missing traceability for file %s." % \
                                         (dst_node.attrib['TEXT'].strip(), output_file))
                     dst_node.set('BACKGROUND_COLOR', '#ff0000')
-                for link_id in traceability_links:
-                    if link_id == '':
-                        continue
-                    link_found = False
-                    for src_node in src_fm_root.iter('node'):
-                        if (src_node.attrib['TEXT'].split(PREFIX_TITLE_SEP)[0] == link_id):
-                            link_found = True
-                            dst_node.append(src_node)
-                            new_added_nodes.append(src_node.attrib['TEXT'])
-                            self.logger.debug(self.log_prefix + \
-                                              "Add link %s to %s." % \
-                                              (link_id, dst_id))
-                            break
-                    if not link_found:
-                        self.logger.warning(self.log_prefix + \
-                                            "Cannot find link %s for %s for file %s." % \
-                                            (link_id, dst_id, output_file))
-                        # Highlight the node with traceability missing
-                        self.logger.warning(self.log_prefix + \
-                                            "Highlight the node (%s) with missing traceability for file %s." % \
-                                            (dst_node.attrib['TEXT'].strip(), output_file))
-                        dst_node.set('BACKGROUND_COLOR', '#ff0000')
-
-        dst_fm_tree.write(output_file)
+        src_map.close()
+
+        self._write_xml(dst_fm_tree, output_file)
 
         self.logger.info(self.log_prefix + \
                          "Successfully built the FreeMind traceability file %s (Between %s and %s)." % \
@@ -1846,57 +3609,54 @@ class FreeMind(object):
 
         return 0
 
-    def _link_pfs_pmr(self, dst_fm, src_fm, link_list, output_file):
-        ''' This function is using to link PMR FreeMind map and PFS FreeMind map by using the traceability list in link_list[]
-            link_list[] has the format of either [PFS_ID, [PMR_ID1, PMRID2,...]] or [PMR_ID, [PFS_ID1, PFS_ID2]] depends on 
+    def _link_pfs_pmr(self, dst_fm, src_fm, link_graph, output_file):
+        ''' This function is using to link PMR FreeMind map and PFS FreeMind map by using the traceability graph link_graph
+            link_graph has the links of either PFS_ID->[PMR_ID1, PMRID2,...] or PMR_ID->[PFS_ID1, PFS_ID2] depends on
             what's the destination FreeMind map.
         '''
-        dst_fm_tree = ET.parse(dst_fm)
+        dst_fm_tree = self._parse_xml(dst_fm)
         dst_fm_root = dst_fm_tree.getroot()
-        src_fm_root = ET.parse(src_fm).getroot()
-        new_added_nodes = []
-
-        for dst_node in dst_fm_root.iter('node'):
-            # Please note the new added nodes will be looped through iter again so we need to ignore that by using new_added_nodes[]
-            if dst_node.attrib.has_key('LINK') and (dst_node.attrib['TEXT'] not in new_added_nodes):
-                req_id = dst_node.attrib['TEXT'].split(PREFIX_TITLE_SEP)[0]
-                req_links = []
-                for req_trace in link_list:
-                    if req_id == req_trace[0]:
-                        req_links = req_trace[1]
-                        break
-                if (req_links == []) or (req_links == ['']):
-                    # Highlight the node with traceability missing
-                    self.logger.warning(self.log_prefix + \
-                                        "Cannot find the requirement links for %s." % \
-                                        (req_id))
-                    dst_node.set('BACKGROUND_COLOR', '#ff0000')
-                for req_link_id in req_links:
-                    if req_link_id == '':
-                        continue
-                    link_found = False
-                    for src_node in src_fm_root.iter('node'):
-                        if src_node.attrib.has_key('LINK') and (
-                                    src_node.attrib['TEXT'].split(PREFIX_TITLE_SEP)[0] == req_link_id):
-                            link_found = True
-                            dst_node.append(src_node)
-                            new_added_nodes.append(src_node.attrib['TEXT'])
-                            self.logger.info(self.log_prefix + \
-                                             "Add requirement link %s to %s." % \
-                                             (req_link_id, req_id))
-                            break
-                    if not link_found:
-                        self.logger.error(self.log_prefix + \
-                                          "Cannot find requirement link %s for %s." % \
-                                          (req_link_id, req_id))
+        src_map = FreeMindMap(src_fm)
+        src_index = self._get_prefix_index(src_map.getroot(), True)
+        src_elements = {}
+
+        # Please note the linked source nodes are appended to the destination nodes, so all destination nodes are
+        # collected before the map is changed. Thus the new added nodes will never be looped through.
+        for dst_node in list(dst_fm_root.iter('node')):
+            if not dst_node.attrib.has_key('LINK'):
+                continue
+            req_id = self._get_node_classifier().text_prefix(dst_node.attrib['TEXT'])
+            req_links = link_graph.links(req_id)
+            if req_links == []:
+                # Highlight the node with traceability missing
+                self.logger.warning(self.log_prefix + \
+                                    "Cannot find the requirement links for %s." % \
+                                    (req_id))
+                dst_node.set('BACKGROUND_COLOR', '#ff0000')
+            for req_link_id in req_links:
+                if req_link_id == '':
+                    continue
+                if src_index.has_key(req_link_id):
+                    if not src_elements.has_key(req_link_id):
+                        src_elements[req_link_id] = src_index[req_link_id].element()
+                    dst_node.append(src_elements[req_link_id])
+                    self.logger.info(self.log_prefix + \
+                                     "Add requirement link %s to %s." % \
+                                     (req_link_id, req_id))
+                else:
+                    self.logger.error(self.log_prefix + \
+                                      "Cannot find requirement link %s for %s." % \
+                                      (req_link_id, req_id))
+        src_map.close()
 
-        dst_fm_tree.write(output_file)
+        self._write_xml(dst_fm_tree, output_file)
 
         return 0
 
     def _gen_req_freemind(self, req_list, title, output_file, prefix):
-        ''' req_list is a list like [GROUP_NAME, [ [REQ_ID, REQ_TITLE, REQ_DESC, REQ_VER_TEAM], ... ] ]
-            REQ_ID and REQ_TITLE will be combined as the node text and REQ_DESC will be displayed as comments
+        ''' req_list is a list of RequirementGroup.
+            The requirement ID, verification team and title will be combined as the node text and the description
+            will be displayed as comments
         '''
         self.logger.info(self.log_prefix + \
                          "Generating the FreeMind file %s (Document Title: %s. Document ID Prefix: %s)." % \
@@ -1911,14 +3671,13 @@ class FreeMind(object):
 
         req_count = 0
         for group in req_list:
-            group_node = lxmlET.SubElement(root_node, 'node', {'COLOR': '#990000', 'FOLDED': "true", 'TEXT': group[0]})
+            group_node = lxmlET.SubElement(root_node, 'node', {'COLOR': '#990000', 'FOLDED': "true", 'TEXT': group.name})
             i = 0
-            for i, req_item in enumerate(group[1]):
-                node_text = req_item[REQ_ID] + PREFIX_TITLE_SEP + req_item[REQ_VER_TEAM] + PREFIX_TITLE_SEP + req_item[
-                    REQ_TITLE]
-                node_comment = req_item[REQ_DESC]
+            for i, req_item in enumerate(group.items):
+                node_text = req_item.req_id + PREFIX_TITLE_SEP + req_item.ver_team + PREFIX_TITLE_SEP + req_item.title
+                node_comment = req_item.desc
                 node_link = self.testlink_url + '/linkto.php?tprojectPrefix=' + self.repo_prefix + '&item=req&id=' + prefix + \
-                            req_item[REQ_ID]
+                            req_item.req_id
                 req_node = lxmlET.SubElement(group_node, 'node',
                                              {'COLOR': '#990000', 'LINK': node_link, 'TEXT': node_text})
                 richcontent = lxmlET.SubElement(req_node, 'richcontent', {'TYPE': 'NOTE'})
@@ -1934,19 +3693,20 @@ class FreeMind(object):
         root_node.attrib['TEXT'] = root_node.attrib['TEXT'] + '[' + str(req_count) + ']'
 
         #self._update_pfs_node_format(freemind)
-        lxmlET.ElementTree(freemind).write(output_file)
+        self._write_xml(lxmlET.ElementTree(freemind), output_file, 'lxml')
         self.logger.info(self.log_prefix + \
                          "Successfully generated the FreeMind file %s (Document Title: %s. Document ID Prefix: %s)." % \
                          (output_file, title, prefix))
         return 0
 
-    def _read_req_from_docx_hgi(self, file_name, pmr_list, pfs_list, trace_list):
+    def _read_req_from_docx_hgi(self, file_name, pmr_list, pfs_list, trace_graph, workers=1):
         """
         Read requirements from HGI SDS template
         :param file_name:
         :param pmr_list:
         :param pfs_list:
-        :param trace_list:
+        :param trace_graph:
+        :param workers: number of processes reading the tables, 1 reads them one by one and 0 means one per CPU
         """
         self.logger.info(self.log_prefix + \
                          "Reading requirements from file (%s). This is going to take a while. Please wait..." % \
@@ -1956,30 +3716,29 @@ class FreeMind(object):
             self.logger.error(self.log_prefix + \
                               "I am sorry that I can not parse this file. Please convert it to a docx file.")
             exit(-1)
-        pfs_index_list = []
-        pfs_grp_list = []
+        catalog = RequirementCatalog(pmr_list, pfs_list)
         pfs_grp_id = 0
         valid_columns = ['Index', 'Category', 'Description', 'DEV', 'DVT', 'FT', 'SI&T', 'Comment']
         ver_team_list = ['DEV', 'DVT', 'FT', 'SIT']
         pfs_ver_team = ''
-        document = Document(file_name)
-        for table in document.tables:
+        if workers <= 0:
+            workers = multiprocessing.cpu_count()
+        for table in read_docx_tables(file_name, workers):
             invalid_table = False
-            if len(table.columns) != len(valid_columns):
+            if table.ncols != len(valid_columns):
                 continue
-            for i in range(0, len(table.rows)):
+            for i in range(0, table.nrows):
                 pfs_item = []
-                for j in range(0, len(table.columns)):
-                    cell = table.cell(i, j)
+                for j in range(0, table.ncols):
                     paragraph_text = ''
-                    for k, paragraph in enumerate(cell.paragraphs):
-                        if i == 0 and paragraph.text != valid_columns[j]:
+                    for k, paragraph in enumerate(table.cell(i, j)):
+                        if i == 0 and paragraph != valid_columns[j]:
                             invalid_table = True
                             break
                         elif i > 0:
                             if k > 0:  #paragraph.style.startswith('List'):
                                 paragraph_text += '\n'
-                            paragraph_text += paragraph.text.strip()
+                            paragraph_text += paragraph.strip()
                     pfs_item.append(paragraph_text)
                     if invalid_table:
                         break
@@ -1989,13 +3748,8 @@ class FreeMind(object):
                     continue
                 pfs_cat = pfs_item[1]
                 if pfs_cat != '':
-                    if pfs_cat in pfs_grp_list:
-                        pfs_grp_id = pfs_grp_list.index(pfs_cat)
-                    else:
-                        pfs_grp_list.append(pfs_cat)
-                        pfs_list.append([pfs_cat, []])
-                        pfs_grp_id = len(pfs_grp_list) - 1
-                if pfs_item[0] not in pfs_index_list:
+                    pfs_grp_id = catalog.get_group(catalog.PFS, pfs_cat)
+                if not catalog.has_item(catalog.PFS, pfs_item[0]):
                     pfs_ver_team = ''
                     for ver_index in range(0, len(ver_team_list)):
                         if pfs_item[3 + ver_index] == 'Y':
@@ -2004,9 +3758,8 @@ class FreeMind(object):
                     pfs_phase = ''
                     if pfs_item[7].upper().startswith('P'):
                         pfs_phase = pfs_item[7]
-                    pfs_list[pfs_grp_id][1].append(
-                        [pfs_item[0], pfs_item[2], pfs_item[2], pfs_ver_team, '', pfs_phase])
-                    pfs_index_list.append(pfs_item[0])
+                    catalog.add_item(catalog.PFS, pfs_grp_id,
+                                     Requirement(pfs_item[0], pfs_item[2], pfs_item[2], pfs_ver_team, '', pfs_phase))
                 else:
                     self.logger.error(self.log_prefix + "%s is duplicated." % pfs_item[0])
             if invalid_table:
@@ -2014,21 +3767,19 @@ class FreeMind(object):
 
         #pprint.pprint(pfs_list)
         self.logger.info(self.log_prefix + "%d PFS items and %d categories found in %s." % (
-            len(pfs_index_list), len(pfs_grp_list), file_name))
+            catalog.item_count(catalog.PFS), catalog.group_count(catalog.PFS), file_name))
         return 0
 
-    def _read_req_from_xls_hgi(self, file_name, pmr_list, pfs_list, trace_list):
+    def _read_req_from_xls_hgi(self, file_name, pmr_list, pfs_list, trace_graph):
         """ This function will read a Excel and extract PMR, PFS and traceability out of it.
         """
         self.logger.info(self.log_prefix + \
                          "Reading requirements from file (%s). This is going to take a while. Please wait..." % \
                          file_name)
 
-        if os.path.splitext(file_name)[-1] != '.xls':
-            self.logger.error(self.log_prefix + \
-                              "I am sorry that I can not parse this file. Please convert it to a xls file.")
+        src_wb = self._open_spreadsheet(file_name, formatting_info=True)
+        if src_wb is None:
             exit(-1)
-        src_wb = open_workbook(file_name, on_demand=True, formatting_info=True)
 
         # The following columns are optional
         pfs_phase_col = -1
@@ -2036,20 +3787,24 @@ class FreeMind(object):
         pmr_title_col = -1
         pfs_title_col = -1
         col_defined = False
-        pmr_pfs_trace_list = []
-        pmr_index_list = []
-        pfs_index_list = []
+        # Traceability is built as PMR->[PFS1, PFS2] while reading, and the reversed view PFS->[PMR1, PMR2] is returned
+        pmr_pfs_trace_graph = self._reverse_links(trace_graph)
+        catalog = RequirementCatalog(pmr_list, pfs_list)
         for s in src_wb.sheets():
             src_sheet = src_wb.sheet_by_name(s.name)
             if s.name.find('Specification') != -1:
                 pmr_grp_id = 0
                 pfs_grp_id = 0
                 pre_pmr_index = ''
+                columns = None
+                # The rows before the columns are defined, they may be the top rows of merged cells
+                header_rows = []
 
-                for i, cell in enumerate(src_sheet.col(0)):
+                for i, row in enumerate(iter_sheet_rows(src_sheet)):
                     if not col_defined:
-                        for j in range(0, src_sheet.ncols):
-                            cell_text = str(src_sheet.cell_value(i, j)).strip()
+                        header_rows.append(row)
+                        for j, cell_value in enumerate(row):
+                            cell_text = str(cell_value).strip()
                             if cell_text.lower() == 'pmr index':
                                 pmr_index_col = j
                             if cell_text.lower() == 'pmr title':
@@ -2078,78 +3833,60 @@ class FreeMind(object):
                             if cell_text.lower().endswith('comments'):
                                 pmr_cmt_col = j
                     else:
-                        pmr_index = src_sheet.cell_value(i, pmr_index_col).strip()
-                        pmr_desc = src_sheet.cell_value(i, pmr_desc_col).strip()
+                        if columns is None:
+                            # Resolve the merged cells of the needed columns of this sheet at once
+                            columns = SheetColumns(src_sheet, [pmr_index_col, pmr_title_col, pmr_desc_col, pfs_index_col,
+                                                               pfs_title_col, pfs_cat_col, pfs_phase_col, pfs_desc_col,
+                                                               pfs_dev_col, pfs_dvt_col, pfs_sit_col, pfs_ft_col,
+                                                               pmr_cmt_col])
+                            for k, header_row in enumerate(header_rows):
+                                columns.add_row(k, header_row)
+                        columns.add_row(i, row)
+                        pmr_index = columns.value(i, pmr_index_col).strip()
+                        pmr_desc = columns.value(i, pmr_desc_col).strip()
                         pmr_ver_team = 'ATP'
-                        if pmr_index != '' and pmr_desc == '':
+                        if columns.raw_value(i, pmr_index_col).strip() != '' and \
+                                columns.raw_value(i, pmr_desc_col).strip() == '':
                             # This is a PMR category
-                            pmr_grp_desc = src_sheet.cell_value(i, pmr_index_col).strip()
-                            pmr_list.append([pmr_grp_desc, []])
-                            pmr_grp_id = len(pmr_list) - 1
-                        if len(pmr_list) == 0:
-                            pmr_list.append(['Default Category', []])
-
-                        pfs_index = src_sheet.cell_value(i, pfs_index_col).strip()
-                        pfs_desc = src_sheet.cell_value(i, pfs_desc_col).strip()
-                        pfs_cat = src_sheet.cell_value(i, pfs_cat_col).strip()
-                        pfs_dev = src_sheet.cell_value(i, pfs_dev_col).strip()
-                        pfs_dvt = src_sheet.cell_value(i, pfs_dvt_col).strip()
-                        pfs_sit = src_sheet.cell_value(i, pfs_sit_col).strip()
-                        pmr_cmt = src_sheet.cell_value(i, pmr_cmt_col).strip()
+                            pmr_grp_desc = columns.raw_value(i, pmr_index_col).strip()
+                            pmr_grp_id = catalog.add_group(catalog.PMR, pmr_grp_desc)
+                        if catalog.group_count(catalog.PMR) == 0:
+                            catalog.add_group(catalog.PMR, 'Default Category')
+
+                        pfs_index = columns.value(i, pfs_index_col).strip()
+                        pfs_desc = columns.value(i, pfs_desc_col).strip()
+                        pfs_cat = columns.value(i, pfs_cat_col).strip()
+                        pfs_dev = columns.raw_value(i, pfs_dev_col).strip()
+                        pfs_dvt = columns.raw_value(i, pfs_dvt_col).strip()
+                        pfs_sit = columns.raw_value(i, pfs_sit_col).strip()
+                        pmr_cmt = columns.raw_value(i, pmr_cmt_col).strip()
                         if pmr_cmt != '':
                             pmr_cmt = 'SE Comments:' + pmr_cmt
 
                         pmr_title = ''
                         if pmr_title_col != -1:
-                            pmr_title = src_sheet.cell_value(i, pmr_title_col).strip()
+                            pmr_title = columns.value(i, pmr_title_col).strip()
                         pfs_title = ''
                         if pfs_title_col != -1:
-                            pfs_title = src_sheet.cell_value(i, pfs_title_col).strip()
+                            pfs_title = columns.value(i, pfs_title_col).strip()
 
                         pfs_ft = ''
                         if pfs_ft_col != -1:
                             # This is an optional column
-                            pfs_ft = src_sheet.cell_value(i, pfs_ft_col).strip()
+                            pfs_ft = columns.raw_value(i, pfs_ft_col).strip()
                         pfs_phase = ''
                         if pfs_phase_col != -1:
                             # This is an optional column
-                            pfs_phase = str(src_sheet.cell_value(i, pfs_phase_col)).strip()
+                            pfs_phase = str(columns.raw_value(i, pfs_phase_col)).strip()
                             if not pfs_phase.upper().startswith('P'):
                                 pfs_phase = 'P' + pfs_phase
                                 pfs_phase = pfs_phase[:2]
 
-                        for merged_range in src_sheet.merged_cells:
-                            rlo, rhi, clo, chi = merged_range
-                            if (i >= rlo) and (i < rhi) and (pfs_index_col >= clo) and (pfs_index_col < chi):
-                                pfs_index = src_sheet.cell_value(rlo, pfs_index_col).strip()
-                            if (i >= rlo) and (i < rhi) and (pfs_desc_col >= clo) and (pfs_desc_col < chi):
-                                pfs_desc = src_sheet.cell_value(rlo, pfs_desc_col).strip()
-                            if (i >= rlo) and (i < rhi) and (pmr_index_col >= clo) and (pmr_index_col < chi):
-                                pmr_index = src_sheet.cell_value(rlo, pmr_index_col).strip()
-                            if (i >= rlo) and (i < rhi) and (pmr_desc_col >= clo) and (pmr_desc_col < chi):
-                                pmr_desc = src_sheet.cell_value(rlo, pmr_desc_col).strip()
-                            if (i >= rlo) and (i < rhi) and (pfs_cat_col >= clo) and (pfs_cat_col < chi):
-                                pfs_cat = src_sheet.cell_value(rlo, pfs_cat_col).strip()
-                            if (i >= rlo) and (i < rhi) and (pmr_title_col >= clo) and (pmr_title_col < chi):
-                                pmr_title = src_sheet.cell_value(rlo, pmr_title_col).strip()
-                            if (i >= rlo) and (i < rhi) and (pfs_title_col >= clo) and (pfs_title_col < chi):
-                                pfs_title = src_sheet.cell_value(rlo, pfs_title_col).strip()
-
                         if pmr_index == 'PMR Index':
                             continue
 
                         if pfs_cat != '':
-                            pfs_cat_exist = False
-                            for item_index, pfs_item in enumerate(pfs_list):
-                                if pfs_cat == pfs_item[0]:
-                                    # This is an existing PFS category
-                                    pfs_grp_id = item_index
-                                    pfs_cat_exist = True
-                                    break
-                            if not pfs_cat_exist:
-                                # This is a new PFS category
-                                pfs_list.append([pfs_cat, []])
-                                pfs_grp_id = len(pfs_list) - 1
+                            pfs_grp_id = catalog.get_group(catalog.PFS, pfs_cat)
 
                         if pmr_title == '':
                             pmr_title = pmr_desc
@@ -2167,151 +3904,305 @@ class FreeMind(object):
                             pfs_ver_team += '|FT'
                         pfs_ver_team = '|'.join(pfs_ver_team.split('|')[1:])
 
-                        if src_sheet.cell_value(i, pmr_index_col).strip() in pmr_index_list:
+                        if catalog.has_item(catalog.PMR, columns.raw_value(i, pmr_index_col).strip()):
                             self.logger.error(self.log_prefix + \
                                               "%s on row %d is duplicated." % \
-                                              (src_sheet.cell_value(i, pmr_index_col).strip(), i + 1))
-                        if src_sheet.cell_value(i, pfs_index_col).strip() in pfs_index_list:
+                                              (columns.raw_value(i, pmr_index_col).strip(), i + 1))
+                        if catalog.has_item(catalog.PFS, columns.raw_value(i, pfs_index_col).strip()):
                             self.logger.error(self.log_prefix + \
                                               "%s on row %d is duplicated." % \
-                                              ( src_sheet.cell_value(i, pfs_index_col).strip(), i + 1))
+                                              (columns.raw_value(i, pfs_index_col).strip(), i + 1))
 
                         if pmr_index != '' and pmr_desc != '' and pfs_index != '':
                             # PFS item traced to PMR item
-                            if pmr_index not in pmr_index_list:
-                                pmr_list[pmr_grp_id][1].append(
-                                    [pmr_index, pmr_title, pmr_desc, pmr_ver_team, pmr_cmt, ''])
-                                pmr_index_list.append(pmr_index)
-                            if pfs_index not in pfs_index_list:
-                                pfs_list[pfs_grp_id][1].append(
-                                    [pfs_index, pfs_title, pfs_desc, pfs_ver_team, '', pfs_phase])
-                                pfs_index_list.append(pfs_index)
-                            self._add_traceability(pmr_pfs_trace_list, pmr_index, [pfs_index])
+                            catalog.add_item(catalog.PMR, pmr_grp_id,
+                                             Requirement(pmr_index, pmr_title, pmr_desc, pmr_ver_team, pmr_cmt, ''))
+                            catalog.add_item(catalog.PFS, pfs_grp_id,
+                                             Requirement(pfs_index, pfs_title, pfs_desc, pfs_ver_team, '', pfs_phase))
+                            self._add_traceability(pmr_pfs_trace_graph, pmr_index, [pfs_index])
                         if pmr_index == '' and pmr_desc == '' and pfs_index != '' and pfs_desc != '':
                             # New PFS item traced to previous PMR item
                             pmr_index = pre_pmr_index
-                            if pfs_index not in pfs_index_list:
-                                pfs_list[pfs_grp_id][1].append(
-                                    [pfs_index, pfs_title, pfs_desc, pfs_ver_team, '', pfs_phase])
-                                pfs_index_list.append(pfs_index)
+                            catalog.add_item(catalog.PFS, pfs_grp_id,
+                                             Requirement(pfs_index, pfs_title, pfs_desc, pfs_ver_team, '', pfs_phase))
                             if pre_pmr_index <> '':
-                                self._add_traceability(pmr_pfs_trace_list, pmr_index, [pfs_index])
+                                self._add_traceability(pmr_pfs_trace_graph, pmr_index, [pfs_index])
                         if pmr_index == '' and pmr_desc == '' and pfs_index == '' and pfs_desc != '':
                             # Traceability only PFS item traced to previous PMR item
                             pmr_index = pre_pmr_index
                             if pre_pmr_index <> '':
-                                self._add_traceability(pmr_pfs_trace_list, pmr_index, pfs_desc.split('\n'))
+                                self._add_traceability(pmr_pfs_trace_graph, pmr_index, pfs_desc.split('\n'))
                         if pmr_index != '' and pmr_desc != '' and pfs_index == '' and pfs_desc != '':
                             # Existing PFS item traced to new PMR item
-                            if pmr_index not in pmr_index_list:
-                                pmr_list[pmr_grp_id][1].append(
-                                    [pmr_index, pmr_title, pmr_desc, pmr_ver_team, pmr_cmt, ''])
-                                pmr_index_list.append(pmr_index)
-                            self._add_traceability(pmr_pfs_trace_list, pmr_index, pfs_desc.split('\n'))
+                            catalog.add_item(catalog.PMR, pmr_grp_id,
+                                             Requirement(pmr_index, pmr_title, pmr_desc, pmr_ver_team, pmr_cmt, ''))
+                            self._add_traceability(pmr_pfs_trace_graph, pmr_index, pfs_desc.split('\n'))
                         if pmr_index != '' and pmr_desc != '' and pfs_index == '' and pfs_desc == '':
                             # New PMR item with no PFS item
-                            if pmr_index not in pmr_index_list:
-                                pmr_list[pmr_grp_id][1].append(
-                                    [pmr_index, pmr_title, pmr_desc, pmr_ver_team, pmr_cmt, ''])
-                                pmr_index_list.append(pmr_index)
+                            catalog.add_item(catalog.PMR, pmr_grp_id,
+                                             Requirement(pmr_index, pmr_title, pmr_desc, pmr_ver_team, pmr_cmt, ''))
                         if pmr_index == '' and pmr_desc == '' and pfs_index != '' and pfs_desc != '':
                             # New PFS item without PMR item
-                            if pfs_index not in pfs_index_list:
-                                pfs_list[pfs_grp_id][1].append(
-                                    [pfs_index, pfs_title, pfs_desc, pfs_ver_team, '', pfs_phase])
-                                pfs_index_list.append(pfs_index)
+                            catalog.add_item(catalog.PFS, pfs_grp_id,
+                                             Requirement(pfs_index, pfs_title, pfs_desc, pfs_ver_team, '', pfs_phase))
 
                         if pmr_index != '':
                             pre_pmr_index = pmr_index
                         if pfs_index != '':
                             pre_pfs_index = pfs_index
 
-        self._reverse_links(pmr_pfs_trace_list, trace_list)
         #pprint.pprint(pmr_list)
         self.logger.info(self.log_prefix + \
                          "Successfully extracted requirements from file (%s). %d PMR items and %d PFS items found." % \
-                         (file_name, len(pmr_index_list), len(pfs_index_list)))
+                         (file_name, catalog.item_count(catalog.PMR), catalog.item_count(catalog.PFS)))
         return 0
 
-    def _add_traceability(self, trace_list, dst_index, src_index_list):
+    def _add_traceability(self, trace_graph, dst_index, src_index_list):
         """
-        This function is used to generate a traceablity list like [PMR, [PFS1, PFS2, PFS3]]
-        :param trace_list:
+        This function is used to generate a traceablity graph like PMR->[PFS1, PFS2, PFS3]
+        :param trace_graph:
         :param dst_index:
         :param src_index_list:
         """
-        for trace_item in trace_list:
-            if dst_index == trace_item[0]:
-                for new_src_index in src_index_list:
-                    duplicated_src = False
-                    for orig_src_index in trace_item[1]:
-                        if new_src_index == orig_src_index:
-                            duplicated_src = True
-                            break
-                    if not duplicated_src:
-                        trace_item[1].append(new_src_index)
-                return
-        trace_list.append([dst_index, src_index_list])
+        trace_graph.add_links(dst_index, src_index_list)
 
-    def _read_req_from_xls_kreatv(self, file_name, pmr_list, pfs_list, trace_list):
+    def _read_req_from_xls_kreatv(self, file_name, pmr_list, pfs_list, trace_graph):
         ''' This function will read a Excel and extract PMR, PFS and traceability out of it.
         '''
         self.logger.info(self.log_prefix + \
                          "Reading requirements from file (%s). This is going to take a while. Please wait..." % \
                          (file_name))
-        src_wb = open_workbook(file_name, on_demand=True)
+        src_wb = self._open_spreadsheet(file_name)
+        if src_wb is None:
+            return -1
+        catalog = RequirementCatalog(pmr_list, pfs_list)
 
         for s in src_wb.sheets():
             src_sheet = src_wb.sheet_by_name(s.name)
             if s.name == 'PMR':
                 group_id = 0
-                for i, cell in enumerate(src_sheet.col(0)):
-                    req_id = cell.value.strip()
-                    req_title = src_sheet.cell_value(i, 1).strip()
-                    req_desc = src_sheet.cell_value(i, 2).strip()
+                for i, row in enumerate(iter_sheet_rows(src_sheet, 3)):
+                    req_id = row[0].strip()
+                    req_title = row[1].strip()
+                    req_desc = row[2].strip()
                     ver_team = 'ATP'
                     if req_desc == '':
                         group_id = group_id + 1
-                        pmr_list.append([req_title, []])
-                    else:
-                        pmr_list[group_id - 1][1].append([req_id, req_title, req_desc, ver_team])
+                        catalog.add_group(catalog.PMR, req_title)
+                    elif not catalog.add_item(catalog.PMR, group_id - 1, Requirement(req_id, req_title, req_desc, ver_team)):
+                        self.logger.error(self.log_prefix + "%s is duplicated." % req_id)
                         #pprint.pprint(pmr_list)
             if s.name == 'Requirements':
                 group_id = 0
-                for i, cell in enumerate(src_sheet.col(0)):
+                for i, row in enumerate(iter_sheet_rows(src_sheet, 5)):
                     if i > 0:
-                        req_id = cell.value.strip()
-                        req_title = src_sheet.cell_value(i, 1).strip()
-                        ver_team = src_sheet.cell_value(i, 3).strip()
-                        req_desc = src_sheet.cell_value(i, 4).strip()
+                        req_id = row[0].strip()
+                        req_title = row[1].strip()
+                        ver_team = row[3].strip()
+                        req_desc = row[4].strip()
                         if req_desc == '':
                             group_id = group_id + 1
-                            pfs_list.append([req_id, []])
-                        else:
-                            pfs_list[group_id - 1][1].append([req_id, req_title, req_desc, ver_team])
+                            catalog.add_group(catalog.PFS, req_id)
+                        elif not catalog.add_item(catalog.PFS, group_id - 1,
+                                                  Requirement(req_id, req_title, req_desc, ver_team)):
+                            self.logger.error(self.log_prefix + "%s is duplicated." % req_id)
                             #pprint.pprint(pfs_list)
             if s.name == 'PFS':
                 group_id = 0
-                for i, cell in enumerate(src_sheet.col(0)):
+                for i, row in enumerate(iter_sheet_rows(src_sheet, 3)):
                     if i > 0:
-                        req_id = cell.value.strip()
-                        req_trace = src_sheet.cell_value(i, 2).strip().split('\n')
+                        req_id = row[0].strip()
+                        req_trace = row[2].strip().split('\n')
                         if len(req_trace) == 1:
-                            req_trace = src_sheet.cell_value(i, 2).strip().split(' ')
+                            req_trace = row[2].strip().split(' ')
                         if len(req_trace) == 1:
-                            req_trace = src_sheet.cell_value(i, 2).strip().split(',')
+                            req_trace = row[2].strip().split(',')
                         if len(req_trace) == 1:
-                            req_trace = src_sheet.cell_value(i, 2).strip().split(';')
+                            req_trace = row[2].strip().split(';')
                             #req_trace = '|'.join(req_trace)
-                        if str(src_sheet.cell_value(i, 1)).strip() <> '':
-                            trace_list.append([req_id, req_trace])
-                            #pprint.pprint(trace_list)
+                        if str(row[1]).strip() <> '':
+                            trace_graph.add_links(req_id, req_trace)
+                            #pprint.pprint(trace_graph.items())
         self.logger.info(self.log_prefix + \
                          "Successfully extracted requirements from file (%s)." % \
                          (file_name))
         return 0
 
 
+class LogQueueHandler(logging.Handler):
+    ''' Put the log records of a pool worker into the queue of the PoolLogListener of the parent process '''
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            # The arguments and the traceback may not be picklable, thus the message is formatted here
+            record.msg = self.format(record)
+            record.args = None
+            record.exc_info = None
+            record.exc_text = None
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+class PoolLogListener(object):
+    ''' Handle the log records of the pool workers with the handlers of this process (configured by logging.conf),
+        thus only this process writes the log files. It's used as a context manager around the pool:
+            with PoolLogListener() as log_queue:
+                pool = multiprocessing.Pool(workers, _init_pool_worker, (log_queue,))
+                ...
+                pool.join()
+        All records of the workers are handled when the pool is joined and the context is exited.
+    '''
+
+    def __enter__(self):
+        self.queue = multiprocessing.Queue()
+        self.thread = threading.Thread(target=self._handle_records)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.queue
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.queue.put(None)
+        self.thread.join()
+        return False
+
+    def _handle_records(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            logging.getLogger(record.name).handle(record)
+
+
+_started_queue = None
+
+
+def _init_pool_worker(log_queue, started_queue=None):
+    ''' Prepare a pool worker process. The log records are sent to the PoolLogListener of the parent process instead of
+        the handlers inherited from it (forked process) or no handler at all (spawned process on Windows).
+        (action_index, process ID) is put into the started_queue when an action is started in the worker, thus the
+        parent process knows which action is lost if the worker dies.
+    '''
+    global _started_queue
+    _started_queue = started_queue
+    reload(sys)
+    sys.setdefaultencoding('utf-8')
+    root_logger = logging.getLogger()
+    for logger in [root_logger] + logging.Logger.manager.loggerDict.values():
+        if isinstance(logger, logging.Logger):
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+    root_logger.addHandler(LogQueueHandler(log_queue))
+    root_logger.setLevel(logging.DEBUG)
+
+
+def _perform_action_in_worker(cfg_file, action_index):
+    ''' Perform the enabled action (by index) of the configuration file in a pool worker with its own FreeMind instance.
+        Return (action_index, elapsed_time, error), the error is None if the action is performed successfully.
+    '''
+    start_time = time.time()
+    if _started_queue is not None:
+        _started_queue.put((action_index, os.getpid()))
+    try:
+        freemind = FreeMind(logging.getLogger(__name__))
+        cfg_root = freemind._read_cfg_settings(cfg_file)
+        action = freemind._get_enabled_actions(cfg_root)[action_index]
+        freemind._perform_action(cfg_file, action)
+        freemind._log_doc_cache('the action (%s)' % (action['NAME'].strip()))
+        error = None
+    except (Exception, SystemExit):
+        error = traceback.format_exc()
+    return action_index, time.time() - start_time, error
+
+
+def _extract_tc_sheet_in_worker(args):
+    ''' Convert a sheet of the test case spreadsheet in a pool worker, the workbook is opened by each worker.
+        Return the same as FreeMind._extract_tc_from_sheet.
+    '''
+    file_name, sheet_name, review_info = args
+    try:
+        freemind = FreeMind(logging.getLogger(__name__))
+        return freemind._extract_tc_from_sheet(freemind._open_spreadsheet(file_name), sheet_name, file_name, review_info)
+    except Exception:
+        return sheet_name, None, 0, [(sheet_name, -1, -1, traceback.format_exc())]
+
+
+def _perform_cfg_file(cfg_file):
+    ''' Perform all enabled actions of a configuration file with a new FreeMind instance.
+        The relative paths in the configuration file are relative to its own folder.
+        Return (cfg_file, result, elapsed_time, error), the error is None if no exception is raised.
+    '''
+    start_time = time.time()
+    cwd = os.getcwd()
+    res = -1
+    try:
+        os.chdir(os.path.dirname(os.path.abspath(cfg_file)))
+        freemind = FreeMind(logging.getLogger(__name__))
+        freemind.logger.info(freemind.log_prefix + \
+                             "Parse the configuration file (%s)." % \
+                             (cfg_file))
+        res = freemind._parse_cfg_file(os.path.basename(cfg_file))
+        error = None
+    except (Exception, SystemExit):
+        error = traceback.format_exc()
+    finally:
+        os.chdir(cwd)
+    return cfg_file, res, time.time() - start_time, error
+
+
+def run_batch(logger, paths, workers=1):
+    ''' Perform many configuration files (or folders of them) in this process or on a pool of worker processes,
+        thus the modules are only imported once. A combined summary is logged at the end.
+    '''
+    cfg_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            cfg_files.extend(sorted(glob.glob(os.path.join(path, '*.xml'))))
+        else:
+            cfg_files.append(path)
+    logger.info("FreeMind:Batch mode for %d configuration files with %d workers." % \
+                (len(cfg_files), workers))
+
+    start_time = time.time()
+    results = []
+    if workers <= 1 or len(cfg_files) <= 1:
+        for cfg_file in cfg_files:
+            results.append(_perform_cfg_file(cfg_file))
+    else:
+        with PoolLogListener() as log_queue:
+            pool = multiprocessing.Pool(min(workers, len(cfg_files)), _init_pool_worker, (log_queue,))
+            for result in pool.imap_unordered(_perform_cfg_file, cfg_files):
+                logger.info("FreeMind:Configuration file (%s) is done in %.1f seconds." % \
+                            (result[0], result[2]))
+                results.append(result)
+            pool.close()
+            pool.join()
+        results.sort(key=lambda result: cfg_files.index(result[0]))
+
+    failed = 0
+    logger.info("FreeMind:Batch summary:")
+    for cfg_file, res, elapsed_time, error in results:
+        if error is None and res == 0:
+            status = 'OK'
+        else:
+            status = 'FAILED'
+            failed += 1
+        logger.info("FreeMind:  %-6s %8.1fs  %s" % \
+                    (status, elapsed_time, cfg_file))
+        if error is not None:
+            logger.error("FreeMind:Configuration file (%s) failed: %s" % \
+                         (cfg_file, error))
+    logger.info("FreeMind:%d configuration files are performed in %.1f seconds, %d failed." % \
+                (len(results), time.time() - start_time, failed))
+    if failed:
+        return -1
+    return 0
+
+
 def args_parser(arguments=None):
     parser = argparse.ArgumentParser(description= \
                                          'This application can be used to extract event test case, sub-procedure test cases and\
@@ -2334,6 +4225,12 @@ def args_parser(arguments=None):
                        help="Extract test case and TDS linkage information from xml file exported from TestLink.\
                 and update the FreeMind file with test cases links.\
                 The most common usage is FreeMind -l -f FREEMIND_FILE -xml XML_FILE.")
+    group.add_argument('-b', '--batch', nargs='+', metavar='CONFIG',
+                       help="Perform the enabled actions of many configuration files (or folders of configuration files)\
+                in one invocation. The most common usage is FreeMind -b CONFIG_FOLDER -w 4.")
+
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="Specify the number of worker processes for the batch mode.")
 
     parser.add_argument('-s', '--src_file',
                         help="Specify the FreeMind file which contains various nodes of test design specification.")
@@ -2354,13 +4251,19 @@ def start_main():
     sys.setdefaultencoding('utf-8')
     logging.config.fileConfig(PKG_PATH + 'logging.conf')
     logger = logging.getLogger(__name__)
+    args = None
+    if len(sys.argv) > 1:
+        args = args_parser()
+        if args.batch:
+            sys.exit(run_batch(logger, args.batch, args.workers))
     cfg_file = './config.xml'
     if os.path.exists(cfg_file):
         FreeMind(logger, cfg_file)
         sys.exit()
 
     freemind = FreeMind(logger)
-    args = args_parser()
+    if args is None:
+        args = args_parser()
     if (args.add_prefix and args.src_file != None):
         freemind.add_prefix(args.src_file)
         sys.exit()
@@ -2379,4 +4282,6 @@ def start_main():
 
 
 if __name__ == '__main__':
+    # Needed by the process pool when the tool is frozen by PyInstaller
+    multiprocessing.freeze_support()
     start_main()
\ No newline at end of file
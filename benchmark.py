@@ -0,0 +1,621 @@
+# -*- coding: utf-8 -*-
+''' Benchmark of the FreeMind-TestLink actions with synthetic inputs.
+
+    Synthetic TDS maps, test plans, test case/requirement exports of TestLink and HGI/KreaTV/test case workbooks are
+    generated for each size (number of TDS items, test cases or requirement rows), then each action is performed
+    from a generated configuration file in its own process, thus the peak memory of the actions is not mixed up.
+    The wall time, peak RSS and the checksums of all output files are recorded into a json file which can be
+    compared with the results of another run (e.g. before and after a change):
+
+        python benchmark.py -s 1k 10k -o before.json
+        python benchmark.py -s 1k 10k -o after.json -c before.json
+
+    The inputs only depend on the size and the seed, so the checksums are same if a change doesn't change the outputs.
+'''
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+from xml.sax.saxutils import escape, quoteattr
+
+from xlwt import Workbook as XlsWriteWorkbook
+try:
+    # Only needed for the xlsx files (the xls files can't have more than 65536 rows)
+    from openpyxl import Workbook as XlsxWriteWorkbook
+except ImportError:
+    XlsxWriteWorkbook = None
+try:
+    # Not available on Windows, the peak RSS is not recorded then
+    import resource
+except ImportError:
+    resource = None
+
+from FreeMind import FreeMind, TC_REGRESSION_LEVELS, TC_SHEET_COLUMNS
+
+PKG_PATH = os.path.dirname(os.path.abspath(__file__))
+# Change it if the synthetic inputs are changed, thus the cached inputs are generated again
+FIXTURE_VERSION = 1
+XLS_MAX_ROWS = 65536
+
+REPO_PREFIX = 'BENCH'
+TDS_PREFIX = 'BENCH-TDS-'
+PFS_PREFIX = 'BENCH-PFS-'
+PMR_PREFIX = 'BENCH-PMR-'
+TESTLINK_URL = 'http://testlink.example.com/testlink'
+HGI_COLUMNS = ['PMR Index', 'PMR Title', 'PMR Description', 'Index', 'PFS Title', 'Category', 'Phase', 'Description',
+               'DEV', 'DVT', 'SI&T', 'FT', 'SE Comments']
+
+CONFIG_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<configuration>
+	<actions WORKERS = "1">
+		<action %(action)s/>
+	</actions>
+	<testlink URL="%(testlink_url)s/lib/api/xmlrpc/v1/xmlrpc.php" DEV_KEY="benchmark">
+		<repository PREFIX="%(repo_prefix)s" NAME="Benchmark">
+			<project NAME="Benchmark" PFS_PREFIX="%(pfs_prefix)s" PMR_PREFIX="%(pmr_prefix)s" TDS_PREFIX ="%(tds_prefix)s" MASTER_PLAN = ""/>
+		</repository>
+	</testlink>
+	<file_location URL=%(location)s>
+%(files)s
+	</file_location>
+	<freemind URL="./">
+		<flashobject_swf>visorFreemind.swf</flashobject_swf>
+		<flashobject_js>flashobject.js</flashobject_js>
+		<html_template>flashBrowserDocu.html</html_template>
+	</freemind>
+</configuration>
+'''
+
+# The files of the configuration file, the names of the inputs are replaced with the generated fixtures
+DEFAULT_FILES = OrderedDict([('requirements_url', 'req_hgi'), ('pmr_url', 'pmr.xml'), ('pfs_url', 'pfs.xml'),
+                             ('tds_url', 'tds'), ('tc_url', 'tc'), ('based_tc_url', 'tc'), ('tp_url', 'tp'),
+                             ('based_tp_url', 'based_tp')])
+
+# Benchmark name -> the action in the configuration file, the fixtures it reads and the files of it
+CASES = OrderedDict([
+    ('gen_tds', {'action': OrderedDict([('NAME', 'Generate_TDS'), ('REMOVE_PREFIX', '0'), ('INCREMENTAL', '0')]),
+                 'fixtures': ['tds'], 'files': {}}),
+    ('link_tc2tds', {'action': OrderedDict([('NAME', 'Link_TDS_with_TCs')]),
+                     'fixtures': ['tds', 'tc'], 'files': {}}),
+    ('Generate_TCs_from_TDS', {'action': OrderedDict([('NAME', 'Generate_TCs_from_TDS'), ('NODE_LIST', ''),
+                                                      ('TC_READY', '1')]),
+                               'fixtures': ['tds', 'tc'], 'files': {'tc_url': 'generated_tc.xml'}}),
+    ('create_test_plan', {'action': OrderedDict([('NAME', 'Create_Test_Plan'), ('AUTO', '0'), ('TEAM', 'SIT')]),
+                          'fixtures': ['tp', 'based_tp'], 'files': {}}),
+    ('extract_requirements', {'action': OrderedDict([('NAME', 'Extract_Requirements'), ('TEMPLATE', 'HGI'),
+                                                     ('WORKERS', '1')]),
+                              'fixtures': ['req_hgi'], 'files': {}}),
+    ('extract_requirements_kreatv', {'action': OrderedDict([('NAME', 'Extract_Requirements'), ('TEMPLATE', 'KreaTV'),
+                                                            ('WORKERS', '1')]),
+                                     'fixtures': ['req_kreatv'], 'files': {'requirements_url': 'req_kreatv'}}),
+    ('extract_tc_from_xls', {'action': OrderedDict([('NAME', 'Extract_TestCases'), ('SHEET_NAME', ''),
+                                                    ('REVIEW_INFO', 'Yes|1|Reviewed by benchmark.'), ('WORKERS', '1'),
+                                                    ('MERGED', '1'), ('ERROR_REPORT', '0')]),
+                             'fixtures': ['tc_sheets'], 'files': {'tc_url': 'tc_sheets'}}),
+])
+
+
+def _item_text(j):
+    return 'Verify the function %d works with setting %d' % (j, j % 7)
+
+
+def _pfs_link(pfs_id):
+    return TESTLINK_URL + '/linkto.php?tprojectPrefix=' + REPO_PREFIX + '&item=req&id=' + PFS_PREFIX + pfs_id
+
+
+def _tc_link(tc_number):
+    return TESTLINK_URL + '/linkto.php?tprojectPrefix=' + REPO_PREFIX + '&item=testcase&id=%s-%d' % (REPO_PREFIX,
+                                                                                                        tc_number)
+
+
+def _node(f, attrib, closed=False):
+    f.write('<node %s%s>\n' % (' '.join('%s=%s' % (key, quoteattr(value)) for key, value in attrib),
+                                closed and '/' or ''))
+
+
+def gen_tds_map(file_name, size, rnd):
+    ''' A TDS map with size TDS items, 10 items in each sub-feature and 10 sub-features in each feature (folder).
+        Each sub-feature and every third TDS item has a PFS link node, and every second TDS item has a test case link
+        node. The test case of TDS item j is the test case j + 1 of gen_tc_xml.
+    '''
+    pfs_count = max(size / 2, 1)
+    f = open(file_name, 'w')
+    f.write('<map version="1.0.1">\n')
+    _node(f, [('ID', 'ID_1'), ('TEXT', 'Benchmark TDS')])
+    j = 0
+    link_id = 3000000
+    for feature in range((size + 99) / 100):
+        _node(f, [('ID', 'ID_%d' % (2000000 + feature)), ('TEXT', 'Feature %d' % feature)])
+        f.write('<icon BUILTIN="folder"/>\n')
+        for sub_feature in range(10):
+            if j >= size:
+                break
+            _node(f, [('ID', 'ID_%d' % (2100000 + j)), ('TEXT', 'Sub-feature %d|%d' % (feature, sub_feature))])
+            pfs_id = 'PFS-%d' % (rnd.randint(0, pfs_count - 1) + 1)
+            link_id += 1
+            _node(f, [('ID', 'ID_%d' % link_id), ('LINK', _pfs_link(pfs_id)), ('TEXT', pfs_id + '::SIT::Title')],
+                  True)
+            for item in range(10):
+                if j >= size:
+                    break
+                _node(f, [('ID', 'ID_%d' % (1000000 + j)), ('TEXT', _item_text(j))])
+                if j % 3 == 0:
+                    pfs_id = 'PFS-%d' % (rnd.randint(0, pfs_count - 1) + 1)
+                    link_id += 1
+                    _node(f, [('ID', 'ID_%d' % link_id), ('LINK', _pfs_link(pfs_id)),
+                              ('TEXT', pfs_id + '::SIT|DEV::Title')], True)
+                if j % 2 == 0:
+                    link_id += 1
+                    _node(f, [('ID', 'ID_%d' % link_id), ('LINK', _tc_link(j + 1)),
+                              ('TEXT', '%s-%d:%s' % (REPO_PREFIX, j + 1, _item_text(j)))], True)
+                f.write('</node>\n')
+                j += 1
+            f.write('</node>\n')
+        f.write('</node>\n')
+    f.write('</node>\n</map>\n')
+    f.close()
+
+
+def _cdata(text):
+    return '<![CDATA[%s]]>' % text
+
+
+def gen_tc_xml(file_name, size, rnd):
+    ''' A test case xml file exported from TestLink with size test cases in test suites of 100 test cases.
+        Test case j + 1 has the name of TDS item j of gen_tds_map and is linked to it and to a PFS item.
+    '''
+    pfs_count = max(size / 2, 1)
+    f = open(file_name, 'w')
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuite name="">\n')
+    f.write('<node_order>%s</node_order>\n<details>%s</details>\n' % (_cdata(''), _cdata('')))
+    for j in range(size):
+        if j % 100 == 0:
+            if j > 0:
+                f.write('</testsuite>\n')
+            f.write('<testsuite name="Suite %d">\n<node_order>%s</node_order>\n<details>%s</details>\n' % \
+                    (j / 100, _cdata(str(j / 100)), _cdata('<p>Test suite %d</p>' % (j / 100))))
+        regression_level = rnd.randint(1, len(TC_REGRESSION_LEVELS))
+        f.write('<testcase internalid="%d" name=%s>\n' % (100000 + j, quoteattr(_item_text(j))))
+        f.write('<node_order>%s</node_order>\n<externalid>%s</externalid>\n<version>%s</version>\n' % \
+                (_cdata(str(j % 100)), _cdata(str(j + 1)), _cdata('1')))
+        f.write('<summary>%s</summary>\n<preconditions>%s</preconditions>\n' % \
+                (_cdata('<p>Summary of test case %d</p>' % (j + 1)), _cdata('<p>The box is booted.</p>')))
+        f.write('<execution_type>%s</execution_type>\n<importance>%s</importance>\n' % (_cdata('1'), _cdata('2')))
+        f.write('<steps>\n')
+        for step in range(1, 3):
+            f.write('<step><step_number>%s</step_number><actions>%s</actions><expectedresults>%s</expectedresults>'
+                    '<execution_type>%s</execution_type></step>\n' % \
+                    (_cdata(str(step)), _cdata('<p>Do step %d.</p>' % step), _cdata('<p>Step %d is done.</p>' % step),
+                     _cdata('1')))
+        f.write('</steps>\n<custom_fields>\n')
+        f.write('<custom_field><name>%s</name><value>%s</value></custom_field>\n' % \
+                (_cdata('HGI Regression Level'),
+                 _cdata('|'.join(TC_REGRESSION_LEVELS[:len(TC_REGRESSION_LEVELS) - regression_level + 1]))))
+        f.write('<custom_field><name>%s</name><value>%s</value></custom_field>\n' % (_cdata('HGI Test Team'),
+                                                                                    _cdata('SIT')))
+        f.write('</custom_fields>\n<requirements>\n')
+        f.write('<requirement><req_spec_title>%s</req_spec_title><doc_id>%s</doc_id></requirement>\n' % \
+                (_cdata('tds'), _cdata(TDS_PREFIX + 'ID_%d' % (1000000 + j))))
+        f.write('<requirement><req_spec_title>%s</req_spec_title><doc_id>%s</doc_id></requirement>\n' % \
+                (_cdata('pfs'), _cdata(PFS_PREFIX + 'PFS-%d' % (rnd.randint(0, pfs_count - 1) + 1))))
+        f.write('</requirements>\n</testcase>\n')
+    if size > 0:
+        f.write('</testsuite>\n')
+    f.write('</testsuite>\n')
+    f.close()
+
+
+def _gen_test_plan(file_name, size, rnd, baseline):
+    ''' A test plan map with size test cases in test suites of 100 test cases, the test cases have regression level
+        icons and some of them are marked to be removed or kept. In the baseline, 5% of the test cases are not
+        planned and 5% are under another test suite.
+    '''
+    suites = OrderedDict()
+    for j in range(size):
+        suite = j / 100
+        if baseline:
+            dice = rnd.random()
+            if dice < 0.05:
+                continue
+            if dice < 0.1:
+                suite = rnd.randint(0, (size - 1) / 100)
+        suites.setdefault(suite, []).append(j)
+    f = open(file_name, 'w')
+    f.write('<map version="1.0.1">\n')
+    _node(f, [('TEXT', 'Test Plan')])
+    for suite in sorted(suites):
+        _node(f, [('TEXT', 'Suite %d' % suite)])
+        for j in suites[suite]:
+            _node(f, [('TEXT', '%s-%d::%s' % (REPO_PREFIX, j + 1, _item_text(j)))])
+            f.write('<icon BUILTIN="full-%d"/>\n' % rnd.randint(1, 5))
+            if j % 50 == 1:
+                f.write('<icon BUILTIN="button_cancel"/>\n')
+            elif j % 50 == 2:
+                f.write('<icon BUILTIN="button_ok"/>\n')
+            f.write('</node>\n')
+        f.write('</node>\n')
+    f.write('</node>\n</map>\n')
+    f.close()
+
+
+def gen_test_plan(file_name, size, rnd):
+    _gen_test_plan(file_name, size, rnd, False)
+
+
+def gen_based_test_plan(file_name, size, rnd):
+    _gen_test_plan(file_name, size, rnd, True)
+
+
+def write_workbook(file_name, sheets):
+    ''' sheets is a list of (sheet name, rows). The xls files are written with xlwt and the xlsx files with openpyxl '''
+    if os.path.splitext(file_name)[-1] == '.xlsx':
+        wb = XlsxWriteWorkbook(write_only=True)
+        for sheet_name, rows in sheets:
+            ws = wb.create_sheet(sheet_name)
+            for row in rows:
+                ws.append(row)
+        wb.save(file_name)
+        return
+    wb = XlsWriteWorkbook()
+    for sheet_name, rows in sheets:
+        ws = wb.add_sheet(sheet_name)
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                if value <> '':
+                    ws.write(i, j, value)
+    wb.save(file_name)
+
+
+def _spreadsheet_ext(rows):
+    if rows < XLS_MAX_ROWS:
+        return '.xls'
+    if XlsxWriteWorkbook is None:
+        raise RuntimeError("%d rows can't be written into a xls file, and openpyxl is needed for the xlsx file." % \
+                           rows)
+    return '.xlsx'
+
+
+def gen_hgi_workbook(file_name, size, rnd):
+    ''' A HGI requirement workbook with size PFS rows. Each PMR is traced to two PFS items (the first one on the same
+        row), and there is a PMR category row for every 50 PMRs.
+    '''
+    rows = [HGI_COLUMNS]
+    pmr = 0
+    for j in range(size):
+        category = 'Category %d' % ((j / 100) % 20)
+        pfs = ['PFS-%d' % (j + 1), 'PFS title %d' % (j + 1), category, str(rnd.randint(1, 3)),
+               'The function %d shall be supported.\nSee the PMR.' % (j + 1)]
+        if j % 2 == 0:
+            if pmr % 50 == 0:
+                rows.append(['PMR Category %d' % (pmr / 50)] + [''] * (len(HGI_COLUMNS) - 1))
+            pmr += 1
+            rows.append(['PMR-%d' % pmr, 'PMR title %d' % pmr, 'The product shall support %d.' % pmr] + pfs + \
+                        ['Y', '', 'Y', '', 'Comment %d' % pmr])
+        else:
+            rows.append(['', '', ''] + pfs + ['', 'Y', 'Y', rnd.choice(['Y', '']), ''])
+    write_workbook(file_name, [('Requirement Specification', rows)])
+
+
+def gen_kreatv_workbook(file_name, size, rnd):
+    ''' A KreaTV requirement workbook with size PFS items (and size / 2 PMR items) in groups of 50 items, each PFS
+        item is traced to one or two PMR items.
+    '''
+    pmr_count = max(size / 2, 1)
+    pmr_rows = []
+    for j in range(pmr_count):
+        if j % 50 == 0:
+            pmr_rows.append(['', 'PMR Group %d' % (j / 50), ''])
+        pmr_rows.append(['PMR-%d' % (j + 1), 'PMR title %d' % (j + 1), 'The product shall support %d.' % (j + 1)])
+    req_rows = [['ID', 'Title', 'Type', 'Verification Team', 'Description']]
+    pfs_rows = [['ID', 'Traced', 'PMR']]
+    for j in range(size):
+        if j % 50 == 0:
+            req_rows.append(['PFS Group %d' % (j / 50), '', '', '', ''])
+        req_rows.append(['PFS-%d' % (j + 1), 'PFS title %d' % (j + 1), 'Functional', rnd.choice(['SIT', 'SIT,DEV']),
+                         'The function %d shall be supported.' % (j + 1)])
+        pmr_ids = ['PMR-%d' % (rnd.randint(0, pmr_count - 1) + 1) for k in range(rnd.randint(1, 2))]
+        pfs_rows.append(['PFS-%d' % (j + 1), 'Y', '\n'.join(pmr_ids)])
+    write_workbook(file_name, [('PMR', pmr_rows), ('Requirements', req_rows), ('PFS', pfs_rows)])
+
+
+def gen_tc_workbook(file_name, size, rnd):
+    ''' A test case workbook with size test cases of two steps, in 4 sheets (or more to keep the sheets within the
+        rows of a xls file) and test suites of 50 test cases.
+    '''
+    sheet_count = max(4, (size * 2 + 2) / (XLS_MAX_ROWS - 2) + 1)
+    sheets = []
+    for sheet in range(sheet_count):
+        rows = [['Test cases of sheet %d' % sheet], TC_SHEET_COLUMNS]
+        for j in range(sheet, size, sheet_count):
+            row = dict((name, '') for name in TC_SHEET_COLUMNS)
+            if len(rows) % 100 == 2:
+                row['TS_Name'] = 'Suite %d' % (j / 100)
+                row['TS_Details'] = 'Test suite %d' % (j / 100)
+            row.update({'Name': _item_text(j), 'Summary': 'Summary of test case %d' % j,
+                        'Preconditions': 'The box is booted.', 'Test Execution Type': rnd.choice(['Manual', 'Automated']),
+                        'Importance': rnd.choice(['H', 'M', 'L']), 'HGI Regression Level': rnd.randint(1, 5),
+                        'HGI Test Team': 'SIT', 'Steps': 'Do step 1.\nCheck it.', 'Expected Results': 'Step 1 is done.',
+                        'Step Execution Type': 'Manual'})
+            rows.append([row[name] for name in TC_SHEET_COLUMNS])
+            step = dict((name, '') for name in TC_SHEET_COLUMNS)
+            step.update({'Steps': 'Do step 2.', 'Expected Results': 'Step 2 is done.', 'Step Execution Type': 'Manual'})
+            rows.append([step[name] for name in TC_SHEET_COLUMNS])
+        sheets.append(('Sheet%d' % sheet, rows))
+    write_workbook(file_name, sheets)
+
+
+# Fixture -> (file name, extension, generator). The extension of the spreadsheets depends on the number of rows
+FIXTURES = OrderedDict([
+    ('tds', ('tds', lambda size: '.mm', gen_tds_map)),
+    ('tc', ('tc', lambda size: '.xml', gen_tc_xml)),
+    ('tp', ('tp', lambda size: '.mm', gen_test_plan)),
+    ('based_tp', ('based_tp', lambda size: '.mm', gen_based_test_plan)),
+    ('req_hgi', ('req_hgi', lambda size: _spreadsheet_ext(size + size / 100 + 2), gen_hgi_workbook)),
+    ('req_kreatv', ('req_kreatv', lambda size: _spreadsheet_ext(size + size / 50 + 2), gen_kreatv_workbook)),
+    ('tc_sheets', ('tc_sheets', lambda size: '.xls', gen_tc_workbook)),
+])
+
+
+def get_fixtures(fixture_dir, size, names, seed):
+    ''' Generate the fixtures (if they are not generated with the same version and seed yet) and return
+        fixture -> file path. Each fixture has its own random generator, thus it doesn't depend on the other ones.
+    '''
+    if not os.path.exists(fixture_dir):
+        os.makedirs(fixture_dir)
+    stamp_file = os.path.join(fixture_dir, 'fixtures.json')
+    stamp = {'version': FIXTURE_VERSION, 'size': size, 'seed': seed, 'files': {}}
+    if os.path.exists(stamp_file):
+        f = open(stamp_file, 'r')
+        old_stamp = json.load(f)
+        f.close()
+        if (old_stamp['version'], old_stamp['size'], old_stamp['seed']) == (FIXTURE_VERSION, size, seed):
+            stamp = old_stamp
+    res = {}
+    for name in names:
+        file_name = stamp['files'].get(name)
+        if file_name is None or not os.path.exists(os.path.join(fixture_dir, file_name)):
+            base_name, get_ext, generator = FIXTURES[name]
+            file_name = base_name + get_ext(size)
+            start_time = time.time()
+            generator(os.path.join(fixture_dir, file_name), size, random.Random('%s-%s-%d' % (seed, name, size)))
+            logging.info("Generated %s (%d) in %.1f seconds." % (file_name, size, time.time() - start_time))
+            stamp['files'][name] = file_name
+            f = open(stamp_file, 'w')
+            json.dump(stamp, f, indent=1)
+            f.close()
+        res[name] = os.path.join(fixture_dir, file_name)
+    return res
+
+
+def write_config(run_dir, case, fixtures):
+    ''' Copy the fixtures of the case into run_dir (the actions may update their inputs) and write the configuration
+        file of the case into it.
+    '''
+    for name in case['fixtures']:
+        shutil.copy(fixtures[name], run_dir)
+    files = OrderedDict(DEFAULT_FILES)
+    files.update(case['files'])
+    file_lines = []
+    for tag, file_name in files.items():
+        if fixtures.has_key(file_name):
+            file_name = os.path.basename(fixtures[file_name])
+        elif FIXTURES.has_key(file_name):
+            file_name = FIXTURES[file_name][0] + FIXTURES[file_name][1](0)
+        file_lines.append('\t\t<%s>%s</%s>' % (tag, escape(file_name), tag))
+    action = ' '.join('%s = %s' % (key, quoteattr(value)) for key, value in
+                      [('ENABLE', '1')] + case['action'].items())
+    cfg_file = os.path.join(run_dir, 'config.xml')
+    f = open(cfg_file, 'w')
+    f.write(CONFIG_TEMPLATE % {'action': action, 'testlink_url': TESTLINK_URL, 'repo_prefix': REPO_PREFIX,
+                               'pfs_prefix': PFS_PREFIX, 'pmr_prefix': PMR_PREFIX, 'tds_prefix': TDS_PREFIX,
+                               'location': quoteattr(run_dir + os.sep), 'files': '\n'.join(file_lines)})
+    f.close()
+    return cfg_file
+
+
+def _peak_rss_kb():
+    ''' Peak RSS of this process or of its (worker) processes, None if it's not available '''
+    if resource is None:
+        return None
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if sys.platform == 'darwin':
+        # It's in bytes on Mac OS X
+        peak_rss /= 1024
+    return peak_rss
+
+
+def run_child(cfg_file):
+    ''' Perform the actions of the configuration file in this process and print the measurement as the last line '''
+    # Same as start_main of the tool
+    reload(sys)
+    sys.setdefaultencoding('utf-8')
+
+    # Same as the default log file of the tool (logging.conf), but without the console
+    logger = logging.getLogger('FreeMind')
+    logger.setLevel(logging.INFO)
+    handler = logging.FileHandler(os.path.join(os.path.dirname(cfg_file), 'benchmark.log'), 'w')
+    handler.setFormatter(logging.Formatter('%(levelname)s:%(message)s'))
+    logger.addHandler(handler)
+    logger.propagate = False
+    os.chdir(os.path.dirname(cfg_file))
+
+    start_time = time.time()
+    FreeMind(logger, cfg_file)
+    wall_time = time.time() - start_time
+    print json.dumps({'wall_time': wall_time, 'peak_rss_kb': _peak_rss_kb()})
+    return 0
+
+
+def get_checksums(run_dir):
+    ''' md5 of all files in the run directory (outputs and updated inputs) except the configuration and log files '''
+    checksums = OrderedDict()
+    for file_name in sorted(os.listdir(run_dir)):
+        if file_name in ['config.xml', 'benchmark.log']:
+            continue
+        f = open(os.path.join(run_dir, file_name), 'rb')
+        checksums[file_name] = hashlib.md5(f.read()).hexdigest()
+        f.close()
+    return checksums
+
+
+def run_case(work_dir, case_name, size, fixtures, repeat):
+    ''' Run the case repeat times, each time with new copies of the fixtures in a new process.
+        The shortest wall time and the largest peak RSS are kept.
+    '''
+    case = CASES[case_name]
+    run_dir = os.path.join(work_dir, 'runs', '%s-%d' % (case_name, size))
+    wall_times = []
+    peak_rss = None
+    checksums = None
+    for i in range(repeat):
+        shutil.rmtree(run_dir, True)
+        os.makedirs(run_dir)
+        cfg_file = write_config(run_dir, case, fixtures)
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', cfg_file],
+                                 stdout=subprocess.PIPE)
+        output = child.communicate()[0]
+        if child.returncode <> 0:
+            raise RuntimeError("Benchmark (%s, %d) failed, please check %s." % \
+                               (case_name, size, os.path.join(run_dir, 'benchmark.log')))
+        measurement = json.loads(output.strip().splitlines()[-1])
+        wall_times.append(measurement['wall_time'])
+        if measurement['peak_rss_kb'] is not None:
+            peak_rss = max(peak_rss, measurement['peak_rss_kb'])
+        run_checksums = get_checksums(run_dir)
+        if checksums is not None and run_checksums <> checksums:
+            logging.warning("Outputs of benchmark (%s, %d) are changed between the runs." % (case_name, size))
+        checksums = run_checksums
+    return OrderedDict([('case', case_name), ('size', size), ('wall_time', min(wall_times)),
+                        ('wall_times', wall_times), ('peak_rss_kb', peak_rss), ('checksums', checksums)])
+
+
+def _get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PKG_PATH,
+                                       stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline):
+    ''' Log the results side by side with the baseline results (of the same case and size) '''
+    baseline_index = dict(((item['case'], item['size']), item) for item in baseline['results'])
+    logging.info("Compared with %s (commit %s, seed %s):" % \
+                 (baseline.get('created'), baseline.get('commit'), baseline.get('seed')))
+    logging.info("%-28s %8s %9s %9s %7s %9s %9s  %s" % \
+                 ('case', 'size', 'time(s)', 'base(s)', 'ratio', 'rss(MB)', 'base(MB)', 'outputs'))
+    changed = 0
+    for item in results:
+        base = baseline_index.get((item['case'], item['size']))
+        if base is None:
+            logging.info("%-28s %8d %9.2f %9s" % (item['case'], item['size'], item['wall_time'], '-'))
+            continue
+        outputs = 'same'
+        if base['checksums'] <> item['checksums']:
+            outputs = 'CHANGED: ' + ', '.join(sorted(name for name in set(base['checksums']) | set(item['checksums'])
+                                                     if base['checksums'].get(name) <> item['checksums'].get(name)))
+            changed += 1
+        logging.info("%-28s %8d %9.2f %9.2f %6.2fx %9s %9s  %s" % \
+                     (item['case'], item['size'], item['wall_time'], base['wall_time'],
+                      item['wall_time'] / max(base['wall_time'], 1e-6), _format_rss(item['peak_rss_kb']),
+                      _format_rss(base['peak_rss_kb']), outputs))
+    return changed
+
+
+def _format_rss(peak_rss_kb):
+    if peak_rss_kb is None:
+        return '-'
+    return '%.1f' % (peak_rss_kb / 1024.0)
+
+
+def parse_size(text):
+    ''' 1000, 10k or 1m '''
+    text = text.strip().lower()
+    factor = 1
+    if text.endswith('k'):
+        factor = 1000
+        text = text[:-1]
+    elif text.endswith('m'):
+        factor = 1000000
+        text = text[:-1]
+    return int(float(text) * factor)
+
+
+def args_parser(arguments=None):
+    parser = argparse.ArgumentParser(description= \
+                                         'Benchmark the FreeMind-TestLink actions with synthetic TDS maps, test plans, \
+        TestLink exports and requirement/test case workbooks of the given sizes. Each action is performed in its own \
+        process and the wall time, peak RSS and output checksums are recorded.')
+    parser.add_argument('-s', '--sizes', nargs='+', type=parse_size, default=[1000, 10000],
+                        help="Number of TDS items, test cases or requirement rows, e.g. -s 1k 10k 100k.")
+    parser.add_argument('-a', '--actions', nargs='+', choices=CASES.keys(), default=CASES.keys(),
+                        help="Actions to benchmark (all by default).")
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+                        help="Run each action several times and keep the shortest wall time.")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="Number of worker processes of the actions which support them (0 means one per CPU).")
+    parser.add_argument('-d', '--work_dir', default='./benchmark',
+                        help="Folder of the generated inputs (reused by the following runs) and of the outputs.")
+    parser.add_argument('-o', '--output', default=None,
+                        help="Write the results into this json file (<work_dir>/results.json by default).")
+    parser.add_argument('-c', '--compare', default=None,
+                        help="Compare the results with the results json file of a previous run.")
+    parser.add_argument('--seed', default='FreeMind',
+                        help="Seed of the synthetic inputs, the results are only comparable with the same seed.")
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(arguments)
+
+
+def main():
+    args = args_parser()
+    if args.child is not None:
+        return run_child(args.child)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(message)s')
+
+    for case in CASES.values():
+        if case['action'].has_key('WORKERS'):
+            case['action']['WORKERS'] = str(args.workers)
+    work_dir = os.path.abspath(args.work_dir)
+    results = []
+    for size in args.sizes:
+        for case_name in args.actions:
+            fixtures = get_fixtures(os.path.join(work_dir, 'fixtures', str(size)), size, CASES[case_name]['fixtures'],
+                                    args.seed)
+            item = run_case(work_dir, case_name, size, fixtures, args.repeat)
+            logging.info("%s (%d): %.2f seconds, %s MB peak RSS." % \
+                         (case_name, size, item['wall_time'], _format_rss(item['peak_rss_kb'])))
+            results.append(item)
+
+    output = OrderedDict([('created', time.strftime('%Y-%m-%d %H:%M:%S')), ('commit', _get_commit()),
+                          ('fixture_version', FIXTURE_VERSION), ('seed', args.seed), ('workers', args.workers),
+                          ('python', platform.python_version()), ('platform', platform.platform()),
+                          ('results', results)])
+    output_file = args.output or os.path.join(work_dir, 'results.json')
+    f = open(output_file, 'w')
+    json.dump(output, f, indent=1)
+    f.close()
+    logging.info("Results are written into %s." % output_file)
+
+    if args.compare is not None:
+        f = open(args.compare, 'r')
+        baseline = json.load(f, object_pairs_hook=OrderedDict)
+        f.close()
+        if (baseline.get('fixture_version'), baseline.get('seed')) <> (FIXTURE_VERSION, args.seed):
+            logging.warning("The inputs of %s are generated differently, the checksums are not comparable." % \
+                            args.compare)
+        compare_results(results, baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
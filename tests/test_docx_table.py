@@ -0,0 +1,75 @@
+''' Grid of the docx tables read by DocxTable '''
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from FreeMind import _parse_docx_table
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+
+def tc(text, props=''):
+    return '<w:tc><w:tcPr>%s</w:tcPr><w:p><w:r><w:t>%s</w:t></w:r></w:p></w:tc>' % (props, text)
+
+
+def tr(cells, props=''):
+    return '<w:tr><w:trPr>%s</w:trPr>%s</w:tr>' % (props, ''.join(cells))
+
+
+def tbl(rows, ncols=None):
+    grid = ''
+    if ncols is not None:
+        grid = '<w:tblGrid>%s</w:tblGrid>' % ('<w:gridCol/>' * ncols)
+    return '<w:tbl xmlns:w="%s">%s%s</w:tbl>' % (W_NS, grid, ''.join(rows))
+
+
+def texts(table):
+    return [[table.cell(i, j)[0] for j in range(table.ncols)] for i in range(table.nrows)]
+
+
+class DocxTableTest(unittest.TestCase):
+
+    def test_merged_cells(self):
+        table = _parse_docx_table(tbl([
+            tr([tc('a', '<w:gridSpan w:val="2"/>'), tc('b', '<w:vMerge w:val="restart"/>')]),
+            tr([tc('c'), tc('d'), tc('', '<w:vMerge/>')]),
+            tr([tc('e', '<w:gridSpan w:val="2"/>'), tc('', '<w:vMerge w:val="continue"/>')]),
+        ], 3))
+        self.assertEqual((table.nrows, table.ncols), (3, 3))
+        self.assertEqual(texts(table), [['a', 'a', 'b'], ['c', 'd', 'b'], ['e', 'e', 'b']])
+        self.assertTrue(table.cell(0, 2) is table.cell(2, 2))
+
+    def test_grid_before_and_after(self):
+        table = _parse_docx_table(tbl([
+            tr([tc('a'), tc('b'), tc('c')]),
+            tr([tc('d'), tc('e')], '<w:gridBefore w:val="1"/>'),
+            tr([tc('f')], '<w:gridAfter w:val="2"/>'),
+            tr([tc('', '<w:vMerge/>'), tc('g')], '<w:gridBefore w:val="1"/>'),
+        ], 3))
+        self.assertEqual(texts(table), [['a', 'b', 'c'], ['', 'd', 'e'], ['f', '', ''], ['', '', 'g']])
+
+    def test_vertical_merge_after_grid_before(self):
+        table = _parse_docx_table(tbl([
+            tr([tc('a'), tc('b', '<w:vMerge w:val="restart"/>'), tc('c')]),
+            tr([tc('', '<w:vMerge/>'), tc('d')], '<w:gridBefore w:val="1"/>'),
+        ], 3))
+        self.assertEqual(texts(table), [['a', 'b', 'c'], ['', 'b', 'd']])
+
+    def test_short_rows_without_grid(self):
+        table = _parse_docx_table(tbl([
+            tr([tc('a')]),
+            tr([tc('b'), tc('c', '<w:gridSpan w:val="2"/>')]),
+            tr([tc('d'), tc('e')]),
+        ]))
+        self.assertEqual((table.nrows, table.ncols), (3, 3))
+        self.assertEqual(texts(table), [['a', '', ''], ['b', 'c', 'c'], ['d', 'e', '']])
+
+    def test_empty_table(self):
+        table = _parse_docx_table(tbl([]))
+        self.assertEqual((table.nrows, table.ncols), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+''' Validation and error report of the test case sheets (extract_tc_from_xls) '''
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from xlrd import open_workbook
+from xlwt import Workbook as XlsWriteWorkbook
+from FreeMind import FreeMind, TC_SHEET_COLUMNS, load_workbook
+try:
+    from openpyxl import Workbook as XlsxWriteWorkbook
+except ImportError:
+    XlsxWriteWorkbook = None
+
+
+def tc_sheet_rows(columns):
+    rows = [['Test cases'], list(columns)]
+    values = {'TS_Name': u'Suite', 'TS_Details': u'Details', 'Name': u'Test case', 'Summary': u'Summary',
+              'Preconditions': u'', 'Test Execution Type': u'Manual', 'Importance': u'H',
+              'HGI Regression Level': 3.0, 'HGI Test Team': u'SIT', 'Steps': u'Step', 'Expected Results': u'Result',
+              'Step Execution Type': u'Manual'}
+    rows.append([values[name] for name in columns])
+    return rows
+
+
+class TcErrorReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.freemind = FreeMind(logging.getLogger(__name__))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_xls(self, rows):
+        file_name = os.path.join(self.tmp_dir, 'tc.xls')
+        wb = XlsWriteWorkbook()
+        sheet = wb.add_sheet('Sheet1')
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                sheet.write(i, j, value)
+        wb.save(file_name)
+        return file_name
+
+    def write_xlsx(self, rows):
+        file_name = os.path.join(self.tmp_dir, 'tc.xlsx')
+        wb = XlsxWriteWorkbook()
+        sheet = wb.active
+        sheet.title = 'Sheet1'
+        for row in rows:
+            sheet.append(row)
+        wb.save(file_name)
+        return file_name
+
+    def missing_column_rows(self):
+        return tc_sheet_rows([name for name in TC_SHEET_COLUMNS if name != 'Importance'])
+
+    def test_missing_column_xls(self):
+        file_name = self.write_xls(self.missing_column_rows())
+        res = self.freemind.extract_tc_from_xls(file_name, '', '', 1, '0', '1')
+        self.assertEqual(res, -1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'tc_Sheet1.xml')))
+        sheet = open_workbook(os.path.join(self.tmp_dir, 'tc[Errors].xls')).sheet_by_name('Sheet1')
+        ncols = len(TC_SHEET_COLUMNS) - 1
+        self.assertEqual(sheet.row_values(1)[:ncols], TC_SHEET_COLUMNS[:6] + TC_SHEET_COLUMNS[7:])
+        header = sheet.cell_value(1, ncols).split('\n')
+        self.assertEqual(header[0], 'Validation Errors')
+        self.assertTrue(header[1].startswith('Missing column (Importance)'))
+        self.assertEqual(sheet.row_values(2)[0], u'Suite')
+
+    @unittest.skipIf(load_workbook is None, 'openpyxl is not installed')
+    def test_missing_column_xlsx(self):
+        file_name = self.write_xlsx(self.missing_column_rows())
+        res = self.freemind.extract_tc_from_xls(file_name, '', '', 1, '0', '1')
+        self.assertEqual(res, -1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'tc[Errors].xls')))
+        sheet = load_workbook(os.path.join(self.tmp_dir, 'tc[Errors].xlsx'))['Sheet1']
+        ncols = len(TC_SHEET_COLUMNS) - 1
+        header = sheet.cell(row=2, column=ncols + 1)
+        self.assertEqual(header.value.split('\n')[0], 'Validation Errors')
+        self.assertTrue(header.value.split('\n')[1].startswith('Missing column (Importance)'))
+        self.assertEqual(header.fill.fgColor.rgb, '00FF0000')
+
+    def test_wrong_cell_xls(self):
+        rows = tc_sheet_rows(TC_SHEET_COLUMNS)
+        rows[2][TC_SHEET_COLUMNS.index('Importance')] = u'X'
+        file_name = self.write_xls(rows)
+        res = self.freemind.extract_tc_from_xls(file_name, '', '', 1, '0', '1')
+        self.assertEqual(res, -1)
+        sheet = open_workbook(os.path.join(self.tmp_dir, 'tc[Errors].xls')).sheet_by_name('Sheet1')
+        ncols = len(TC_SHEET_COLUMNS)
+        self.assertEqual(sheet.cell_value(1, ncols), 'Validation Errors')
+        self.assertTrue(sheet.cell_value(2, ncols).startswith('Wrong importance type (X)'))
+
+    def test_valid_sheet_xls(self):
+        file_name = self.write_xls(tc_sheet_rows(TC_SHEET_COLUMNS))
+        res = self.freemind.extract_tc_from_xls(file_name, '', '', 1, '0', '1')
+        self.assertEqual(res, 0)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, 'tc_Sheet1.xml')))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'tc[Errors].xls')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+''' Incremental TDS xml files ([Delta].xml) generated by FreeMind.gen_tds '''
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from FreeMind import FreeMind
+
+
+class TdsDeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.tds_file = os.path.join(self.dir, 'TDS.mm')
+        self.delta_file = os.path.join(self.dir, 'TDS[Delta].xml')
+        self.fm = FreeMind(logging.getLogger(__name__))
+        self.fm.testlink_url = 'http://localhost/testlink/'
+        self.fm.repo_prefix = 'TC'
+        self.fm.tds_prefix = 'TDS-'
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_gen_tds(self, items):
+        ''' items is a list of (node ID, text) of the TDS items in one sub-feature. '''
+        f = open(self.tds_file, 'w')
+        f.write('<map version="1.0.1">\n<node ID="ID_1" TEXT="TDS">\n<node ID="ID_2" TEXT="Feature">\n'
+                '<node ID="ID_3" TEXT="Sub-feature">\n')
+        for node_id, text in items:
+            f.write('<node ID=%s TEXT=%s/>\n' % (quoteattr(node_id), quoteattr(text)))
+        f.write('</node>\n</node>\n</node>\n</map>\n')
+        f.close()
+        self.assertEqual(self.fm.gen_tds(self.tds_file, '0', '1'), 0)
+
+    def delta(self):
+        ''' docid -> status of the requirements in the delta file, None if there is no delta file. '''
+        if not os.path.exists(self.delta_file):
+            return None
+        return dict((req.findtext('docid'), req.findtext('status'))
+                    for req in ET.parse(self.delta_file).getroot().iter('requirement'))
+
+    def import_delta(self):
+        os.remove(self.delta_file)
+
+    def test_add_change_remove(self):
+        self.run_gen_tds([('ID_10', 'Item A'), ('ID_11', 'Item B')])
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'TDS.xml')))
+        self.assertEqual(self.delta(), None)
+
+        self.run_gen_tds([('ID_10', 'Item A'), ('ID_11', 'Item B'), ('ID_12', 'Item C')])
+        self.assertEqual(self.delta(), {'TDS-ID_12': 'V'})
+
+        # The delta file is not imported yet, thus the added item is kept in the next one
+        self.run_gen_tds([('ID_10', 'Item A changed'), ('ID_11', 'Item B'), ('ID_12', 'Item C')])
+        self.assertEqual(self.delta(), {'TDS-ID_10': 'V', 'TDS-ID_12': 'V'})
+
+        self.import_delta()
+        self.run_gen_tds([('ID_10', 'Item A changed'), ('ID_11', 'Item B')])
+        self.assertEqual(self.delta(), {'TDS-ID_12': 'O'})
+
+        self.import_delta()
+        self.run_gen_tds([('ID_10', 'Item A changed'), ('ID_11', 'Item B')])
+        self.assertEqual(self.delta(), None)
+
+    def test_no_change_removes_delta(self):
+        self.run_gen_tds([('ID_10', 'Item A')])
+        self.run_gen_tds([('ID_10', 'Item A changed')])
+        self.assertEqual(self.delta(), {'TDS-ID_10': 'V'})
+
+        # The change is reverted before the delta file is imported
+        self.run_gen_tds([('ID_10', 'Item A')])
+        self.assertEqual(self.delta(), None)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'TDS[Delta].manifest.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+''' Concurrent bulk requests of TestLinkSync against a local XML-RPC server with artificial latency '''
+import logging
+import os
+import SocketServer
+import sys
+import threading
+import time
+import unittest
+import xmlrpclib
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from FreeMind import TestLinkSync
+
+LATENCY = 0.02
+RPC_PATH = '/lib/api/xmlrpc/v1/xmlrpc.php'
+
+
+class TestLinkRequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = (RPC_PATH,)
+
+
+class ThreadingXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+    # All connections of the workers are accepted at once
+    request_queue_size = 32
+
+
+class InFlight(object):
+    ''' The number of requests handled by the server at the same time, and the peak of it '''
+    lock = threading.Lock()
+    count = 0
+    peak = 0
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.count = 0
+            cls.peak = 0
+
+    @classmethod
+    def enter(cls):
+        with cls.lock:
+            cls.count += 1
+            cls.peak = max(cls.peak, cls.count)
+
+    @classmethod
+    def exit(cls):
+        with cls.lock:
+            cls.count -= 1
+
+
+def get_test_case(params):
+    InFlight.enter()
+    try:
+        time.sleep(LATENCY)
+    finally:
+        InFlight.exit()
+    if params['devKey'] != 'key':
+        raise xmlrpclib.Fault(2000, 'Can not authenticate client: invalid developer key')
+    if params['testcaseexternalid'].endswith('-13'):
+        return [{'code': 5040, 'message': 'Test case %s does not exist' % params['testcaseexternalid']}]
+    return [{'full_tc_external_id': params['testcaseexternalid'], 'name': 'Test case ' + params['testcaseexternalid']}]
+
+
+def normalize(results):
+    return [(result.faultCode, result.faultString) if isinstance(result, xmlrpclib.Fault) else result
+            for result in results]
+
+
+class TestLinkSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingXMLRPCServer(('127.0.0.1', 0), TestLinkRequestHandler, logRequests=False,
+                                            allow_none=True)
+        self.server.register_function(get_test_case, 'tl.getTestCase')
+        self.server.register_multicall_functions()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.rpc_url = 'http://127.0.0.1:%d%s' % (self.server.server_address[1], RPC_PATH)
+        self.params_list = [{'testcaseexternalid': 'HDVB-%d' % i} for i in range(64)]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def map(self, workers, dev_key='key'):
+        ''' Return the results and the peak number of the requests in flight '''
+        tls = TestLinkSync(self.rpc_url, dev_key, logging.getLogger(__name__), workers, batch_size=4, retries=0)
+        InFlight.reset()
+        results = tls.map('getTestCase', self.params_list)
+        return normalize(results), InFlight.peak
+
+    def test_concurrent_map(self):
+        serial_results, serial_peak = self.map(1)
+        concurrent_results, concurrent_peak = self.map(8)
+        self.assertEqual(len(serial_results), len(self.params_list))
+        self.assertEqual(serial_results[1][0]['full_tc_external_id'], 'HDVB-1')
+        self.assertEqual(serial_results[13][0]['code'], 5040)
+        self.assertEqual(concurrent_results, serial_results)
+        # 16 batches of 4 calls, the serial run sends them one by one
+        self.assertEqual(serial_peak, 1)
+        self.assertGreater(concurrent_peak, 1)
+
+    def test_concurrent_map_faults(self):
+        serial_results = self.map(1, 'wrong key')[0]
+        concurrent_results = self.map(8, 'wrong key')[0]
+        self.assertEqual(serial_results[0], (2000, 'Can not authenticate client: invalid developer key'))
+        self.assertEqual(concurrent_results, serial_results)
+
+    def test_call(self):
+        tls = TestLinkSync(self.rpc_url, 'key', logging.getLogger(__name__), 8, retries=0)
+        self.assertEqual(tls.call('getTestCase', testcaseexternalid='HDVB-2'),
+                         [{'full_tc_external_id': 'HDVB-2', 'name': 'Test case HDVB-2'}])
+
+
+if __name__ == '__main__':
+    unittest.main()